@@ -0,0 +1,322 @@
+"""
+Resumable, shardable batch runs of a pipeline over the dataset.
+
+A SQLite manifest holds one row per puzzle with its status (pending, running, done or
+failed), attempts, worker, timings, error and the location of its result. Results are
+appended as JSON lines to one output file per worker; the manifest stores their byte
+offset and length, so a result is read back with a single seek and nothing is inferred
+from directory listings or file names.
+
+Workers claim the next pending puzzle in a transaction, so several processes can share
+one manifest. A claim expires after a lease, so puzzles held by a crashed worker are
+picked up again on the next run. Failed puzzles stay failed until --retry-failed resets
+them (up to --max-attempts).
+
+Usage:
+    python -m src.batch_runner runs/sr.sqlite --pipeline self_refinement --backend live:.llm_cache.sqlite
+    python -m src.batch_runner runs/sr.sqlite --processes 4
+    python -m src.batch_runner runs/sr.sqlite --shard 1/2          # static split, e.g. across machines
+    python -m src.batch_runner runs/sr.sqlite --retry-failed
+    python -m src.batch_runner runs/sr.sqlite --status
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+STATUSES = ("pending", "running", "done", "failed")
+
+
+class Manifest:
+    """
+    SQLite index of a batch run.
+
+    Attributes:
+        path: Location of the SQLite database.
+        lease_s: Seconds after which a running claim is considered abandoned.
+    """
+
+    def __init__(self, path: str, lease_s: float = 1800.0) -> None:
+        self.path = path
+        self.lease_s = lease_s
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit mode; claims open their own IMMEDIATE transaction.
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS items (
+                   puzzle_id TEXT PRIMARY KEY,
+                   position INTEGER NOT NULL,
+                   status TEXT NOT NULL DEFAULT 'pending',
+                   attempts INTEGER NOT NULL DEFAULT 0,
+                   worker TEXT,
+                   claimed_at REAL,
+                   finished_at REAL,
+                   wall_s REAL,
+                   error TEXT,
+                   output_path TEXT,
+                   output_offset INTEGER,
+                   output_length INTEGER
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, position)")
+
+    def check_meta(self, **settings: str) -> None:
+        """
+        Record the run settings on first use and refuse to continue the run with different ones.
+
+        Raises:
+            ValueError: if a setting differs from the recorded value
+        """
+        for key, value in settings.items():
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            recorded = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+            if recorded != value:
+                raise ValueError(f"Manifest {self.path} was created with {key}={recorded!r}, not {value!r}")
+
+    def meta(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+
+    def run_id(self) -> str:
+        """Id shared by every worker of the run, assigned by whichever worker starts first."""
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('run_id', ?)", (uuid.uuid4().hex[:12],))
+        return self._conn.execute("SELECT value FROM meta WHERE key = 'run_id'").fetchone()[0]
+
+    def add(self, puzzle_ids: Iterable[Any]) -> int:
+        """Register puzzles (new ones become pending, known ones are left alone); returns how many were new."""
+        before = self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR IGNORE INTO items (puzzle_id, position) VALUES (?, ?)",
+                                   ((str(pid), position) for position, pid in enumerate(puzzle_ids)))
+        return self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] - before
+
+    def claim(self, worker: str, shard: Tuple[int, int] = (0, 1)) -> Optional[str]:
+        """
+        Atomically take the next pending (or abandoned running) puzzle of a shard.
+
+        Returns:
+            str: puzzle id, or None when the shard has nothing left to do
+        """
+        index, count = shard
+        now = time.time()
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                """SELECT puzzle_id FROM items
+                   WHERE (status = 'pending' OR (status = 'running' AND claimed_at < ?)) AND position % ? = ?
+                   ORDER BY position LIMIT 1""",
+                (now - self.lease_s, count, index),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                """UPDATE items SET status = 'running', worker = ?, claimed_at = ?, attempts = attempts + 1
+                   WHERE puzzle_id = ?""",
+                (worker, now, row[0]),
+            )
+        return row[0]
+
+    def complete(self, puzzle_id: str, worker: str, status: str, wall_s: float, error: Optional[str],
+                 output: Tuple[str, int, int]) -> bool:
+        """
+        Record the outcome of a claimed puzzle.
+
+        Returns:
+            bool: False if the claim was lost (it expired and another worker took the puzzle)
+        """
+        output_path, offset, length = output
+        cursor = self._conn.execute(
+            """UPDATE items SET status = ?, finished_at = ?, wall_s = ?, error = ?,
+                                output_path = ?, output_offset = ?, output_length = ?
+               WHERE puzzle_id = ? AND worker = ? AND status = 'running'""",
+            (status, time.time(), wall_s, error, output_path, offset, length, puzzle_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def retry_failed(self, max_attempts: Optional[int] = None) -> int:
+        """Make failed puzzles pending again (only those with fewer than max_attempts); returns how many."""
+        query = "UPDATE items SET status = 'pending', worker = NULL, claimed_at = NULL WHERE status = 'failed'"
+        params: tuple = ()
+        if max_attempts is not None:
+            query += " AND attempts < ?"
+            params = (max_attempts,)
+        return self._conn.execute(query, params).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(self._conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+        return counts
+
+    def items(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Manifest rows in dataset order, optionally only those with a given status."""
+        query = "SELECT * FROM items" + (" WHERE status = ?" if status else "") + " ORDER BY position"
+        cursor = self._conn.execute(query, (status,) if status else ())
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def read_result(self, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The result record a manifest row points to (None if it has none yet)."""
+        if item.get("output_path") is None:
+            return None
+        path = os.path.join(os.path.dirname(os.path.abspath(self.path)), item["output_path"])
+        with open(path, "rb") as f:
+            f.seek(item["output_offset"])
+            return json.loads(f.read(item["output_length"]))
+
+    def results(self, status: Optional[str] = "done") -> Iterator[Dict[str, Any]]:
+        for item in self.items(status):
+            result = self.read_result(item)
+            if result is not None:
+                yield result
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class _OutputLog:
+    """Append-only JSONL file of one worker; every write is flushed and fsynced before it is indexed."""
+
+    def __init__(self, manifest_path: str, worker: str) -> None:
+        directory = os.path.abspath(manifest_path) + ".outputs"
+        os.makedirs(directory, exist_ok=True)
+        self.relative_path = os.path.join(os.path.basename(directory), f"{worker}.jsonl")
+        self._file = open(os.path.join(directory, f"{worker}.jsonl"), "ab")
+
+    def append(self, record: Dict[str, Any]) -> Tuple[str, int, int]:
+        data = json.dumps(record).encode("utf-8")
+        offset = self._file.seek(0, os.SEEK_END)
+        self._file.write(data + b"\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self.relative_path, offset, len(data)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """"i/n" -> (i, n)."""
+    index, _, count = spec.partition("/")
+    index, count = int(index), int(count or 1)
+    if not 0 <= index < count:
+        raise ValueError(f"Shard {spec!r} must be i/n with 0 <= i < n")
+    return index, count
+
+
+def run_batch(manifest_path: str, pipeline: str, backend_spec: str, puzzles: Iterable[Dict[str, Any]],
+              shard: Tuple[int, int] = (0, 1), limit: Optional[int] = None, latency: float = 0.0,
+              lease_s: float = 1800.0, track_memory: bool = False, samples: Optional[int] = None) -> Dict[str, int]:
+    """
+    Work through the pending puzzles of a manifest until the shard is empty (or limit puzzles ran).
+
+    Args:
+        manifest_path (str): SQLite manifest, created on first use
+        pipeline (str): One of benchmark.PIPELINES
+        backend_spec (str): benchmark.make_backend spec
+        puzzles (Iterable): The dataset; puzzles not yet in the manifest are added as pending
+        shard (tuple): (index, count) static split of the dataset by position
+        limit (int): Stop after this many puzzles in this process
+        latency (float): Per-call latency of the stub backend
+        lease_s (float): Seconds after which another worker may take over a running puzzle
+        samples (int): Samples per puzzle for the self_consistency pipelines (default benchmark.SC_SAMPLES)
+
+    Returns:
+        dict: Puzzles this worker completed ("done") and failed ("failed")
+    """
+    from src.benchmark import make_backend, run_puzzle
+
+    manifest = Manifest(manifest_path, lease_s=lease_s)
+    manifest.check_meta(pipeline=pipeline)
+    by_id = {str(puzzle["id"]): puzzle for puzzle in puzzles}
+    manifest.add(by_id)
+
+    worker = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    backend = make_backend(backend_spec, latency=latency)
+    log = _OutputLog(manifest_path, worker)
+    run_id = manifest.run_id()
+    done = {"done": 0, "failed": 0}
+    try:
+        while limit is None or sum(done.values()) < limit:
+            puzzle_id = manifest.claim(worker, shard)
+            if puzzle_id is None:
+                break
+            puzzle = by_id.get(puzzle_id)
+            if puzzle is None:
+                manifest.complete(puzzle_id, worker, "failed", 0.0, "puzzle not in the dataset", (None, None, None))
+                done["failed"] += 1
+                continue
+            result = run_puzzle(pipeline, puzzle, backend, run_id, track_memory=track_memory, samples=samples)
+            status = "failed" if result["error"] else "done"
+            if manifest.complete(puzzle_id, worker, status, result["wall_s"], result["error"], log.append(result)):
+                done[status] += 1
+    finally:
+        log.close()
+        manifest.close()
+    return done
+
+
+def _worker(args: tuple) -> Dict[str, int]:
+    manifest_path, pipeline, backend_spec, data, shard, limit, latency, lease_s, samples = args
+    from src.benchmark import load_puzzles
+
+    return run_batch(manifest_path, pipeline, backend_spec, load_puzzles(data), shard=shard, limit=limit,
+                     latency=latency, lease_s=lease_s, samples=samples)
+
+
+def main(argv=None):
+    from src.benchmark import PIPELINES, SC_SAMPLES, summarize
+
+    parser = argparse.ArgumentParser(description="Resumable batch run of a pipeline over the GridPuzzle dataset")
+    parser.add_argument("manifest", help="SQLite manifest of the run (created on first use)")
+    parser.add_argument("--pipeline", choices=sorted(PIPELINES), default="self_refinement")
+    parser.add_argument("--backend", default="stub", help="stub | recorded:<cache.sqlite> | live[:<cache.sqlite>] | replay[:<spec>]")
+    parser.add_argument("--data", default="data/GridPuzzle_processed.csv", help="dataset CSV or compiled .gpz store")
+    parser.add_argument("--shard", default="0/1", help="i/n: only run puzzles whose position %% n == i")
+    parser.add_argument("--processes", type=int, default=1, help="local worker processes sharing the manifest")
+    parser.add_argument("--limit", type=int, default=None, help="puzzles per process")
+    parser.add_argument("--latency", type=float, default=0.0, help="per-call latency of the stub backend in seconds")
+    parser.add_argument("--samples", type=int, default=SC_SAMPLES, help="samples per puzzle for the self_consistency pipelines")
+    parser.add_argument("--lease", type=float, default=1800.0, help="seconds before a running claim is taken over")
+    parser.add_argument("--retry-failed", action="store_true", help="make failed puzzles pending again first")
+    parser.add_argument("--max-attempts", type=int, default=3, help="with --retry-failed, skip puzzles tried this often")
+    parser.add_argument("--status", action="store_true", help="print progress and a summary, run nothing")
+    args = parser.parse_args(argv)
+
+    manifest = Manifest(args.manifest)
+    try:
+        if not args.status:
+            manifest.check_meta(pipeline=args.pipeline)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.retry_failed:
+        print(f"{manifest.retry_failed(args.max_attempts)} failed puzzles reset to pending", file=sys.stderr)
+    manifest.close()
+
+    if not args.status:
+        task = (args.manifest, args.pipeline, args.backend, args.data, parse_shard(args.shard), args.limit,
+                args.latency, args.lease, args.samples)
+        if args.processes > 1:
+            with mp.get_context("spawn").Pool(args.processes) as pool:
+                outcomes = pool.map(_worker, [task] * args.processes)
+        else:
+            outcomes = [_worker(task)]
+        print(f"this run: {sum(o['done'] for o in outcomes)} done, {sum(o['failed'] for o in outcomes)} failed",
+              file=sys.stderr)
+
+    manifest = Manifest(args.manifest)
+    report = {"counts": manifest.counts(), "summary": summarize(list(manifest.results(status=None)))}
+    manifest.close()
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
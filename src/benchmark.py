@@ -0,0 +1,477 @@
+"""
+End-to-end benchmark harness for the puzzle-solving pipelines.
+
+Runs one pipeline (self_refinement, two_agent, z3_tool_calling, self_consistency or
+self_consistency_verified) over the GridPuzzle dataset against a chosen LLM backend and writes one JSON line per puzzle with the wall
+time, CPU time, peak Python memory and token counts of every stage, plus solved /
+cell-accuracy against the answer column.
+
+Backends:
+    stub             deterministic offline answers derived from the reference solution
+    recorded:<path>  responses replayed from a ResponseCache database written by earlier live runs
+    live[:<path>]    real Gemini calls, optionally recorded into a ResponseCache at <path>
+    replay[:<spec>]  offline replay server (llm_engine.replay): recorded responses where available,
+                     synthetic ones otherwise, with injected latency, rate limits and errors, e.g.
+                     replay:runs/live.sqlite?latency=lognormal:0.8:0.5&error_rate=0.02&rps=5
+
+Usage:
+    python -m src.benchmark --pipeline z3_tool_calling --backend stub --limit 50 --out runs/z3.jsonl
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from src import tracing
+from src.llm_engine.memory import estimate_tokens
+from src.scoring import score_prediction
+
+SELF_REFINEMENT_PROMPT = """Now that you've proposed a solution, critically review your work. Verify that you've properly interpreted all clues
+        and reached a valid conclusion. If you identify any errors or inconsistencies in your reasoning, please reconsider the puzzle and provide
+        a corrected solution."""
+
+CSP_SYSTEM_PROMPT = """You are an expert AI assistant for analyzing logic grid puzzles. Your task is to systematically translate puzzle clues into logical expressions.
+Analyze each clue and categories input to frame a sequence of logical expressions.
+
+Remember to carefully comprehend each clue step by step and translate them to logical expressions
+Retun ONLY a thoughtful sequence of logical expressions."""
+
+MAPPING_SYSTEM_PROMPT = """You are an expert AI assistant for analyzing logical constraints. Analyze the constraints given below and
+map the categories accordingly."""
+
+Z3_PLANNER_SYSTEM_PROMPT = """You are an expert AI assistant for solving logic puzzles using the z-solver library.
+Translate every clue into calls of the tools below and return a JSON list of
+{"function_name": ..., "parameters": "arg1|arg2|..."} objects. Use "$k" as a parameter to refer to the
+constraint returned by call number k (0-based) when combining constraints with add_or/add_and.
+The variables, their domains and the all-different constraints already exist.
+The tool descriptions are given below:
+"""
+
+# Default samples launched per puzzle by the self_consistency pipelines (run_puzzle samples=, --samples).
+SC_SAMPLES = 5
+
+
+class StageRecorder:
+    """
+    Collects per-stage measurements for one puzzle.
+
+    Use `with recorder.stage("solve"):` around each stage and `recorder.add_tokens(...)` inside it.
+    """
+
+    def __init__(self, track_memory: bool = True) -> None:
+        self.track_memory = track_memory
+        self.stages: List[Dict[str, Any]] = []
+        self._current: Optional[Dict[str, Any]] = None
+
+    @contextmanager
+    def stage(self, name: str):
+        record = {"stage": name, "prompt_tokens": 0, "output_tokens": 0, "llm_calls": 0, "error": None}
+        self._current = record
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            mem_start = tracemalloc.get_traced_memory()[0]
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            with tracing.span("stage." + name):
+                yield record
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["wall_s"] = time.perf_counter() - wall_start
+            record["cpu_s"] = time.process_time() - cpu_start
+            if self.track_memory:
+                record["peak_mem_bytes"] = max(0, tracemalloc.get_traced_memory()[1] - mem_start)
+            self.stages.append(record)
+            self._current = None
+
+    def add_tokens(self, prompt_tokens: int, output_tokens: int) -> None:
+        if self._current is not None:
+            self._current["prompt_tokens"] += prompt_tokens
+            self._current["output_tokens"] += output_tokens
+            self._current["llm_calls"] += 1
+
+
+class _MeteredAgent:
+    """Wraps an agent so every call reports its token usage to the active stage."""
+
+    def __init__(self, agent, recorder: StageRecorder) -> None:
+        self.agent = agent
+        self.recorder = recorder
+
+    def perform_action(self, user_query: str) -> str:
+        response = self.agent.perform_action(user_query)
+        _add_usage(self.recorder, self.agent, user_query, response)
+        return response
+
+
+def _add_usage(recorder: StageRecorder, agent, user_query: str, response: str) -> None:
+    usage = getattr(agent, "last_usage", None)
+    if usage:
+        recorder.add_tokens(usage["prompt_tokens"], usage["output_tokens"])
+    else:
+        prompt = (getattr(agent, "system_prompt", None) or "") + user_query
+        recorder.add_tokens(estimate_tokens(prompt), estimate_tokens(response))
+
+
+# ----------------------------------------------------------------------------
+# Backends
+# ----------------------------------------------------------------------------
+
+class _StubAgent:
+    """Answers from the reference solution so pipelines can be timed without any endpoint."""
+
+    def __init__(self, agent_name: str, puzzle: Dict[str, Any], latency: float = 0.0, system_prompt: str = None) -> None:
+        self.agent_name = agent_name
+        self.puzzle = puzzle
+        self.latency = latency
+        self.system_prompt = system_prompt
+        self.last_usage = None
+
+    def perform_action(self, user_query: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.agent_name == "z3_planner":
+            return json.dumps(oracle_plan(self.puzzle))
+        if self.agent_name == "csp_agent":
+            return "\n".join(self.puzzle["clues"])
+        return "Step-by-step solution:\n(stub)\nFinal Answer:\n" + self.puzzle["answer"]
+
+
+def oracle_plan(puzzle: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Function-call plan that pins every answer row together with add_eq, used by the stub backend."""
+    titles = list(puzzle["categories"])
+    plan = []
+    for row in puzzle["answer_indices"]:
+        anchor = puzzle["categories"][titles[0]][row[0]]
+        for c in range(1, len(titles)):
+            item = puzzle["categories"][titles[c]][row[c]]
+            plan.append({"function_name": "add_eq", "parameters": f"{titles[0]}|{anchor}|{titles[c]}|{item}"})
+    return plan
+
+
+class StubBackend:
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+
+    def make_agent(self, agent_name: str, system_prompt: str, puzzle: Dict[str, Any], json_schema=None,
+                   temperature: float = 0.0, seed: Optional[int] = None, asynchronous: bool = False):
+        return _StubAgent(agent_name, puzzle, latency=self.latency, system_prompt=system_prompt)
+
+
+class GeminiBackend:
+    """Live Gemini agents; with a cache they replay recorded responses and record new ones."""
+
+    def __init__(self, cache=None, offline: bool = False, client=None) -> None:
+        self.cache = cache
+        self.offline = offline
+        self.client = client
+
+    def make_agent(self, agent_name: str, system_prompt: str, puzzle: Dict[str, Any], json_schema=None,
+                   temperature: float = 0.0, seed: Optional[int] = None, asynchronous: bool = False):
+        """An Agent, or with asynchronous=True an AsyncAgent whose requests can be cancelled mid-flight."""
+        from src.llm_engine.gemini_agent import Agent, AsyncAgent
+
+        client = _OfflineClient() if self.offline else self.client
+        agent_cls = AsyncAgent if asynchronous else Agent
+        return agent_cls(agent_name=agent_name, system_prompt=system_prompt, json_schema=json_schema,
+                         client=client, cache=self.cache, temperature=temperature, seed=seed)
+
+
+class _OfflineClient:
+    """Client for recorded runs: any request that is not in the cache is an error."""
+
+    class chats:
+        @staticmethod
+        def create(model, config=None, history=None):
+            return _OfflineClient._Chat()
+
+    class _Chat:
+        def send_message(self, message):
+            raise LookupError("No recorded response for this request")
+
+    class aio:
+        class chats:
+            @staticmethod
+            def create(model, config=None, history=None):
+                return _OfflineClient._AsyncChat()
+
+    class _AsyncChat:
+        async def send_message(self, message):
+            raise LookupError("No recorded response for this request")
+
+
+def make_backend(spec: str, latency: float = 0.0):
+    from src.llm_engine.response_cache import ResponseCache
+
+    kind, _, arg = spec.partition(":")
+    if kind == "stub":
+        return StubBackend(latency=latency)
+    if kind == "recorded":
+        return GeminiBackend(cache=ResponseCache(arg or ".llm_cache.sqlite"), offline=True)
+    if kind == "live":
+        return GeminiBackend(cache=ResponseCache(arg) if arg else None)
+    if kind == "replay":
+        from src.llm_engine.replay import ReplayClient, ReplayServer
+        return GeminiBackend(client=ReplayClient(ReplayServer.from_spec(arg)))
+    raise ValueError(f"Unknown backend {spec!r}")
+
+
+# ----------------------------------------------------------------------------
+# Scoring
+# ----------------------------------------------------------------------------
+
+def grid_to_text(grid: List[List[str]]) -> str:
+    return "Final Answer:\n" + "\n".join(" | ".join(row) for row in grid)
+
+
+# ----------------------------------------------------------------------------
+# Pipelines
+# ----------------------------------------------------------------------------
+
+def run_self_refinement(puzzle: Dict[str, Any], backend, recorder: StageRecorder) -> str:
+    agent = _MeteredAgent(backend.make_agent("csp_agent_refine", "You are an AI assistant", puzzle), recorder)
+    with recorder.stage("solve"):
+        response = agent.perform_action(puzzle["question"])
+    with recorder.stage("refine"):
+        new_query = SELF_REFINEMENT_PROMPT + "\n" + "Your Response: \n" + response
+        new_query += puzzle["question"].split("Final Answer:")[1] + "\n"
+        return agent.perform_action(new_query)
+
+
+def run_two_agent(puzzle: Dict[str, Any], backend, recorder: StageRecorder) -> str:
+    cat_str = "".join(f"{cat}: {', '.join(items)}\n" for cat, items in puzzle["categories"].items())
+    with recorder.stage("constraints"):
+        csp_agent = _MeteredAgent(backend.make_agent("csp_agent", CSP_SYSTEM_PROMPT, puzzle), recorder)
+        constraints = csp_agent.perform_action(f"{puzzle['actual_question']}\n\n{puzzle['clues']}\n\n{puzzle['categories']}")
+    with recorder.stage("mapping"):
+        mapper = _MeteredAgent(backend.make_agent("mapping_agent", MAPPING_SYSTEM_PROMPT, puzzle), recorder)
+        query = constraints + "\n" + "Categories: \n" + cat_str + "\n"
+        query += puzzle["question"].split("Final Answer:")[1] + "\n"
+        return mapper.perform_action(query)
+
+
+def _z3_tool_descriptions() -> str:
+    from src.z3_tools.constraint_tools import ConstraintSolver
+
+    return "".join(f"{name}: {inspect.getdoc(fn)}\n" for name, fn in inspect.getmembers(ConstraintSolver, inspect.isfunction)
+                   if name.startswith("add_") and name not in ("add_distinct", "add_constraint_to_solver", "add_clue"))
+
+
+def run_z3_tool_calling(puzzle: Dict[str, Any], backend, recorder: StageRecorder) -> str:
+    from src.z3_tools.plan_executor import solve_plan
+
+    with recorder.stage("plan"):
+        planner = _MeteredAgent(backend.make_agent("z3_planner", Z3_PLANNER_SYSTEM_PROMPT + _z3_tool_descriptions(), puzzle),
+                                recorder)
+        plan = json.loads(planner.perform_action(f"{puzzle['actual_question']}\n\n{puzzle['clues']}\n\n{puzzle['categories']}"))
+    with recorder.stage("solve"):
+        grid = solve_plan(puzzle["categories"], plan)
+    return grid_to_text(grid)
+
+
+def _sampler(puzzle: Dict[str, Any], backend, recorder: StageRecorder, agent_name: str, system_prompt: str):
+    """Async sample function for self_consistency: one fresh agent per sample, usage added to the active stage."""
+    async def sample(query: str, settings: Dict[str, Any]) -> str:
+        agent = backend.make_agent(agent_name, system_prompt, puzzle, asynchronous=True, **settings)
+        if inspect.iscoroutinefunction(agent.perform_action):
+            response = await agent.perform_action(query)
+        else:
+            # A blocking backend cannot be interrupted; a cancelled sample's thread finishes unobserved.
+            response = await asyncio.to_thread(agent.perform_action, query)
+        _add_usage(recorder, agent, query, response)
+        return response
+
+    return sample
+
+
+def run_self_consistency(puzzle: Dict[str, Any], backend, recorder: StageRecorder, verify=None,
+                         samples: int = SC_SAMPLES) -> str:
+    from src.llm_engine.self_consistency import run_self_consistency as sample_until_agreement
+
+    with recorder.stage("sample") as record:
+        sample = _sampler(puzzle, backend, recorder, "csp_agent_sample", "You are an AI assistant")
+        result = sample_until_agreement(sample, puzzle["question"], puzzle["categories"], samples=samples,
+                                        verify=verify)
+        record.update({key: value for key, value in result.items() if key not in ("response", "grid", "wall_s")})
+    return result["response"]
+
+
+def run_self_consistency_verified(puzzle: Dict[str, Any], backend, recorder: StageRecorder,
+                                  samples: int = SC_SAMPLES) -> str:
+    """Self-consistency that also stops at the first sample the z3 planner's constraints confirm."""
+    from src.z3_tools.plan_executor import grid_verifier
+
+    with recorder.stage("plan"):
+        planner = _MeteredAgent(backend.make_agent("z3_planner", Z3_PLANNER_SYSTEM_PROMPT + _z3_tool_descriptions(), puzzle),
+                                recorder)
+        try:
+            plan = json.loads(planner.perform_action(f"{puzzle['actual_question']}\n\n{puzzle['clues']}\n\n{puzzle['categories']}"))
+            verify = grid_verifier(puzzle["categories"], plan)
+        except (ValueError, KeyError, TypeError):
+            # Without a usable plan the samples are still voted on.
+            verify = None
+    return run_self_consistency(puzzle, backend, recorder, verify=verify, samples=samples)
+
+
+PIPELINES: Dict[str, Callable] = {
+    "self_refinement": run_self_refinement,
+    "two_agent": run_two_agent,
+    "z3_tool_calling": run_z3_tool_calling,
+    "self_consistency": run_self_consistency,
+    "self_consistency_verified": run_self_consistency_verified,
+}
+
+
+def get_pipeline(pipeline: str, samples: Optional[int] = None) -> Callable:
+    """PIPELINES[pipeline], with samples bound for the pipelines that sample (others ignore it)."""
+    run = PIPELINES[pipeline]
+    if samples is not None and "samples" in inspect.signature(run).parameters:
+        run = functools.partial(run, samples=samples)
+    return run
+
+
+# ----------------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------------
+
+def load_puzzles(path: str) -> Iterable[Dict[str, Any]]:
+    """Puzzles from a compiled store (.gpz) or straight from the dataset CSV."""
+    if path.endswith(".gpz"):
+        from src.puzzle_store import PuzzleStore
+        return PuzzleStore(path)
+
+    import pandas as pd
+    from src.puzzle_store import parse_puzzle_row
+    return [parse_puzzle_row(row) for row in pd.read_csv(path).to_dict(orient="records")]
+
+
+def run_puzzle(pipeline: str, puzzle: Dict[str, Any], backend, run_id: str,
+               track_memory: bool = True, samples: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Run one puzzle through a pipeline and return its result record (errors are recorded, not raised).
+    samples sets the sample count of the self_consistency pipelines (default SC_SAMPLES).
+    """
+    run = get_pipeline(pipeline, samples)
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    recorder = StageRecorder(track_memory=track_memory)
+    start = time.perf_counter()
+    error, response = None, None
+    with tracing.trace_context(puzzle_id=puzzle["id"], pipeline=pipeline, run_id=run_id):
+        with tracing.span("puzzle") as current:
+            try:
+                response = run(puzzle, backend, recorder)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            current.set(error=error)
+    return {
+        "run_id": run_id,
+        "pipeline": pipeline,
+        "puzzle_id": puzzle["id"],
+        "wall_s": time.perf_counter() - start,
+        "stages": recorder.stages,
+        "prompt_tokens": sum(s["prompt_tokens"] for s in recorder.stages),
+        "output_tokens": sum(s["output_tokens"] for s in recorder.stages),
+        "error": error,
+        **score_prediction(puzzle, response),
+    }
+
+
+def run_benchmark(pipeline: str, backend, puzzles: Iterable[Dict[str, Any]], out_path: Optional[str] = None,
+                  limit: Optional[int] = None, track_memory: bool = True,
+                  samples: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Run a pipeline over the puzzles and return (and optionally append to out_path as JSONL)
+    one result record per puzzle. samples is passed on to run_puzzle.
+    """
+    run_id = uuid.uuid4().hex[:12]
+    results = []
+
+    out = None
+    if out_path:
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+        out = open(out_path, "a")
+    try:
+        for index, puzzle in enumerate(puzzles):
+            if limit is not None and index >= limit:
+                break
+            result = run_puzzle(pipeline, puzzle, backend, run_id, track_memory=track_memory, samples=samples)
+            results.append(result)
+            if out is not None:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        if out is not None:
+            out.close()
+
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate per-stage totals and accuracy over a run."""
+    stages: Dict[str, Dict[str, float]] = {}
+    for result in results:
+        for stage in result["stages"]:
+            agg = stages.setdefault(stage["stage"], {"wall_s": 0.0, "cpu_s": 0.0, "prompt_tokens": 0, "output_tokens": 0,
+                                                      "peak_mem_bytes": 0})
+            agg["wall_s"] += stage["wall_s"]
+            agg["cpu_s"] += stage["cpu_s"]
+            agg["prompt_tokens"] += stage["prompt_tokens"]
+            agg["output_tokens"] += stage["output_tokens"]
+            agg["peak_mem_bytes"] = max(agg["peak_mem_bytes"], stage.get("peak_mem_bytes", 0))
+            if "needed" in stage:
+                # Self-consistency sampling: how many of the launched samples were waited for.
+                for key in ("launched", "needed", "cancelled"):
+                    agg["samples_" + key] = agg.get("samples_" + key, 0) + stage[key]
+                agg.setdefault("stop_reasons", {})
+                agg["stop_reasons"][stage["stop_reason"]] = agg["stop_reasons"].get(stage["stop_reason"], 0) + 1
+    n = len(results) or 1
+    return {
+        "puzzles": len(results),
+        "errors": sum(r["error"] is not None for r in results),
+        "solved_rate": sum(r["solved"] for r in results) / n,
+        "cell_accuracy": sum(r["cell_accuracy"] for r in results) / n,
+        "wall_s": sum(r["wall_s"] for r in results),
+        "stages": stages,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark a puzzle-solving pipeline over the GridPuzzle dataset")
+    parser.add_argument("--pipeline", choices=sorted(PIPELINES), default="self_refinement")
+    parser.add_argument("--backend", default="stub", help="stub | recorded:<cache.sqlite> | live[:<cache.sqlite>] | replay[:<spec>]")
+    parser.add_argument("--data", default="data/GridPuzzle_processed.csv", help="dataset CSV or compiled .gpz store")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.0, help="per-call latency of the stub backend in seconds")
+    parser.add_argument("--out", default=None, help="append per-puzzle JSONL results here")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc peak-memory tracking")
+    parser.add_argument("--samples", type=int, default=SC_SAMPLES, help="samples per puzzle for the self_consistency pipelines")
+    parser.add_argument("--trace", default=None, help="record spans to this JSONL file")
+    parser.add_argument("--chrome-trace", default=None, help="also write the spans as a Chrome trace-event file")
+    args = parser.parse_args(argv)
+
+    tracer = tracing.enable(args.trace) if args.trace or args.chrome_trace else None
+    try:
+        results = run_benchmark(args.pipeline, make_backend(args.backend, latency=args.latency),
+                                load_puzzles(args.data), out_path=args.out, limit=args.limit,
+                                track_memory=not args.no_memory, samples=args.samples)
+    finally:
+        if tracer is not None:
+            tracing.disable()
+            if args.chrome_trace:
+                tracer.export_chrome(args.chrome_trace)
+    json.dump(summarize(results), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Import-time benchmark for the package's entry modules.
+
+Each module is imported in a fresh interpreter (the situation of a newly spawned worker)
+with ``-X importtime``; the wall time of the whole process and the slowest imports it
+pulled in are reported, so regressions such as a provider SDK imported at module level
+show up immediately.
+
+Usage:
+    python -m src.import_benchmark
+    python -m src.import_benchmark src.z3_tools.solver_pool src.llm_engine.gemini_agent --repeat 10
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Set, Tuple
+
+# Light modules are what solver and scoring workers import; heavy ones load a provider SDK on first use.
+DEFAULT_MODULES = [
+    "src.z3_tools.solver_pool",
+    "src.z3_tools.plan_compiler",
+    "src.llm_engine.sinkhorn",
+    "src.scoring",
+    "src.benchmark",
+    "src.llm_engine.gemini_agent",
+    "src.llm_engine.deepseek_r1_agent",
+    "src.llm_engine.scheduler",
+    "src.utils",
+]
+
+
+def _external_imports(stderr: str, startup: Set[str] = frozenset()) -> List[Tuple[int, str]]:
+    """
+    (cumulative microseconds, module) for the outermost non-project imports in -X importtime
+    output, i.e. the third-party and stdlib modules a project module pulled in directly.
+    Modules in startup (imported by a bare interpreter anyway) are left out.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, int(cumulative), name.strip()))
+
+    # Children are printed before their parent, so walk backwards to see parents first.
+    found, parents = [], []
+    for depth, cumulative, name in reversed(rows):
+        del parents[depth:]
+        parent = parents[-1] if parents else None
+        if name.split(".")[0] != "src" and name not in startup and (parent is None or parent.split(".")[0] == "src"):
+            found.append((cumulative, name))
+        parents.append(name)
+    return sorted(found, reverse=True)
+
+
+def time_import(module: str, repeat: int = 5, top: int = 5) -> Dict[str, object]:
+    """
+    Import a module in fresh interpreters.
+
+    Returns:
+        dict: median and minimum wall seconds, baseline-corrected median ("own_s") and the
+              slowest outside modules imported by the last run as (module, seconds) pairs
+    """
+    def run(statement: str) -> Tuple[float, str]:
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True)
+        seconds = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+        return seconds, proc.stderr
+
+    bare = [run("pass") for _ in range(repeat)]
+    baseline = statistics.median(seconds for seconds, _ in bare)
+    startup = {name for _, name in _external_imports(bare[-1][1])}
+    times, stderr = [], ""
+    for _ in range(repeat):
+        seconds, stderr = run(f"import {module}")
+        times.append(seconds)
+    return {
+        "module": module,
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "own_s": statistics.median(times) - baseline,
+        "slowest": [(name, us / 1e6) for us, name in _external_imports(stderr, startup)[:top]],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="slowest imports listed per module")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        result = time_import(module, args.repeat, args.top)
+        print(f"{module:36s} median {result['median_s']:.3f}s  (+{result['own_s']:.3f}s over a bare interpreter)")
+        for name, seconds in result["slowest"]:
+            print(f"    {seconds:.3f}s  {name}")
@@ -0,0 +1,128 @@
+import numpy as np
+
+from src.llm_engine.sinkhorn import sinkhorn_normalize, stack_probability_tables
+
+_SEPARATOR = "__x__"
+
+
+def category_order(matrices):
+    """
+    Category topics in the order they appear in the matrix names ("A__x__B").
+
+    Parameters:
+    -----------
+    matrices : dict of str -> numpy.ndarray
+        Matrices from utils.initialize_probability_tables
+
+    Returns:
+    --------
+    list of str
+        Every topic once, first appearance first
+    """
+    topics = {}
+    for name in matrices:
+        first, sep, second = name.partition(_SEPARATOR)
+        if not sep:
+            raise ValueError(f"Matrix name {name!r} is not of the form 'A{_SEPARATOR}B'")
+        topics.setdefault(first, None)
+        topics.setdefault(second, None)
+    return list(topics)
+
+
+def _pair_tensor(stack, index, topics):
+    """(k, k, n, n) array holding M_ab for every ordered pair, M_ba = M_ab.T and identities on the diagonal."""
+    k, n = len(topics), stack.shape[1]
+    pairs = np.broadcast_to(np.eye(n), (k, k, n, n)).copy()
+    position = {topic: i for i, topic in enumerate(topics)}
+    for name, slot in index.items():
+        first, _, second = name.partition(_SEPARATOR)
+        a, b = position[first], position[second]
+        pairs[a, b] = stack[slot]
+        pairs[b, a] = stack[slot].T
+    return pairs
+
+
+def propagate_beliefs(updated_matrices, strength=1.0, max_rounds=50, tolerance=1e-6, max_iterations=100):
+    """
+    Make all category-pair matrices agree with each other by composing them through
+    every third category, so certain links imply links elsewhere in the grid.
+
+    For categories A, B, C the product M_AB @ M_BC is the A-C matrix implied by the other
+    two; it is 0 wherever no item of B can connect the pair. Each round every matrix is
+    recomputed from the values it had on entry (the evidence) times the geometric mean of
+    the compositions of the current beliefs through all other categories, raised to
+    `strength`, and renormalized with Sinkhorn. Anchoring on the evidence keeps soft
+    preferences from reinforcing themselves into false certainties. Rounds repeat until
+    no cell moves by more than the tolerance; the products of all pairs are computed in
+    one batched matmul.
+
+    A certain A-B link together with a certain B-C link therefore fixes A-C, and an
+    eliminated cell spreads to every cell that depended on it.
+
+    Parameters:
+    -----------
+    updated_matrices : dict of str -> numpy.ndarray
+        Square matrices keyed "A__x__B"; entries become views of a shared stack and are updated in place
+    strength : float
+        Weight of the implied matrices against the evidence (0 keeps the evidence unchanged)
+    max_rounds : int
+        Maximum number of propagation rounds
+    tolerance : float
+        Convergence threshold on the largest absolute cell change between rounds
+    max_iterations : int
+        Maximum number of Sinkhorn iterations per round
+
+    Returns:
+    --------
+    dict
+        rounds run, whether a fixed point was reached and the number of cells at 0 or 1
+
+    Raises:
+    -------
+    ValueError
+        If the matrices contradict each other, i.e. some item is left with no possible partner
+    """
+    stack, index = stack_probability_tables(updated_matrices)
+    topics = category_order(updated_matrices)
+    if stack.shape[1] != stack.shape[2]:
+        raise ValueError(f"Belief propagation needs square matrices, got shape {stack.shape[1:]}")
+
+    k = len(topics)
+    slots = np.fromiter(index.values(), dtype=int, count=len(index))
+    position = {topic: i for i, topic in enumerate(topics)}
+    firsts = np.array([position[name.partition(_SEPARATOR)[0]] for name in index])
+    seconds = np.array([position[name.partition(_SEPARATOR)[2]] for name in index])
+    evidence = stack.copy()
+
+    # Intermediate categories of a pair are all categories except its two ends.
+    through = np.ones((k, k, k), dtype=bool)
+    through[np.arange(k), np.arange(k), :] = False
+    through[:, np.arange(k), np.arange(k)] = False
+    through = through[firsts, :, seconds]
+    exponent = strength / max(k - 2, 1)
+
+    rounds, converged = 0, k < 3
+    while not converged and rounds < max_rounds:
+        pairs = _pair_tensor(stack, index, topics)
+        # composed[a, b, c] = M_ab @ M_bc for all triples at once.
+        composed = np.matmul(pairs[:, :, None], pairs[None, :, :])
+        implied = composed[firsts, :, seconds]
+        implied = np.where(through[:, :, None, None], implied, 1.0).prod(axis=1) ** exponent
+
+        block = evidence[slots] * implied
+        empty_rows = ~block.any(axis=2)
+        empty_cols = ~block.any(axis=1)
+        if empty_rows.any() or empty_cols.any():
+            m, line = np.argwhere(empty_rows | empty_cols)[0]
+            name = list(index)[m]
+            kind = "row" if empty_rows[m, line] else "column"
+            raise ValueError(f"Contradictory probabilities: {kind} {line} of {name!r} has no possible partner left")
+
+        previous = stack.copy()
+        stack[slots] = block
+        sinkhorn_normalize(stack, indices=slots, max_iterations=max_iterations, tolerance=tolerance)
+        rounds += 1
+        converged = np.abs(stack - previous).max() < tolerance
+
+    decided = np.isclose(stack, 0.0, atol=tolerance) | np.isclose(stack, 1.0, atol=tolerance)
+    return {"rounds": rounds, "converged": bool(converged), "decided_cells": int(decided.sum())}
@@ -0,0 +1,44 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, List
+
+
+async def gather_bounded(items: Iterable[Any], worker: Callable[[Any], Awaitable[Any]], concurrency: int = 8,
+                         return_exceptions: bool = True) -> List[Any]:
+    """
+    Run an async worker over every item with at most `concurrency` calls in flight.
+
+    Args:
+        items (Iterable): Inputs, e.g. puzzle rows or user queries
+        worker (Callable): Async function called once per item, e.g. a pipeline built on AsyncAgent
+        concurrency (int): Maximum number of in-flight requests
+        return_exceptions (bool): Put a failed item's exception in its slot instead of aborting the batch
+
+    Returns:
+        list: One result per item, in the same order as the inputs
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(item):
+        async with semaphore:
+            return await worker(item)
+
+    return await asyncio.gather(*(bounded(item) for item in items), return_exceptions=return_exceptions)
+
+
+def run_bounded(items: Iterable[Any], worker: Callable[[Any], Awaitable[Any]], concurrency: int = 8,
+                return_exceptions: bool = True) -> List[Any]:
+    """
+    Blocking wrapper around gather_bounded for scripts and notebooks.
+
+    Example:
+        >>> async def solve(question):
+        ...     agent = AsyncAgent(agent_name="csp_agent", system_prompt="You are an AI assistant")
+        ...     return await agent.perform_action(question)
+        >>> responses = run_bounded(df["question"], solve, concurrency=16)
+
+    Jupyter already runs an event loop, so there use `await gather_bounded(...)` instead.
+    """
+    return asyncio.run(gather_bounded(items, worker, concurrency=concurrency, return_exceptions=return_exceptions))
@@ -1,63 +1,192 @@
-import requests
-import json
-from ollama import chat
+import time
+
+from src.llm_engine.memory import ConversationMemory, estimate_tokens
+from src.tracing import span
 
 class ChatAgent:
-    def __init__(self, model_name, system_prompt="You are a helpful assistant."):
+    def __init__(self, model_name, system_prompt="You are a helpful assistant.", cache=None, memory=None, chat_fn=None):
         """
         Initialize a ChatAgent with a specific model and system prompt.
         
         Args:
             model_name (str): The name of the model to use
             system_prompt (str): The system prompt to use for all conversations
+            cache (ResponseCache): Optional persistent cache consulted before calling the model
+            memory (ConversationMemory): Policy choosing which turns are sent; defaults to the full history
+            chat_fn (callable): Stand-in for ollama.chat(model=, messages=, stream=), e.g. replay.ReplayServer.chat
         """
         self.model_name = model_name
         self.system_prompt = system_prompt
+        self.cache = cache
+        self.memory = memory if memory is not None else ConversationMemory()
+        self.chat_fn = chat_fn
+        self.turn_stats = []
         self.conversation_history = []
         # Initialize with system message
         self.conversation_history.append({"role": "system", "content": self.system_prompt})
     
-    def chat(self, user_message):
+    def chat(self, user_message, pin=False):
         """
         Send a message to the model and get a response.
         
         Args:
             user_message (str): The user's message
+            pin (bool): Keep this message in every later request (e.g. the puzzle statement)
             
         Returns:
             str: The model's response
         """
-        # Add user message to conversation history
-        self.conversation_history.append({"role": "user", "content": user_message})
+        with span("chat_agent.chat", model=self.model_name, prompt_chars=len(user_message)) as current:
+            assistant_message = self._chat(user_message, pin)
+            stats = self.turn_stats[-1]
+            current.set(response_chars=len(assistant_message), prompt_tokens=stats["prompt_tokens"],
+                        output_tokens=stats["output_tokens"], cached=stats["cached"],
+                        messages_sent=stats["messages_sent"])
+            return assistant_message
+
+    def _chat(self, user_message, pin):
+        start = time.perf_counter()
+        messages, key, cached = self._prepare_turn(user_message, pin)
+        if cached is not None:
+            self._finish_turn(messages, None, cached, key, start)
+            return cached
         
         # Make the API call
-        response = self._call_chat_api()
+        response = self._call_chat_api(messages)
         
         # Extract assistant message and add to history
         assistant_message = response["message"]["content"]
-        self.conversation_history.append({"role": "assistant", "content": assistant_message})
+        self._finish_turn(messages, response, assistant_message, key, start)
         
         return assistant_message
+
+    def stream_chat(self, user_message, pin=False):
+        """
+        Send a message to the model and yield the response text piece by piece as it is generated.
+        
+        The turn is added to the history (and cache) once the stream is complete; a stream
+        that is abandoned early leaves the conversation as it was.
+        
+        Args:
+            user_message (str): The user's message
+            pin (bool): Keep this message in every later request (e.g. the puzzle statement)
+            
+        Yields:
+            str: Text deltas of the model's response
+        """
+        with span("chat_agent.stream_chat", model=self.model_name, prompt_chars=len(user_message)) as current:
+            start = time.perf_counter()
+            messages, key, cached = self._prepare_turn(user_message, pin)
+            if cached is not None:
+                self._finish_turn(messages, None, cached, key, start)
+                current.set(response_chars=len(cached), cached=True)
+                yield cached
+                return
+
+            parts, last, complete = [], None, False
+            try:
+                for chunk in self._call_chat_api_stream(messages):
+                    last = chunk
+                    delta = chunk["message"]["content"]
+                    if delta:
+                        if not parts:
+                            current.set(first_token_s=time.perf_counter() - start)
+                        parts.append(delta)
+                        yield delta
+                complete = True
+            finally:
+                if not complete:
+                    self.memory.pinned.discard(len(self.conversation_history) - 1)
+                    self.conversation_history.pop()
+
+            assistant_message = "".join(parts)
+            self._finish_turn(messages, last, assistant_message, key, start)
+            stats = self.turn_stats[-1]
+            current.set(response_chars=len(assistant_message), prompt_tokens=stats["prompt_tokens"],
+                        output_tokens=stats["output_tokens"], cached=False)
+
+    def _prepare_turn(self, user_message, pin):
+        """Add the user message to the history and return (messages to send, cache key, cached reply)."""
+        # Add user message to conversation history
+        self.conversation_history.append({"role": "user", "content": user_message})
+        if pin:
+            self.memory.pin(len(self.conversation_history) - 1)
+        messages = self.memory.build(self.conversation_history)
+        
+        # Serve repeated conversations from the cache
+        key, cached = None, None
+        if self.cache is not None:
+            key = self.cache.make_key(model=self.model_name, system_prompt=self.system_prompt,
+                                      history=messages)
+            cached = self.cache.get(key)
+        return messages, key, cached
+
+    def _finish_turn(self, messages, response, assistant_message, key, start):
+        self.conversation_history.append({"role": "assistant", "content": assistant_message})
+        if key is not None and response is not None:
+            self.cache.put(key, assistant_message)
+        self._record_turn(messages, response, assistant_message, start)
     
-    def _call_chat_api(self):
+    def _call_chat_api(self, messages=None):
         """
-        Call the chat API with the current conversation history.
+        Call the chat API with the messages selected by the memory policy.
         
         Returns:
             dict: The raw API response
         """
-        # This is a placeholder for your actual API call implementation
-        # Replace with your actual API call code
+        chat = self._chat_fn()
         return chat(
             model=self.model_name,
-            messages=self.conversation_history
+            messages=messages if messages is not None else self.conversation_history
         )
+
+    def _call_chat_api_stream(self, messages):
+        """
+        Streaming counterpart of _call_chat_api.
+        
+        Returns:
+            Iterator: Response chunks; the last one carries the token counts
+        """
+        chat = self._chat_fn()
+        return chat(model=self.model_name, messages=messages, stream=True)
+
+    def _chat_fn(self):
+        if self.chat_fn is not None:
+            return self.chat_fn
+        from ollama import chat
+
+        return chat
+    
+    def _record_turn(self, messages, response, assistant_message, start):
+        """
+        Append token and latency figures for the last turn to turn_stats; token counts come
+        from ollama's prompt_eval_count/eval_count when available, otherwise they are estimated.
+        """
+        def field(name):
+            if response is None:
+                return None
+            return getattr(response, name, None) if not isinstance(response, dict) else response.get(name)
+        
+        prompt_tokens, output_tokens = field("prompt_eval_count"), field("eval_count")
+        self.turn_stats.append({
+            "turn": len(self.turn_stats),
+            "messages_sent": len(messages),
+            "history_messages": len(self.conversation_history) - 1,
+            "prompt_tokens": prompt_tokens if prompt_tokens is not None
+                             else sum(estimate_tokens(m["content"]) for m in messages),
+            "output_tokens": output_tokens if output_tokens is not None else estimate_tokens(assistant_message),
+            "estimated": prompt_tokens is None,
+            "latency_s": time.perf_counter() - start,
+            "cached": response is None,
+        })
     
     def reset_conversation(self):
         """
         Reset the conversation history, keeping only the system prompt.
         """
         self.conversation_history = [{"role": "system", "content": self.system_prompt}]
+        self.memory.reset()
+        self.turn_stats = []
     
     def get_conversation_history(self):
         """
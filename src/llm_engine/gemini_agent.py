@@ -1,26 +1,55 @@
-import warnings
+import abc
+import asyncio
 import os
-import json
-
-from google import genai
-from tqdm import tqdm
-from dotenv import load_dotenv
-from google import generativeai
-from google.genai import types
-from pydantic import BaseModel, Field
-from typing import List, Tuple, TypedDict
+import threading
+import warnings
+from typing import Any, Dict, List, Union
 
+from src.tracing import span
 
-from google.generativeai.types import GenerationConfig #GenerateContentConfig
+# Provider SDKs (google.genai, pydantic) are imported on first use so that processes which
+# only need the Z3 tools, scoring or Sinkhorn do not pay for them at import time.
 warnings.filterwarnings("ignore")
 
-load_dotenv()
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared Gemini client used when an agent is not given one explicitly, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from dotenv import load_dotenv
+                from google import genai
+
+                load_dotenv()
+                _client = genai.Client(api_key=os.getenv("API_KEY"))
+    return _client
 
-client = genai.Client(api_key=os.getenv("API_KEY"))
+
+def set_client(client):
+    """
+    Replace the shared client (e.g. with replay.ReplayClient for offline runs) and return the
+    previous one; None makes the next get_client() create a Gemini client again.
+    """
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    return previous
+
+
+def __getattr__(name):
+    # Keeps `from src.llm_engine.gemini_agent import client` working without an import-time client.
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_json_schema(agent_name):
 
+    from pydantic import BaseModel, Field
 
     if agent_name == "llm_agent":
         
@@ -55,41 +84,237 @@ def get_json_schema(agent_name):
             Probability: float
 
         return Recipe
+
+    elif agent_name == "function_call":
+
+        class Recipe(BaseModel):
+            step: Union[int, str]
+            function: str
+            inputs: Dict[str, Any] = {}
+
+        return Recipe
     
     else:
         return None
 
 
-class Agent:
+def _generation_config(system_prompt, json_schema=None, max_output_tokens=8192, temperature=0.0, seed=None):
+    from google.genai import types
+
+    if not json_schema:
+        return types.GenerateContentConfig(system_instruction=system_prompt,
+                                           temperature=temperature,
+                                           seed=seed,)
+
+    return types.GenerateContentConfig(system_instruction=system_prompt,
+                                       temperature=temperature,
+                                       seed=seed,
+                                       top_k=18,
+                                       top_p = 0.4,
+                                       maxOutputTokens=max_output_tokens,
+                                       response_mime_type='application/json',
+                                       response_schema=json_schema)
+
+
+class _ChatAgentBase(abc.ABC):
+    """
+    Shared setup for Agent and AsyncAgent: generation config, conversation history and
+    the optional ResponseCache lookup in front of the chat session.
+    """
 
-    def __init__(self,agent_name, system_prompt=None, json_schema=None, max_output_tokens=8192):
+    def __init__(self,agent_name, system_prompt=None, json_schema=None, max_output_tokens=8192, client=None, cache=None,
+                 temperature=0.0, seed=None):
         self.model_name = "gemini-2.0-flash-exp"
         self.agent_name = agent_name
         self.system_prompt = system_prompt
-        self.client = client
-
-        if not json_schema:
-
-            self.chat = self.client.chats.create(  model=self.model_name,
-                                              
-                                                config=types.GenerateContentConfig(system_instruction=self.system_prompt,
-                                                                                   temperature=0.0,)
-                                            )
-            
-        else:
-            # if json_schema is not None:
-            #     print("I think there is some json schema", json_schema)
-            
-            self.chat = self.client.chats.create(model=self.model_name,
-                                                    config=types.GenerateContentConfig(system_instruction=self.system_prompt,
-                                                                                        temperature=0.0,
-                                                                                        top_k=18,
-                                                                                        top_p = 0.4,
-                                                                                        maxOutputTokens=max_output_tokens,
-                                                                                        response_mime_type='application/json',
-                                                                                        response_schema=json_schema))
-            
+        self.json_schema = json_schema
+        self.client = client if client is not None else get_client()
+        # Sampling settings other than the default greedy decoding are used for self-consistency voting.
+        self.config = _generation_config(self.system_prompt, json_schema, max_output_tokens, temperature, seed)
+        self.cache = cache
+        self.history = []
+        self.last_usage = None
+        # False once a turn was answered from the cache and the server-side chat has not seen it.
+        self._chat_in_sync = True
+
+        self.chat = self._create_chat()
+
+    @abc.abstractmethod
+    def _create_chat(self):
+        """New chat session on self.client, seeded with self.history."""
+
+    def _history_contents(self):
+        from google.genai import types
+
+        roles = {"user": "user", "assistant": "model"}
+        return [types.Content(role=roles[turn["role"]], parts=[types.Part(text=turn["content"])])
+                for turn in self.history]
+
+    def _cache_key(self, user_query):
+        history = self.history + [{"role": "user", "content": user_query}]
+        return self.cache.make_key(model=self.model_name, config=self.config, system_prompt=self.system_prompt,
+                                   json_schema=self.json_schema, history=history)
+
+    def _cached_response(self, user_query):
+        if self.cache is None:
+            return None, None
+        key = self._cache_key(user_query)
+        return key, self._use_cached(user_query, self.cache.get(key))
+
+    def _use_cached(self, user_query, cached):
+        if cached is not None:
+            self.last_usage = {"prompt_tokens": 0, "output_tokens": 0, "cached": True}
+            self._record(user_query, cached)
+            self._chat_in_sync = False
+        return cached
+
+    def _ensure_chat_in_sync(self):
+        if not self._chat_in_sync:
+            self.chat = self._create_chat()
+            self._chat_in_sync = True
+
+    def _record_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        self.last_usage = {
+            "prompt_tokens": getattr(usage, "prompt_token_count", None) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+            "cached": False,
+        } if usage is not None else None
+
+    def _record(self, user_query, text):
+        self.history.append({"role": "user", "content": user_query})
+        self.history.append({"role": "assistant", "content": text})
+
+    def _span(self, user_query):
+        return span("agent.perform_action", agent_name=self.agent_name, model=self.model_name,
+                    prompt_chars=len(user_query))
+
+    def _finish_span(self, current, text):
+        current.set(response_chars=len(text or ""), **(self.last_usage or {}))
+
+    def _finish_stream(self, user_query, parts, last_chunk):
+        text = "".join(parts)
+        self._record_usage(last_chunk)
+        self._record(user_query, text)
+        return text
+
+
+class Agent(_ChatAgentBase):
+
+    def _create_chat(self):
+        return self.client.chats.create(model=self.model_name, config=self.config,
+                                        history=self._history_contents() or None)
 
     def perform_action(self, user_query):
+        with self._span(user_query) as current:
+            text = self._perform_action(user_query)
+            self._finish_span(current, text)
+            return text
+
+    def _perform_action(self, user_query):
+        key, cached = self._cached_response(user_query)
+        if cached is not None:
+            return cached
+
+        self._ensure_chat_in_sync()
         response = self.chat.send_message(user_query)
-        return response.text    
\ No newline at end of file
+        self._record_usage(response)
+        self._record(user_query, response.text)
+        if key is not None and response.text is not None:
+            self.cache.put(key, response.text)
+        return response.text    
+
+    def stream_action(self, user_query):
+        """
+        Like perform_action, but yields the response text in pieces as the model produces them.
+
+        The turn is recorded (history, usage, cache) once the stream has been read to the end.
+        If the consumer stops early the server-side chat has not kept the turn either; the
+        session is rebuilt from the local history before the next call.
+        """
+        with self._span(user_query) as current:
+            key, cached = self._cached_response(user_query)
+            if cached is not None:
+                self._finish_span(current, cached)
+                yield cached
+                return
+
+            self._ensure_chat_in_sync()
+            parts, last_chunk, complete = [], None, False
+            try:
+                for chunk in self.chat.send_message_stream(user_query):
+                    last_chunk = chunk
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield chunk.text
+                complete = True
+            finally:
+                if not complete:
+                    self._chat_in_sync = False
+            text = self._finish_stream(user_query, parts, last_chunk)
+            if key is not None and parts:
+                self.cache.put(key, text)
+            self._finish_span(current, text)
+
+
+class AsyncAgent(_ChatAgentBase):
+    """
+    asyncio counterpart of Agent built on the client's aio chat sessions, so many
+    puzzles can be in flight at once (see concurrency.run_bounded).
+    """
+
+    def _create_chat(self):
+        return self.client.aio.chats.create(model=self.model_name, config=self.config,
+                                            history=self._history_contents() or None)
+
+    async def _async_cached_response(self, user_query):
+        # SQLite lookups block, so they run in a worker thread instead of on the event loop.
+        if self.cache is None:
+            return None, None
+        key = self._cache_key(user_query)
+        return key, self._use_cached(user_query, await asyncio.to_thread(self.cache.get, key))
+
+    async def perform_action(self, user_query):
+        with self._span(user_query) as current:
+            text = await self._perform_action(user_query)
+            self._finish_span(current, text)
+            return text
+
+    async def _perform_action(self, user_query):
+        key, cached = await self._async_cached_response(user_query)
+        if cached is not None:
+            return cached
+
+        self._ensure_chat_in_sync()
+        response = await self.chat.send_message(user_query)
+        self._record_usage(response)
+        self._record(user_query, response.text)
+        if key is not None and response.text is not None:
+            await asyncio.to_thread(self.cache.put, key, response.text)
+        return response.text
+
+    async def stream_action(self, user_query):
+        """Async generator counterpart of Agent.stream_action."""
+        with self._span(user_query) as current:
+            key, cached = await self._async_cached_response(user_query)
+            if cached is not None:
+                self._finish_span(current, cached)
+                yield cached
+                return
+
+            self._ensure_chat_in_sync()
+            parts, last_chunk, complete = [], None, False
+            try:
+                async for chunk in await self.chat.send_message_stream(user_query):
+                    last_chunk = chunk
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield chunk.text
+                complete = True
+            finally:
+                if not complete:
+                    self._chat_in_sync = False
+            text = self._finish_stream(user_query, parts, last_chunk)
+            if key is not None and parts:
+                await asyncio.to_thread(self.cache.put, key, text)
+            self._finish_span(current, text)
@@ -0,0 +1,267 @@
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.tracing import current_span
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", re.DOTALL)
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class JSONRepairError(ValueError):
+    """Raised when a response cannot be turned into valid JSON (or does not match its schema)."""
+
+
+class RepairStats:
+    """Thread-safe counters of how responses were turned into JSON."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.clean = 0
+        self.repaired = 0
+        self.llm_fallbacks = 0
+        self.failures = 0
+
+    def count(self, outcome: str) -> None:
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def as_dict(self) -> Dict[str, float]:
+        total = self.clean + self.repaired + self.llm_fallbacks + self.failures
+        return {"clean": self.clean, "repaired": self.repaired, "llm_fallbacks": self.llm_fallbacks,
+                "failures": self.failures, "llm_fallback_rate": self.llm_fallbacks / total if total else 0.0}
+
+
+# Process-wide metrics, read with repair_stats.as_dict().
+repair_stats = RepairStats()
+
+
+def _json_region(text: str) -> str:
+    """The part of a response that holds the JSON: fenced block if any, from the first bracket on."""
+    fence = _FENCE.search(text)
+    if fence:
+        text = fence.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return text[min(starts):] if starts else text.strip()
+
+
+def _normalize(text: str) -> Tuple[str, List[Tuple[int, list]], list, bool]:
+    """
+    Single pass over the candidate text that rewrites single-quoted strings and Python
+    literals, drops trailing commas and stops after the first complete top-level value.
+
+    Returns the rewritten text, the positions where it could be cut if it turns out to be
+    truncated (with the brackets open at that point), the brackets still open at the end and
+    whether the text ended inside a string. Open brackets are (char, offset) pairs so a cut
+    can be matched to the exact array it was made in.
+    """
+    out: List[str] = []
+    # Cut positions are character offsets into the joined text; out holds fragments of varying length.
+    size = 0
+    stack: list = []
+    cuts: List[Tuple[int, list]] = []
+    quote = None
+
+    def emit(fragment: str) -> None:
+        nonlocal size
+        out.append(fragment)
+        size += len(fragment)
+
+    def unemit() -> None:
+        nonlocal size
+        size -= len(out.pop())
+
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if quote is not None:
+            if ch == "\\" and i + 1 < n:
+                nxt = text[i + 1]
+                # \' is not a JSON escape.
+                emit("'" if nxt == "'" else ch + nxt)
+                i += 2
+                continue
+            if ch == quote:
+                emit('"')
+                quote = None
+                # A closed string directly inside an array is a complete element.
+                if stack and stack[-1][0] == "[":
+                    cuts.append((size, list(stack)))
+            elif ch == '"':
+                emit('\\"')
+            elif ch == "\n":
+                emit("\\n")
+            else:
+                emit(ch)
+            i += 1
+            continue
+
+        if ch in "\"'":
+            quote = ch
+            emit('"')
+        elif ch in "{[":
+            stack.append((ch, i))
+            emit(ch)
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                unemit()
+            if out and out[-1] == ",":
+                unemit()
+            if stack:
+                stack.pop()
+            emit(ch)
+            cuts.append((size, list(stack)))
+            if not stack:
+                break
+        elif ch == ",":
+            cuts.append((size, list(stack)))
+            emit(ch)
+        elif ch.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            emit(_LITERALS.get(text[i:j], text[i:j]))
+            i = j
+            continue
+        else:
+            emit(ch)
+        i += 1
+
+    return "".join(out), cuts, stack, quote is not None
+
+
+def _close(text: str, stack: list) -> str:
+    text = text.rstrip()
+    # A key without a value cannot be completed; in an array the same text is a complete element.
+    if stack and stack[-1][0] == "{":
+        text = re.sub(r',\s*"[^"]*"\s*:?\s*$', "", text)
+    text = re.sub(r"[,:]\s*$", "", text)
+    return text + "".join(_CLOSERS[b] for b, _ in reversed(stack))
+
+
+def repair_json(text: str) -> Any:
+    """
+    Parse JSON out of an LLM response, repairing the usual defects locally.
+
+    Handles surrounding prose, ```json fences, single quotes, Python True/False/None,
+    trailing commas and output truncated mid-array (the incomplete trailing element is dropped).
+
+    Raises:
+        JSONRepairError: if nothing parseable remains
+    """
+    region = _json_region(text)
+    try:
+        return json.loads(region)
+    except json.JSONDecodeError:
+        pass
+
+    normalized, cuts, stack, in_string = _normalize(region)
+    candidates = []
+    if stack or in_string:
+        # Prefer dropping the incomplete trailing array element over keeping half of it.
+        between_elements = [(pos, open_) for pos, open_ in reversed(cuts)
+                            if open_ and open_[-1][0] == "[" and open_ == stack[:len(open_)]]
+        candidates += [_close(normalized[:pos], open_) for pos, open_ in between_elements]
+        candidates.append(_close(normalized + ('"' if in_string else ""), stack))
+        candidates += [_close(normalized[:pos], open_) for pos, open_ in reversed(cuts)]
+    else:
+        candidates.append(normalized)
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    raise JSONRepairError(f"Could not repair JSON from response starting with {text[:80]!r}")
+
+
+def validate_json(data: Any, schema=None) -> Any:
+    """
+    Validate parsed data against a pydantic model from get_json_schema; a list is validated
+    item by item. Returns plain data (model_dump) so callers keep working with dicts.
+
+    Raises:
+        JSONRepairError: if the data does not match the schema
+    """
+    if schema is None:
+        return data
+    try:
+        if isinstance(data, list):
+            return [schema.model_validate(item).model_dump() for item in data]
+        return schema.model_validate(data).model_dump()
+    except Exception as e:
+        raise JSONRepairError(f"Response does not match {schema.__name__}: {e}") from e
+
+
+def parse_json_response(text: str, schema=None, reask: Optional[Callable[[str, str], str]] = None,
+                        stats: RepairStats = repair_stats, unwrap: Optional[str] = None) -> Any:
+    """
+    Turn a model response into validated JSON, asking the model again only when local repair fails.
+
+    Args:
+        text (str): Raw model response
+        schema: Optional pydantic model (see gemini_agent.get_json_schema)
+        reask: Optional callable(original_text, error) -> new response text, used as the fallback
+        stats (RepairStats): Where clean / repaired / llm_fallbacks / failures are counted
+        unwrap (str): If the JSON is an object with this key, its value is what gets validated and returned
+
+    Returns:
+        The parsed (and validated) data
+
+    Raises:
+        JSONRepairError: if neither local repair nor the fallback produce valid JSON
+    """
+    def checked(data):
+        if unwrap is not None and isinstance(data, dict) and unwrap in data:
+            data = data[unwrap]
+        return validate_json(data, schema)
+
+    try:
+        data = checked(json.loads(text))
+        stats.count("clean")
+        return data
+    except (json.JSONDecodeError, TypeError, JSONRepairError):
+        pass
+
+    try:
+        data = checked(repair_json(text))
+        stats.count("repaired")
+        return data
+    except JSONRepairError as e:
+        error = str(e)
+
+    if reask is not None:
+        current_span().add("retries")
+        try:
+            data = checked(repair_json(reask(text, error)))
+        except JSONRepairError:
+            stats.count("failures")
+            raise
+        stats.count("llm_fallbacks")
+        return data
+
+    stats.count("failures")
+    raise JSONRepairError(error)
+
+
+if __name__ == "__main__":
+    # Truncated responses and what repair_json keeps of them.
+    cases = [
+        ('["a", "b", "c", "d', ["a", "b", "c"]),
+        ('{"ingredients": ["Step 1: A", "Step 2: B", "Step 3: C", "Step 4: D',
+         {"ingredients": ["Step 1: A", "Step 2: B", "Step 3: C"]}),
+        ('[{"step": 1, "function": "f"}, {"step": 2, "function": "g", "inputs"', [{"step": 1, "function": "f"}]),
+        ('{"a": 1, "b": ', {"a": 1}),
+        ('{"a": 1, "b"', {"a": 1}),
+        ('{"a": ["x", "y"], "b', {"a": ["x", "y"]}),
+        ('{"ingredients": ["A", "B"', {"ingredients": ["A", "B"]}),
+        ("[{'x': True}, {'x': None},", [{"x": True}, {"x": None}]),
+    ]
+    for text, expected in cases:
+        repaired = repair_json(text)
+        assert repaired == expected, (text, repaired)
+    print(f"{len(cases)} truncated responses repaired as expected")
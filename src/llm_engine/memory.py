@@ -0,0 +1,150 @@
+import re
+from typing import Callable, Dict, List, Optional
+
+Message = Dict[str, str]
+Summarizer = Callable[[List[Message], Optional[str]], str]
+
+_THINK_BLOCK = re.compile(r"<think>.*?</think>\s*", re.DOTALL)
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Rough token count (4 characters per token) used when a backend reports no usage."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def strip_reasoning(text: str) -> str:
+    """Drop R1-style <think>...</think> blocks, keeping only the final answer text."""
+    return _THINK_BLOCK.sub("", text)
+
+
+class ConversationMemory:
+    """
+    Decides which part of a conversation is sent to the model on each turn.
+
+    The system prompt and any pinned messages (e.g. the puzzle statement) are always sent.
+    The remaining turns are sent newest first until max_tokens is reached; turns that fall
+    out of the window are either dropped or, with a summarizer, folded into a running
+    summary that is sent right after the system prompt. Without max_tokens the whole
+    conversation is sent, which is the ChatAgent default.
+
+    Attributes:
+        max_tokens: Token budget for the messages sent per turn (None for no limit).
+        min_recent_messages: Newest messages always kept, even over budget.
+        summarizer: Optional callable(dropped_messages, previous_summary) -> new summary.
+        strip_reasoning: Send assistant turns without their <think> blocks.
+        token_counter: Function used to size messages.
+        summary: Current summary of compacted turns.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, min_recent_messages: int = 1,
+                 summarizer: Optional[Summarizer] = None, strip_reasoning: bool = False,
+                 token_counter: Callable[[str], int] = estimate_tokens) -> None:
+        self.max_tokens = max_tokens
+        self.min_recent_messages = min_recent_messages
+        self.summarizer = summarizer
+        self.strip_reasoning = strip_reasoning
+        self.token_counter = token_counter
+        self.pinned = {0}
+        self.summary: Optional[str] = None
+        self._summarized_upto = 0
+        self._contents: List[str] = []
+        self._tokens: List[int] = []
+
+    def pin(self, index: int) -> None:
+        """Always send the message at this position of the conversation history."""
+        self.pinned.add(index)
+
+    def reset(self) -> None:
+        self.pinned = {0}
+        self.summary = None
+        self._summarized_upto = 0
+        self._contents = []
+        self._tokens = []
+
+    def _sync(self, history: List[Message]) -> None:
+        # History only ever grows between resets, so sizes are computed once per message.
+        if len(history) < len(self._contents):
+            self._contents, self._tokens = [], []
+        for message in history[len(self._contents):]:
+            content = message["content"]
+            if self.strip_reasoning and message["role"] == "assistant":
+                content = strip_reasoning(content)
+            self._contents.append(content)
+            self._tokens.append(self.token_counter(content))
+
+    def _summary_message(self) -> Message:
+        return {"role": "system", "content": "Summary of the earlier conversation:\n" + self.summary}
+
+    def build(self, history: List[Message]) -> List[Message]:
+        """
+        Messages to send for the next model call.
+
+        Args:
+            history (list): Full conversation, ending with the new user message
+
+        Returns:
+            list: Pinned messages, the summary (if any) and the newest turns that fit the budget
+        """
+        self._sync(history)
+        pinned = sorted(i for i in self.pinned if i < len(history))
+        if self.max_tokens is None:
+            window_start = 0
+        else:
+            budget = self.max_tokens - sum(self._tokens[i] for i in pinned)
+            if self.summary:
+                budget -= self.token_counter(self.summary)
+            window_start = len(history)
+            kept = 0
+            for i in range(len(history) - 1, -1, -1):
+                if i in self.pinned:
+                    continue
+                if kept >= self.min_recent_messages and self._tokens[i] > budget:
+                    break
+                budget -= self._tokens[i]
+                kept += 1
+                window_start = i
+            # Never open the window on an orphaned assistant reply.
+            while window_start < len(history) - 1 and history[window_start]["role"] == "assistant":
+                window_start += 1
+            # Turns already folded into the summary are not sent again, even if they would fit now.
+            window_start = max(window_start, self._summarized_upto)
+
+            if self.summarizer is not None and window_start > self._summarized_upto:
+                dropped = [{"role": history[i]["role"], "content": self._contents[i]}
+                           for i in range(self._summarized_upto, window_start) if i not in self.pinned]
+                if dropped:
+                    self.summary = self.summarizer(dropped, self.summary)
+                self._summarized_upto = window_start
+
+        messages = [{"role": history[i]["role"], "content": self._contents[i]} for i in pinned if i < window_start]
+        if self.summary and window_start > 0:
+            messages.insert(1 if messages and pinned[0] == 0 else 0, self._summary_message())
+        messages += [{"role": history[i]["role"], "content": self._contents[i]}
+                     for i in range(window_start, len(history))]
+        return messages
+
+
+SUMMARY_PROMPT = """Summarize the conversation below for a logic-puzzle solver that will continue it.
+Keep every deduction, eliminated option and established assignment; drop reasoning that was retracted.
+Return only the summary."""
+
+
+def ollama_summarizer(model_name: str, max_chars: int = 4000) -> Summarizer:
+    """
+    Summarizer for ConversationMemory that asks an ollama model to compact dropped turns.
+
+    Args:
+        model_name (str): Model used for summarization (can be smaller than the chat model)
+        max_chars (int): Summaries are truncated to this length to keep their cost bounded
+    """
+    def summarize(messages: List[Message], previous_summary: Optional[str]) -> str:
+        from ollama import chat
+
+        transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        if previous_summary:
+            transcript = f"Earlier summary:\n{previous_summary}\n\n{transcript}"
+        response = chat(model=model_name, messages=[{"role": "system", "content": SUMMARY_PROMPT},
+                                                    {"role": "user", "content": transcript}])
+        return strip_reasoning(response["message"]["content"])[:max_chars]
+
+    return summarize
@@ -0,0 +1,247 @@
+import inspect
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.llm_engine.memory import estimate_tokens
+
+_STEP_START = re.compile(r"^\s*(?:\*\*)?(?:step\s*)?\d+[.):]", re.IGNORECASE)
+# Distance from 0 or 1 within which a cell is written as decided.
+_DECIDED = 1e-9
+
+
+class PromptBuilder:
+    """
+    Assembles a prompt from named sections under a token budget.
+
+    Each section is a list of pieces (e.g. deduction steps or matrix blocks). Required
+    sections are always kept whole; when the prompt is over budget, pieces are dropped from
+    the optional sections, the section added last first, until it fits. report() gives the
+    token count of every section as sent, so the size of a request is known before it is made.
+
+    Attributes:
+        max_tokens: Budget for the whole prompt (None for no limit).
+        token_counter: Function used to size text.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, token_counter: Callable[[str], int] = estimate_tokens) -> None:
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self._sections: List[dict] = []
+
+    def add(self, name: str, content, required: bool = False, header: Optional[str] = None,
+            keep: str = "first", joiner: str = "\n") -> "PromptBuilder":
+        """
+        Add a section.
+
+        Args:
+            name (str): Section name used in the report
+            content (str or list): Text, or pieces that may be dropped one by one
+            required (bool): Never drop anything from this section
+            header (str): Line written before the section's pieces (kept while any piece is)
+            keep (str): "first" drops pieces from the end, "last" from the start
+            joiner (str): Separator between pieces
+        """
+        pieces = [content] if isinstance(content, str) else list(content)
+        self._sections.append({"name": name, "pieces": [p for p in pieces if p], "required": required,
+                               "header": header, "keep": keep, "joiner": joiner, "dropped": 0})
+        return self
+
+    def _render(self, section: dict) -> str:
+        if not section["pieces"]:
+            return ""
+        body = section["joiner"].join(section["pieces"])
+        return f"{section['header']}\n{body}" if section["header"] else body
+
+    def _total(self) -> int:
+        return sum(self.token_counter(self._render(s)) for s in self._sections)
+
+    def build(self) -> str:
+        """The prompt text, with optional pieces dropped as needed to meet the budget."""
+        if self.max_tokens is not None:
+            for section in reversed(self._sections):
+                if section["required"]:
+                    continue
+                while section["pieces"] and self._total() > self.max_tokens:
+                    section["pieces"].pop(-1 if section["keep"] == "first" else 0)
+                    section["dropped"] += 1
+        return "\n\n".join(text for text in (self._render(s) for s in self._sections) if text)
+
+    def report(self) -> Dict[str, Dict[str, int]]:
+        """Tokens, pieces kept and pieces dropped per section, plus the total."""
+        report = {s["name"]: {"tokens": self.token_counter(self._render(s)), "pieces": len(s["pieces"]),
+                              "dropped": s["dropped"]} for s in self._sections}
+        report["total"] = {"tokens": sum(r["tokens"] for r in report.values()),
+                           "pieces": sum(r["pieces"] for r in report.values()),
+                           "dropped": sum(r["dropped"] for r in report.values())}
+        return report
+
+
+def category_labels(categories: Sequence[str], cat_topics: Sequence[str]) -> Dict[str, List[str]]:
+    """Item labels per topic, from the same inputs as utils.initialize_probability_tables."""
+    return {topic: [item.strip() for item in items.split(", ")] for topic, items in zip(cat_topics, categories)}
+
+
+def _pair(name: str) -> Tuple[str, str]:
+    first, _, second = name.partition("__x__")
+    return first, second
+
+
+def _format_value(value: float, precision: int) -> str:
+    # Certain and eliminated cells are the most common ones once a puzzle is under way.
+    if abs(value) <= _DECIDED or abs(value - 1) <= _DECIDED:
+        return str(int(round(value)))
+    # An undecided cell that rounds to 0 or 1 gets the digits that tell it apart from a decided one.
+    text = f"{value:.{precision}f}"
+    while float(text) in (0.0, 1.0) and precision < 9:
+        precision += 1
+        text = f"{value:.{precision}f}"
+    return text.lstrip("0")
+
+
+def serialize_matrix(name: str, matrix: np.ndarray, labels: Dict[str, List[str]], precision: int = 2,
+                     only_non_uniform: bool = True) -> str:
+    """
+    Compact text form of one probability matrix.
+
+    The header names the columns by index once; each row then starts with its index and
+    item name followed by its values at fixed precision (1 and 0 for decided cells). Rows
+    whose cells all hold the uniform value are left out, and a matrix with no other row
+    is written as a single "uniform" line.
+    """
+    first, second = _pair(name)
+    matrix = np.asarray(matrix)
+    rows = labels.get(first) or [str(i) for i in range(matrix.shape[0])]
+    cols = labels.get(second) or [str(j) for j in range(matrix.shape[1])]
+    uniform = 1 / max(matrix.shape)
+    tolerance = 0.5 * 10 ** -precision
+
+    lines = []
+    for i, row in enumerate(matrix):
+        if only_non_uniform and np.all(np.abs(row - uniform) < tolerance):
+            continue
+        lines.append(f"  {i}={rows[i]}: " + " ".join(_format_value(value, precision) for value in row))
+
+    header = f"{name} (rows {first}; cols {second}: " + ", ".join(f"{j}={label}" for j, label in enumerate(cols)) + ")"
+    if not lines:
+        return f"{header}: uniform {_format_value(uniform, precision)}"
+    return "\n".join([header] + lines)
+
+
+def serialize_matrices(matrices: Dict[str, np.ndarray], labels: Dict[str, List[str]], precision: int = 2,
+                       only_non_uniform: bool = True) -> List[str]:
+    """One serialize_matrix block per matrix, in dictionary order."""
+    return [serialize_matrix(name, matrix, labels, precision, only_non_uniform) for name, matrix in matrices.items()]
+
+
+def split_steps(deductions: str) -> List[str]:
+    """Split a deduction text into its numbered steps (text before the first step is kept as its own piece)."""
+    steps: List[List[str]] = []
+    for line in deductions.strip().splitlines():
+        if _STEP_START.match(line) or not steps:
+            steps.append([line])
+        else:
+            steps[-1].append(line)
+    return ["\n".join(step).strip() for step in steps if "".join(step).strip()]
+
+
+def _label_patterns(labels: Dict[str, List[str]]) -> List[Tuple[str, int, "re.Pattern"]]:
+    return [(topic, index, re.compile(r"(?<!\w)" + re.escape(label) + r"(?!\w)", re.IGNORECASE))
+            for topic, items in labels.items() for index, label in enumerate(items)]
+
+
+def reflected_steps(steps: Iterable[str], matrices: Dict[str, np.ndarray], labels: Dict[str, List[str]],
+                    decided: float = 0.01) -> List[bool]:
+    """
+    For each step, whether the matrices already record everything it says: the step names
+    items of at least two categories and every such pair is a cell at (about) 0 or 1.
+    Steps that name no cross-category pair are never considered reflected.
+    """
+    patterns = _label_patterns(labels)
+    positions = {}
+    for name, matrix in matrices.items():
+        first, second = _pair(name)
+        positions[first, second] = (matrix, False)
+        positions[second, first] = (matrix, True)
+
+    flags = []
+    for step in steps:
+        # The step number itself would match numeric items such as "1".
+        text = _STEP_START.sub("", step, count=1)
+        mentioned = [(topic, index) for topic, index, pattern in patterns if pattern.search(text)]
+        pairs = [(a, b) for k, a in enumerate(mentioned) for b in mentioned[k + 1:] if a[0] != b[0]]
+        known = True
+        for (topic_a, i), (topic_b, j) in pairs:
+            matrix, transposed = positions.get((topic_a, topic_b), (None, False))
+            if matrix is None:
+                known = False
+                break
+            value = matrix[j, i] if transposed else matrix[i, j]
+            if decided < value < 1 - decided:
+                known = False
+                break
+        flags.append(bool(pairs) and known)
+    return flags
+
+
+def compact_tool_descriptions(tools: Dict[str, Callable]) -> List[str]:
+    """Signature plus the first paragraph of the docstring for every tool, instead of the full docstring."""
+    descriptions = []
+    for name, fn in tools.items():
+        doc = inspect.getdoc(fn) or ""
+        summary = " ".join(doc.split("\n\n")[0].split())
+        descriptions.append(f"{name}{inspect.signature(inspect.unwrap(fn))}: {summary}")
+    return descriptions
+
+
+PROB_AGENT_1_JOB = """You are given a set of logical deductions to solve a problem and the current probability matrices.
+Use the deductions to give weight to the item pairs. Every matrix lists its columns by index and each row
+as "index=item: values" in column order; rows not listed still hold the uniform value."""
+
+
+def build_prob_agent_1_job(llm_agent_response: str, matrices: Dict[str, np.ndarray], labels: Dict[str, List[str]],
+                           max_tokens: Optional[int] = None, precision: int = 2,
+                           drop_reflected: bool = True) -> Tuple[str, Dict[str, Dict[str, int]]]:
+    """
+    Prompt for prob_agent_1 built under a token budget.
+
+    Matrices are serialized compactly and deduction steps that the matrices already
+    reflect are left out. Over budget, the oldest remaining deductions are dropped first
+    (the newest ones carry the state the matrices do not have yet), then matrix blocks.
+
+    Returns:
+        tuple: (prompt text, PromptBuilder.report())
+    """
+    steps = split_steps(llm_agent_response)
+    if drop_reflected:
+        steps = [step for step, known in zip(steps, reflected_steps(steps, matrices, labels)) if not known]
+
+    builder = PromptBuilder(max_tokens)
+    builder.add("instructions", PROB_AGENT_1_JOB, required=True)
+    builder.add("matrices", serialize_matrices(matrices, labels, precision), header="Probability matrices:")
+    builder.add("deductions", steps, header="Logical step-by-step deductions:", keep="last")
+    prompt = builder.build()
+    return prompt, builder.report()
+
+
+def build_prob_agent_2_system_prompt(system_prompt: str, tools: Dict[str, Callable],
+                                     max_tokens: Optional[int] = None) -> Tuple[str, Dict[str, Dict[str, int]]]:
+    """
+    prob_agent_2 system prompt with compact tool descriptions in place of the full docstrings.
+
+    Args:
+        system_prompt (str): Prompt text; a "{tool_descriptions}" placeholder is filled in, otherwise the tools are appended
+        tools (dict): Tool name -> function, e.g. ToolRegistry.tools
+
+    Returns:
+        tuple: (prompt text, PromptBuilder.report())
+    """
+    builder = PromptBuilder(max_tokens)
+    head, placeholder, tail = system_prompt.partition("{tool_descriptions}")
+    builder.add("instructions", head.strip(), required=True)
+    builder.add("tools", compact_tool_descriptions(tools), required=True)
+    if placeholder and tail.strip():
+        builder.add("instructions_tail", tail.strip(), required=True)
+    prompt = builder.build()
+    return prompt, builder.report()
@@ -0,0 +1,546 @@
+"""
+Offline stand-in for the LLM endpoints, for reproducible load tests.
+
+ReplayServer answers the requests Agent/AsyncAgent (through ReplayClient, which mimics the
+google.genai client) and ChatAgent (through ReplayServer.chat, which mimics ollama.chat)
+would send. Requests are keyed with ResponseCache.make_key exactly like the agents key
+their own cache, so a cache recorded by live runs is replayed as is; requests that were
+never recorded get a templated or synthetic answer. Latency, rate limits and errors are
+injected from a seeded random generator drawn per request key, so a run is repeatable
+regardless of the order in which concurrent requests arrive.
+
+Usage:
+    server = ReplayServer(ResponseCache("runs/live.sqlite"), latency=LatencyModel("lognormal", 0.8, 0.4),
+                          error_rate=0.02, rps=10)
+    gemini_agent.set_client(ReplayClient(server))       # every Agent created afterwards
+    agent = ChatAgent("deepseek-r1", chat_fn=server.chat)
+
+    python -m src.llm_engine.replay --requests 500 --concurrency 32 --latency lognormal:0.5:0.5:0.002
+"""
+import argparse
+import asyncio
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import numpy as np
+
+from src.llm_engine.memory import estimate_tokens
+from src.llm_engine.response_cache import ResponseCache
+
+Request = Dict[str, Any]
+
+_WORDS = ("the", "clue", "item", "category", "therefore", "must", "cannot", "match", "position", "answer",
+          "so", "second", "first", "next", "is", "not", "with", "each", "one", "step")
+
+
+class ReplayError(RuntimeError):
+    """Injected server error; status mirrors the HTTP code a live endpoint would return."""
+
+    def __init__(self, message: str, status: int = 503) -> None:
+        super().__init__(f"{status} {message}")
+        self.status = status
+
+
+class RateLimitError(ReplayError):
+    """Injected 429: the request exceeded the configured rate limit."""
+
+    def __init__(self, message: str = "RESOURCE_EXHAUSTED (replay rate limit)") -> None:
+        super().__init__(message, status=429)
+
+
+class LatencyModel:
+    """
+    Response time of a request: time to first token drawn from a distribution, plus a fixed
+    time per output token.
+
+    Attributes:
+        distribution: "constant", "uniform" (median * (1 +- spread)), "lognormal" (median * e^(spread * N(0, 1)))
+                      or "exponential" (with the given median)
+        median: Median time to first token in seconds
+        spread: Shape parameter of the distribution
+        per_token: Seconds per output token
+    """
+
+    DISTRIBUTIONS = ("constant", "uniform", "lognormal", "exponential")
+
+    def __init__(self, distribution: str = "constant", median: float = 0.0, spread: float = 0.0,
+                 per_token: float = 0.0) -> None:
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {self.DISTRIBUTIONS}, got {distribution!r}")
+        self.distribution = distribution
+        self.median = median
+        self.spread = spread
+        self.per_token = per_token
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "LatencyModel":
+        """Parse "distribution:median[:spread[:per_token]]", e.g. "lognormal:0.8:0.5:0.002"; a bare number is constant."""
+        parts = spec.split(":")
+        if len(parts) == 1:
+            return cls("constant", float(parts[0]))
+        return cls(parts[0], *(float(p) for p in parts[1:]))
+
+    def first_token(self, rng: random.Random) -> float:
+        if self.distribution == "uniform":
+            return max(0.0, self.median * (1 + self.spread * (2 * rng.random() - 1)))
+        if self.distribution == "lognormal":
+            return self.median * math.exp(self.spread * rng.gauss(0.0, 1.0))
+        if self.distribution == "exponential":
+            return rng.expovariate(math.log(2) / self.median) if self.median > 0 else 0.0
+        return self.median
+
+
+class _TokenBucket:
+    """Allows `rate` requests per second on average with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, wait: bool) -> Optional[float]:
+        """Seconds to wait before the request may proceed (0 if it may go now), or None if it is rejected."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            if not wait:
+                return None
+            # The request takes the next token as it is refilled.
+            self._tokens -= 1
+            return -self._tokens / self.rate
+
+
+class _Reply:
+    __slots__ = ("text", "prompt_tokens", "output_tokens", "first_token_s", "per_token_s", "source", "error")
+
+    def __init__(self, text, prompt_tokens, output_tokens, first_token_s, per_token_s, source, error=None):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.first_token_s = first_token_s
+        self.per_token_s = per_token_s
+        self.source = source
+        self.error = error
+
+    @property
+    def latency_s(self) -> float:
+        return self.first_token_s + self.per_token_s * self.output_tokens
+
+
+def synthetic_responder(min_tokens: int = 40, max_tokens: int = 400) -> Callable[[Request], str]:
+    """
+    Responder producing filler text of a random length (a JSON empty list when the request
+    has a response schema), for load tests that only need realistic sizes and timings.
+    """
+    def respond(request: Request) -> str:
+        if request.get("json_schema") is not None:
+            return "[]"
+        rng = request["rng"]
+        target = rng.randint(min_tokens, max_tokens)
+        words: List[str] = []
+        while estimate_tokens(" ".join(words)) < target:
+            words.append(rng.choice(_WORDS))
+        return " ".join(words)
+
+    return respond
+
+
+class TemplateResponder:
+    """
+    Answers requests whose last user message matches a pattern from a template.
+
+    Rules are tried in order; a template is a str formatted with the pattern's named groups
+    or a callable(request, match) -> str. Requests no rule matches go to the fallback.
+    """
+
+    def __init__(self, rules: List[Tuple[str, Any]], fallback: Optional[Callable[[Request], str]] = None) -> None:
+        self.rules = [(re.compile(pattern, re.DOTALL), template) for pattern, template in rules]
+        self.fallback = fallback if fallback is not None else synthetic_responder()
+
+    def __call__(self, request: Request) -> str:
+        prompt = request["history"][-1]["content"] if request["history"] else ""
+        for pattern, template in self.rules:
+            match = pattern.search(prompt)
+            if match:
+                return template(request, match) if callable(template) else template.format(**match.groupdict())
+        return self.fallback(request)
+
+
+class ReplayServer:
+    """
+    Serves recorded, templated or synthetic responses with injected latency, rate limits and errors.
+
+    Attributes:
+        cache: ResponseCache holding recorded responses (None to answer everything from the responder)
+        responder: Callable(request) -> text for requests that were not recorded
+        latency: LatencyModel applied to every response
+        error_rate: Fraction of requests failing with ReplayError (503)
+        sleep: False to report latencies without actually waiting (pure throughput tests)
+        stats: Counters and the latency of every answered request
+    """
+
+    def __init__(self, cache: Optional[ResponseCache] = None, responder: Optional[Callable[[Request], str]] = None,
+                 latency: Optional[LatencyModel] = None, error_rate: float = 0.0, rps: Optional[float] = None,
+                 burst: Optional[float] = None, on_limit: str = "reject", seed: int = 0, sleep: bool = True) -> None:
+        if on_limit not in ("reject", "wait"):
+            raise ValueError(f"on_limit must be 'reject' or 'wait', got {on_limit!r}")
+        self.cache = cache
+        self.responder = responder if responder is not None else synthetic_responder()
+        self.latency = latency if latency is not None else LatencyModel()
+        self.error_rate = error_rate
+        self.on_limit = on_limit
+        self.seed = seed
+        self.sleep = sleep
+        self._bucket = _TokenBucket(rps, burst) if rps else None
+        self._lock = threading.Lock()
+        self._occurrences: Dict[str, int] = {}
+        self.reset_stats()
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "ReplayServer":
+        """
+        Server from "<cache path>?latency=lognormal:0.8:0.5&error_rate=0.02&rps=5&burst=10&on_limit=wait&seed=1"
+        (every part optional), as used by the benchmark's "replay:" backend.
+        """
+        path, _, query = spec.partition("?")
+        options = dict(parse_qsl(query))
+        unknown = set(options) - {"latency", "error_rate", "rps", "burst", "on_limit", "seed", "sleep"}
+        if unknown:
+            raise ValueError(f"Unknown replay options: {sorted(unknown)}")
+        return cls(cache=ResponseCache(path) if path else None,
+                   latency=LatencyModel.from_spec(options["latency"]) if "latency" in options else None,
+                   error_rate=float(options.get("error_rate", 0.0)),
+                   rps=float(options["rps"]) if "rps" in options else None,
+                   burst=float(options["burst"]) if "burst" in options else None,
+                   on_limit=options.get("on_limit", "reject"),
+                   seed=int(options.get("seed", 0)),
+                   sleep=options.get("sleep", "1") not in ("0", "false"))
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = {"requests": 0, "recorded": 0, "synthetic": 0, "errors": 0, "rate_limited": 0,
+                          "latencies": []}
+
+    def summary(self) -> Dict[str, float]:
+        """Request counters plus mean and p50/p95/p99 latency in seconds."""
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = np.array(stats.pop("latencies"), dtype=float)
+        if latencies.size:
+            stats["mean_s"] = float(latencies.mean())
+            for q in (50, 95, 99):
+                stats[f"p{q}_s"] = float(np.percentile(latencies, q))
+        return stats
+
+    def _count(self, key: str, value: Any = 1) -> None:
+        with self._lock:
+            if key == "latencies":
+                self.stats[key].append(value)
+            else:
+                self.stats[key] += value
+
+    def _rng(self, key: str) -> random.Random:
+        # One stream per (key, repetition): repeated requests (e.g. retries) get fresh draws in a fixed order.
+        with self._lock:
+            occurrence = self._occurrences.get(key, 0)
+            self._occurrences[key] = occurrence + 1
+        return random.Random(f"{self.seed}:{key}:{occurrence}")
+
+    def _prepare(self, model: str, history: List[Dict[str, str]], config: Any = None,
+                 system_prompt: Optional[str] = None, json_schema: Any = None) -> Tuple[_Reply, float]:
+        """Decide the outcome of a request; returns the reply and the rate-limit wait before it."""
+        self._count("requests")
+        key = ResponseCache.make_key(model=model, config=config, system_prompt=system_prompt,
+                                     json_schema=json_schema, history=history)
+        rng = self._rng(key)
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in history) + estimate_tokens(system_prompt)
+        first_token_s = self.latency.first_token(rng)
+
+        wait = self._bucket.take(self.on_limit == "wait") if self._bucket is not None else 0.0
+        if wait is None:
+            self._count("rate_limited")
+            return _Reply(None, prompt_tokens, 0, 0.0, 0.0, "rate_limited", RateLimitError()), 0.0
+        if rng.random() < self.error_rate:
+            self._count("errors")
+            return _Reply(None, prompt_tokens, 0, first_token_s, 0.0, "error",
+                          ReplayError("UNAVAILABLE (injected replay error)")), wait
+
+        text = self.cache.get(key) if self.cache is not None else None
+        source = "recorded" if text is not None else "synthetic"
+        if text is None:
+            text = self.responder({"key": key, "model": model, "system_prompt": system_prompt,
+                                   "json_schema": json_schema, "history": history, "rng": rng})
+        self._count(source)
+        reply = _Reply(text, prompt_tokens, estimate_tokens(text), first_token_s, self.latency.per_token, source)
+        self._count("latencies", wait + reply.latency_s)
+        return reply, wait
+
+    def _pause(self, seconds: float) -> None:
+        if self.sleep and seconds > 0:
+            time.sleep(seconds)
+
+    async def _apause(self, seconds: float) -> None:
+        if self.sleep and seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def respond(self, model: str, history: List[Dict[str, str]], config: Any = None,
+                system_prompt: Optional[str] = None, json_schema: Any = None) -> _Reply:
+        """Answer one request, blocking for its latency; raises the injected error if there is one."""
+        reply, wait = self._prepare(model, history, config, system_prompt, json_schema)
+        self._pause(wait + reply.latency_s)
+        if reply.error is not None:
+            raise reply.error
+        return reply
+
+    async def respond_async(self, model: str, history: List[Dict[str, str]], config: Any = None,
+                            system_prompt: Optional[str] = None, json_schema: Any = None) -> _Reply:
+        reply, wait = self._prepare(model, history, config, system_prompt, json_schema)
+        await self._apause(wait + reply.latency_s)
+        if reply.error is not None:
+            raise reply.error
+        return reply
+
+    def stream(self, model: str, history: List[Dict[str, str]], config: Any = None,
+               system_prompt: Optional[str] = None, json_schema: Any = None):
+        """Like respond, but yields (text piece, reply) pairs paced like a streamed response."""
+        reply, wait = self._prepare(model, history, config, system_prompt, json_schema)
+        self._pause(wait + reply.first_token_s)
+        if reply.error is not None:
+            raise reply.error
+        for piece in _pieces(reply.text):
+            self._pause(reply.per_token_s * estimate_tokens(piece))
+            yield piece, reply
+
+    async def stream_async(self, model: str, history: List[Dict[str, str]], config: Any = None,
+                           system_prompt: Optional[str] = None, json_schema: Any = None):
+        reply, wait = self._prepare(model, history, config, system_prompt, json_schema)
+        await self._apause(wait + reply.first_token_s)
+        if reply.error is not None:
+            raise reply.error
+        for piece in _pieces(reply.text):
+            await self._apause(reply.per_token_s * estimate_tokens(piece))
+            yield piece, reply
+
+    def chat(self, model: str, messages: List[Dict[str, str]], stream: bool = False, **kwargs):
+        """
+        Drop-in for ollama.chat as ChatAgent calls it (ChatAgent(..., chat_fn=server.chat)).
+
+        Returns:
+            dict: ollama-style response with message, done, prompt_eval_count and eval_count,
+                  or with stream=True an iterator of such chunks (counts on the last one)
+        """
+        system_prompt = messages[0]["content"] if messages and messages[0]["role"] == "system" else None
+        if stream:
+            return self._chat_chunks(model, messages, system_prompt)
+        reply = self.respond(model, messages, system_prompt=system_prompt)
+        return _ollama_chunk(model, reply.text, reply)
+
+    def _chat_chunks(self, model, messages, system_prompt):
+        last = None
+        for piece, reply in self.stream(model, messages, system_prompt=system_prompt):
+            if last is not None:
+                yield _ollama_chunk(model, last)
+            last = piece
+        yield _ollama_chunk(model, last or "", reply)
+
+
+def _pieces(text: str, words: int = 4) -> List[str]:
+    """Split text into stream chunks of a few words, keeping the whitespace."""
+    tokens = re.findall(r"\S+\s*|\s+", text)
+    return ["".join(tokens[i:i + words]) for i in range(0, len(tokens), words)] or [text]
+
+
+def _ollama_chunk(model: str, content: str, reply: Optional[_Reply] = None) -> Dict[str, Any]:
+    chunk = {"model": model, "message": {"role": "assistant", "content": content}, "done": reply is not None}
+    if reply is not None:
+        chunk.update(prompt_eval_count=reply.prompt_tokens, eval_count=reply.output_tokens)
+    return chunk
+
+
+# ----------------------------------------------------------------------------
+# google.genai client facade
+# ----------------------------------------------------------------------------
+
+class _Usage:
+    __slots__ = ("prompt_token_count", "candidates_token_count")
+
+    def __init__(self, prompt_token_count: int, candidates_token_count: int) -> None:
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class _Response:
+    """The parts of a GenerateContentResponse the agents read: text and usage_metadata."""
+
+    __slots__ = ("text", "usage_metadata")
+
+    def __init__(self, text: Optional[str], reply: Optional[_Reply] = None) -> None:
+        self.text = text
+        self.usage_metadata = _Usage(reply.prompt_tokens, reply.output_tokens) if reply is not None else None
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(part.text or "" for part in content.parts or [])
+
+
+class _ReplayChat:
+    """Chat session with the genai Chat interface; keeps role/content history the way the agents key it."""
+
+    def __init__(self, server: ReplayServer, model: str, config: Any = None, history: Optional[list] = None) -> None:
+        self.server = server
+        self.model = model
+        self.config = config
+        roles = {"user": "user", "model": "assistant"}
+        self.history = [{"role": roles.get(content.role, content.role), "content": _content_text(content)}
+                        for content in history or []]
+
+    def _request(self, message: Any) -> Dict[str, Any]:
+        history = self.history + [{"role": "user", "content": _content_text(message)}]
+        return {"model": self.model, "history": history, "config": self.config,
+                "system_prompt": getattr(self.config, "system_instruction", None),
+                "json_schema": getattr(self.config, "response_schema", None)}
+
+    def _commit(self, request: Dict[str, Any], text: str) -> None:
+        self.history = request["history"] + [{"role": "assistant", "content": text}]
+
+    def send_message(self, message: Any) -> _Response:
+        request = self._request(message)
+        reply = self.server.respond(**request)
+        self._commit(request, reply.text)
+        return _Response(reply.text, reply)
+
+    def send_message_stream(self, message: Any):
+        request = self._request(message)
+        parts, reply = [], None
+        for piece, reply in self.server.stream(**request):
+            parts.append(piece)
+            yield _Response(piece)
+        # Like the genai SDK, the turn is kept only once the stream was read to the end.
+        self._commit(request, "".join(parts))
+        yield _Response(None, reply)
+
+
+class _AsyncReplayChat(_ReplayChat):
+    """Chat session with the genai AsyncChat interface."""
+
+    async def send_message(self, message: Any) -> _Response:
+        request = self._request(message)
+        reply = await self.server.respond_async(**request)
+        self._commit(request, reply.text)
+        return _Response(reply.text, reply)
+
+    async def send_message_stream(self, message: Any):
+        request = self._request(message)
+
+        async def chunks():
+            parts, reply = [], None
+            async for piece, reply in self.server.stream_async(**request):
+                parts.append(piece)
+                yield _Response(piece)
+            self._commit(request, "".join(parts))
+            yield _Response(None, reply)
+
+        return chunks()
+
+
+class _Chats:
+    def __init__(self, server: ReplayServer, chat_cls: type) -> None:
+        self._server = server
+        self._chat_cls = chat_cls
+
+    def create(self, model: str, config: Any = None, history: Optional[list] = None) -> _ReplayChat:
+        return self._chat_cls(self._server, model, config, history)
+
+
+class _Aio:
+    def __init__(self, server: ReplayServer) -> None:
+        self.chats = _Chats(server, _AsyncReplayChat)
+
+
+class ReplayClient:
+    """Stand-in for google.genai.Client (client.chats and client.aio.chats) backed by a ReplayServer."""
+
+    def __init__(self, server: ReplayServer) -> None:
+        self.server = server
+        self.chats = _Chats(server, _ReplayChat)
+        self.aio = _Aio(server)
+
+
+def install(server: ReplayServer):
+    """Make every Agent/AsyncAgent created without an explicit client use the server; returns the previous client."""
+    from src.llm_engine.gemini_agent import set_client
+
+    return set_client(ReplayClient(server))
+
+
+async def load_test(server: ReplayServer, requests: int = 200, concurrency: int = 16,
+                    stream: bool = False) -> Dict[str, Any]:
+    """
+    Send independent single-turn requests through AsyncAgent with at most `concurrency` in flight.
+
+    Returns:
+        dict: server.summary() plus wall time, throughput (successful requests per second)
+              and the client-side p50/p95/p99 request time
+    """
+    from src.llm_engine.concurrency import gather_bounded
+    from src.llm_engine.gemini_agent import AsyncAgent
+
+    client = ReplayClient(server)
+
+    async def one(index: int) -> float:
+        agent = AsyncAgent(agent_name="load_test", system_prompt="You are an AI assistant", client=client)
+        start = time.perf_counter()
+        if stream:
+            async for _ in agent.stream_action(f"request {index}"):
+                pass
+        else:
+            await agent.perform_action(f"request {index}")
+        return time.perf_counter() - start
+
+    server.reset_stats()
+    start = time.perf_counter()
+    results = await gather_bounded(range(requests), one, concurrency=concurrency)
+    wall_s = time.perf_counter() - start
+    times = np.array([r for r in results if not isinstance(r, BaseException)], dtype=float)
+    summary = server.summary()
+    summary.update(wall_s=wall_s, ok=int(times.size), failed=requests - int(times.size),
+                   throughput_rps=times.size / wall_s if wall_s else 0.0)
+    if times.size:
+        for q in (50, 95, 99):
+            summary[f"client_p{q}_s"] = float(np.percentile(times, q))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test of the agents against a replay server")
+    parser.add_argument("--cache", default=None, help="ResponseCache database with recorded responses")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", default="0", help="distribution:median[:spread[:per_token]], e.g. lognormal:0.5:0.5:0.002")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rps", type=float, default=None, help="rate limit in requests per second")
+    parser.add_argument("--burst", type=float, default=None)
+    parser.add_argument("--wait", action="store_true", help="queue rate-limited requests instead of failing them with 429")
+    parser.add_argument("--stream", action="store_true", help="use stream_action instead of perform_action")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = ReplayServer(ResponseCache(args.cache) if args.cache else None, latency=LatencyModel.from_spec(args.latency),
+                          error_rate=args.error_rate, rps=args.rps, burst=args.burst,
+                          on_limit="wait" if args.wait else "reject", seed=args.seed)
+    summary = asyncio.run(load_test(server, args.requests, args.concurrency, args.stream))
+    for key, value in summary.items():
+        print(f"{key:16s} {value:.4f}" if isinstance(value, float) else f"{key:16s} {value}")
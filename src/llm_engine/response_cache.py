@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+def _describe(value: Any) -> Any:
+    """Turn configs and schemas into plain JSON-able data so they can be hashed stably."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): _describe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_describe(v) for v in value]
+    if isinstance(value, type) and hasattr(value, "model_json_schema"):
+        return value.model_json_schema()
+    if hasattr(value, "model_dump"):
+        return _describe(value.model_dump(exclude_none=True))
+    return repr(value)
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of LLM responses backed by SQLite.
+
+    Responses are keyed by a hash of everything that determines them (model name,
+    generation config, system prompt, JSON schema and the full conversation), so
+    re-running a pipeline with unchanged prompts at temperature 0 is served from disk.
+    The least recently used entries are evicted once max_entries or max_bytes is exceeded.
+    Every method holds one lock, so a cache can be shared between threads (AsyncAgent calls
+    it from worker threads).
+
+    Attributes:
+        path: Location of the SQLite database.
+        bypass: When True lookups are skipped (fresh responses are still stored).
+        hits, misses, bypassed: Counters for this process.
+    """
+
+    def __init__(self, path: str = ".llm_cache.sqlite", max_entries: int = 100_000,
+                 max_bytes: Optional[int] = None, bypass: bool = False) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   response TEXT NOT NULL,
+                   size INTEGER NOT NULL,
+                   last_access REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, config: Any = None, system_prompt: Optional[str] = None,
+                 json_schema: Any = None, history: Optional[List[Dict[str, str]]] = None) -> str:
+        """
+        Hash the inputs of an LLM call into a cache key.
+
+        Args:
+            model (str): Model name
+            config: Generation config (pydantic model, dict or None); an embedded response_schema is ignored
+            system_prompt (str): System prompt
+            json_schema: Response schema (pydantic class, dict or None)
+            history (list): Full conversation including the new user message, as role/content dicts
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        config = _describe(config)
+        if isinstance(config, dict):
+            config.pop("response_schema", None)
+        payload = {
+            "model": model,
+            "config": config,
+            "system_prompt": system_prompt,
+            "json_schema": _describe(json_schema),
+            "history": history or [],
+        }
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=repr)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on a miss or when bypassing."""
+        with self._lock:
+            if self.bypass:
+                self.bypassed += 1
+                return None
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """Store a response and evict least recently used entries beyond the size limits."""
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self.max_bytes is not None and total > self.max_bytes:
+            excess = total - self.max_bytes
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+            doomed = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                doomed.append((key,))
+                excess -= size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for this process plus the current size of the cache."""
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+                "entries": count, "bytes": total}
+
+    def clear(self) -> None:
+        """Delete every cached response."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
@@ -1,35 +1,34 @@
-import os
-import warnings
-import json
-import inspect
-
 import logging
-from pprint import pprint
-from dotenv import load_dotenv
-from tqdm import tqdm
-from typing import List, Dict, Union, Optional
-
 
-from src.llm_engine.gemini_agent import Agent  
+from src.llm_engine.gemini_agent import Agent, get_json_schema
+from src.llm_engine.json_repair import JSONRepairError, parse_json_response
+from src.llm_engine.task_graph import ToolRegistry, run_graph
+from src.tracing import traced
 
 
 logging.basicConfig(level = logging.INFO)
 logger = logging.getLogger("scheduler")
 
-def accumulate_tools():
-    # total_tools = []
-    # for script in [organize_files, image_compression, pdf_compression, run_to_do_tasks]:
-    #     functions = inspect.getmembers(script, inspect.isfunction)
-    #     # Extract function names
-    #     function_names = [(name,fn) for name, fn in functions if fn.__module__  == str(script.__name__)]
-    #     total_tools.extend(function_names)
-    
-    # available_tools = {k:fn for (k, fn) in total_tools}
-    # tool_descriptions = [f"{name}:\n{func.__doc__}\n\n" for name, func in available_tools.items()]
-    pass
+def accumulate_tools(*modules):
+    """
+    Build the tool registry the scheduler plans against.
+
+    Args:
+        modules: Modules whose functions become tools (defaults to src.llm_engine.tools)
+
+    Returns:
+        tuple: (ToolRegistry, list of tool descriptions for the planner prompt)
+    """
+    if not modules:
+        from src.llm_engine import tools as default_tools
+        modules = (default_tools,)
+
+    registry = ToolRegistry.from_modules(*modules)
+    return registry, registry.describe()
 
 
 # let the agent the agent decide on how to proceed with the task
+@traced("scheduler.plan_steps")
 def get_list_of_steps_to_perform_user_query(user_query):
 
     system_prompt = f"""
@@ -42,12 +41,13 @@ def get_list_of_steps_to_perform_user_query(user_query):
 
         Don't start your answers with "Here is the JSON response", just give the JSON.
         """
-    problem_solver_agent = Agent(system_prompt=system_prompt)
+    problem_solver_agent = Agent(agent_name="problem_solver", system_prompt=system_prompt)
     
     llm_output = problem_solver_agent.perform_action(user_query)
 
     return llm_output
 
+@traced("scheduler.plan_function_calls")
 def get_list_of_fn_calls_to_start_job(steps_from_llm, tool_descriptions, fn_order):
     
     system_prompt = f"""You are given a set of steps to solve a problem and a bunch of tools that you can use to perform the steps
@@ -58,14 +58,17 @@ def get_list_of_fn_calls_to_start_job(steps_from_llm, tool_descriptions, fn_orde
     
     agent_job = """Plan the sequence of function calls needed to execute the tasks given the steps.
                 Return a JSON array of function calls in order that needs to be executed.
-                Don't give any arguments in your sequence of function calls.Just return one json file with function names and steps following the template below. 
-                [{'step': 'step_number', 'function': 'function_name'}].
+                Return one json file with function names and steps following the template below.
+                Give each call the inputs it needs; an input written as "$<step_number>" is the output of that earlier step.
+                Steps that do not use each other's outputs will be run at the same time.
+                [{'step': 'step_number', 'function': 'function_name', 'inputs': {'parameter': 'value or $step_number'}}].
                 """
-    task_identifier_agent = Agent(system_prompt=system_prompt + agent_job)
+    task_identifier_agent = Agent(agent_name="task_identifier", system_prompt=system_prompt + agent_job)
     response = task_identifier_agent.perform_action(steps_from_llm)
 
     return response
 
+@traced("scheduler.validate_function_calls")
 def function_call_validator(function_calls, fn_order):
 
     system_prompt = """You are given a  list of function calls that are helpful in solving a particular task.
@@ -80,33 +83,40 @@ def function_call_validator(function_calls, fn_order):
                     If they don't, align them correctly.
                     Return only the ordered function calls with the below template.
 
-                    "'function_calls': [{'step': 'step_number', 'function': 'function_name'}]".
+                    "'function_calls': [{'step': 'step_number', 'function': 'function_name', 'inputs': {'parameter': 'value or $step_number'}}]".
                     """
     
-    validator_agent = Agent(system_prompt=system_prompt + agent_job)
+    validator_agent = Agent(agent_name="validator", system_prompt=system_prompt + agent_job)
     response = validator_agent.perform_action(function_calls)
 
-    new_job= f"""Ensure that the below response is a valid JSON.
+    def ask_json_validator(response, error):
+        # Only reached when the response cannot be repaired locally.
+        new_job= f"""Ensure that the below response is a valid JSON.
                 {response}
                 
                 Do not say that "HERE is your JSON", return only the valid JSON
                 """
-    second_validator_agent = Agent(system_prompt="""You are a JSON Validator""")
-    final_response = second_validator_agent.perform_action(new_job)
+        second_validator_agent = Agent(agent_name="json_validator", system_prompt="""You are a JSON Validator""")
+        return second_validator_agent.perform_action(new_job)
 
-    return final_response
+    try:
+        return parse_json_response(response, schema=get_json_schema("function_call"), reask=ask_json_validator,
+                                   unwrap="function_calls")
+    except JSONRepairError as e:
+        logger.info("Could not get valid function calls: %s", e)
+        return None
 
 
-def scheduler(user_query, folder_path):
+@traced("scheduler")
+def scheduler(user_query, folder_path, max_workers=4):
 
-    tools, desc = accumulate_tools()
-    dict_info ={}
-    fn_order = list(tools.keys())
+    registry, desc = accumulate_tools()
+    fn_order = list(registry.tools)
     logger.info("Using the solver agent to break the problem into sub-problems\n")
     llm_response = get_list_of_steps_to_perform_user_query(user_query)
     function_calls = get_list_of_fn_calls_to_start_job(llm_response, desc, fn_order)
     validated_function_calls = function_call_validator(function_calls=function_calls, fn_order=fn_order)
-    logger.info(validated_function_calls)
+    dict_info = validated_function_calls
     logger.info(dict_info)
     if isinstance(dict_info, list):
         logger.info("Started scheduling the sub-tasks and tools......")
@@ -119,47 +129,17 @@ def scheduler(user_query, folder_path):
             ════   ░
                 ░░░░
             """)
-        
-        for step in dict_info:
-            func = tools.get(step["function"])
-            logger.info(func)
-            if func is not None:
-                if step["function"] == "move_files_to_categories":
-                    dest_map = func(source_dir=folder_path)
-                    if dest_map:
-                        logger.info("Successfully identified different categories of files and moved them to appropriate subfolders")
-                        logger.info("Task Completed")
-                    
-                elif step["function"] == "compress_pdf":
-                    logger.info("came here")
-                    fname = ""
-                    for file in dest_map:
-                        if file.endswith(".pdf"):
-                            fname = dest_map[file]
-                            break
-                    logger.info(fname)
-                    if fname != "":
-                        func(file_path=fname)
-                        logger.info("Successfully used online services to compress the input pdf and saved the results.")
-                        logger.info("Task is completed successfully!!!")   
-                
-                elif step["function"] == "compress_image":
-                    fname = ""
-                    for file in dest_map:
-                        if file.endswith(".png"):
-                            fname = dest_map[file]
-                            break
-                    if fname != "":
-                        func(file_path=fname)
-                        logger.info("Successfully used online services to compress the input pdf and saved the results.")
-                        logger.info("Task is completed successfully!!!")   
-                
-                elif step["function"] == "process_todo_file":
-                    func(folder_path=folder_path)
-                
-                else:
-                    logger.info("There is no such available tool. Sorry couldn't schedule sub-task!!!")
-                
+
+        try:
+            report = run_graph(dict_info, registry, context={"folder_path": folder_path}, max_workers=max_workers)
+        except ValueError as e:
+            logger.info("There is no such available tool or the plan is malformed: %s", e)
+            return "LLM was unable to fetch the tools required to do your job. Sorry for the inconvenience"
+
+        for step_id, outcome in report.items():
+            logger.info("Step %s: %s (%.2fs) %s", step_id, outcome["status"], outcome["seconds"], outcome["error"] or "")
+        if any(outcome["status"] != "done" for outcome in report.values()):
+            return "Some sub-tasks could not be completed, see the log for details."
 
         return "The user-query is resolved and the sub-tasks are completed!!!"
                      
@@ -0,0 +1,131 @@
+"""
+Self-consistency sampling: several solutions of one puzzle requested at the same time.
+
+Each sample uses its own sampling settings (temperature, seed) and its response is parsed
+into an assignment grid (scoring.parse_grid). Sampling stops, and the requests still in
+flight are cancelled, as soon as a majority of the samples agree on a complete grid or a
+sample passes verification (e.g. plan_executor.grid_verifier). Otherwise the most common
+complete grid wins once every sample has answered.
+
+Usage:
+    async def sample(query, settings):
+        agent = AsyncAgent("csp_agent", "You are an AI assistant", **settings)
+        return await agent.perform_action(query)
+
+    result = run_self_consistency(sample, puzzle["question"], puzzle["categories"], samples=5)
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.scoring import MISSING, parse_grid
+from src.tracing import span
+
+Sampler = Callable[[str, Dict[str, Any]], Awaitable[str]]
+
+
+def sample_settings(samples: int, max_temperature: float = 1.0, base_seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Sampling settings for each of the samples: the first keeps greedy decoding (temperature 0,
+    the single-sample answer), the others spread evenly up to max_temperature with distinct seeds.
+    """
+    if samples < 1:
+        raise ValueError("samples must be at least 1")
+    temperatures = np.linspace(0.0, max_temperature, samples) if samples > 1 else [0.0]
+    return [{"temperature": round(float(t), 3), "seed": base_seed + i} for i, t in enumerate(temperatures)]
+
+
+async def self_consistency(sample: Sampler, query: str, categories: Dict[str, List[str]], samples: int = 5,
+                           majority: Optional[int] = None, verify: Optional[Callable[[np.ndarray], bool]] = None,
+                           settings: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Request several solutions at once and stop at the first agreement.
+
+    Args:
+        sample (callable): Async function (query, settings) -> response text
+        query (str): The puzzle prompt
+        categories (dict): Category name to item labels, used to parse the responses
+        samples (int): Number of samples launched
+        majority (int): Identical complete grids needed to stop early; defaults to a strict majority
+        verify (callable): Optional grid -> bool; the first sample that passes is the answer
+        settings (list): Per-sample settings, defaults to sample_settings(samples)
+
+    Returns:
+        dict: "response" and "grid" of the chosen sample, "stop_reason" (verified, majority,
+              plurality or none) and stats: samples launched, completed before the decision
+              ("needed"), cancelled and failed, "votes" of the winning grid and "wall_s"
+    """
+    settings = settings if settings is not None else sample_settings(samples)
+    if len(settings) != samples:
+        raise ValueError(f"expected {samples} sample settings, got {len(settings)}")
+    majority = majority if majority is not None else samples // 2 + 1
+
+    start = time.perf_counter()
+    with span("self_consistency", samples=samples, majority=majority, verify=verify is not None) as current:
+        tasks = {asyncio.ensure_future(sample(query, setting)): index for index, setting in enumerate(settings)}
+        pending = set(tasks)
+        # Complete grids by content, with the responses that produced them in completion order.
+        groups: Dict[bytes, List[Any]] = {}
+        completed, failed, chosen, stop_reason = 0, 0, None, "none"
+        fallback = None
+
+        try:
+            while pending and chosen is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.get):
+                    completed += 1
+                    if task.exception() is not None:
+                        failed += 1
+                        continue
+                    response = task.result()
+                    grid = parse_grid(response, categories)
+                    if fallback is None:
+                        fallback = (response, grid)
+                    if (grid == MISSING).any():
+                        continue
+                    group = groups.setdefault(grid.tobytes(), [])
+                    group.append((response, grid))
+                    if verify is not None and verify(grid):
+                        chosen, stop_reason = (response, grid), "verified"
+                        break
+                    if len(group) >= majority:
+                        chosen, stop_reason = group[0], "majority"
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+        if chosen is None and groups:
+            # Largest group; on a tie the grid that completed first.
+            chosen, stop_reason = max(groups.values(), key=len)[0], "plurality"
+        if chosen is None and fallback is not None:
+            chosen = fallback
+        response, grid = chosen if chosen is not None else (None, parse_grid(None, categories))
+        votes = len(groups.get(grid.tobytes(), []))
+
+        result = {
+            "response": response,
+            "grid": grid,
+            "stop_reason": stop_reason,
+            "launched": samples,
+            "needed": completed,
+            "cancelled": len(pending),
+            "failed": failed,
+            "votes": votes,
+            "distinct_grids": len(groups),
+            "wall_s": time.perf_counter() - start,
+        }
+        current.set(**{key: value for key, value in result.items() if key not in ("response", "grid")})
+        return result
+
+
+def run_self_consistency(sample: Sampler, query: str, categories: Dict[str, List[str]], samples: int = 5,
+                         majority: Optional[int] = None, verify: Optional[Callable[[np.ndarray], bool]] = None,
+                         settings: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Blocking wrapper around self_consistency (see concurrency.run_bounded for use inside Jupyter)."""
+    return asyncio.run(self_consistency(sample, query, categories, samples=samples, majority=majority,
+                                        verify=verify, settings=settings))
@@ -0,0 +1,372 @@
+import numpy as np
+
+
+def _is_slice_of(matrix, stack, k):
+    return (
+        matrix.base is stack
+        and stack.ndim == 3
+        and matrix.shape == stack.shape[1:]
+        and matrix.ctypes.data == stack[k].ctypes.data
+    )
+
+
+def stack_probability_tables(matrices):
+    """
+    Store all probability matrices in one contiguous (k, n, m) array and point the
+    dictionary entries at views of it, so later updates happen in place.
+
+    Calling it again on a dictionary that is already backed by a stack is free.
+
+    Parameters:
+    -----------
+    matrices : dict of str -> numpy.ndarray
+        Matrices from utils.initialize_probability_tables, all of the same shape
+
+    Returns:
+    --------
+    tuple of (numpy.ndarray, dict of str -> int)
+        The stacked array and the position of every matrix name in it
+    """
+    names = list(matrices)
+    if not names:
+        return np.empty((0, 0, 0)), {}
+
+    stack = matrices[names[0]].base
+    if (
+        isinstance(stack, np.ndarray)
+        and stack.shape[0] == len(names)
+        and all(_is_slice_of(matrices[name], stack, k) for k, name in enumerate(names))
+    ):
+        return stack, {name: k for k, name in enumerate(names)}
+
+    shapes = {matrices[name].shape for name in names}
+    if len(shapes) != 1:
+        raise ValueError(f"All probability matrices must have the same shape to be stacked, got {sorted(shapes)}")
+
+    stack = np.ascontiguousarray(np.stack([np.asarray(matrices[name], dtype=float) for name in names]))
+    for k, name in enumerate(names):
+        matrices[name] = stack[k]
+
+    return stack, {name: k for k, name in enumerate(names)}
+
+
+def _check_support(block, names):
+    """Raise ValueError if a matrix of the (k, n, m) block has a row or column with no non-zero cell."""
+    empty_rows = ~block.any(axis=2)
+    empty_cols = ~block.any(axis=1)
+    if empty_rows.any() or empty_cols.any():
+        m, line = np.argwhere(empty_rows | empty_cols)[0]
+        kind = "Row" if empty_rows[m, line] else "Column"
+        raise ValueError(f"{kind} {line} of {names[m]!r} has no possible cell left, so it cannot be normalized")
+
+
+def sinkhorn_normalize(stack, indices=None, max_iterations=100, tolerance=1e-6):
+    """
+    Run Sinkhorn-Knopp on the matrices of a (k, n, m) stack all at once, in place.
+
+    Each matrix stops iterating as soon as its own largest cell change drops below
+    the tolerance, which matches running tools.update_matrix on it separately.
+
+    Parameters:
+    -----------
+    stack : numpy.ndarray
+        Float array of shape (k, n, m); modified in place
+    indices : array-like of int, optional
+        Matrices to normalize; all of them by default
+    max_iterations : int
+        Maximum number of row/column normalization rounds
+    tolerance : float
+        Convergence threshold on the largest absolute cell change
+
+    Returns:
+    --------
+    numpy.ndarray
+        Number of iterations each matrix needed
+
+    Raises:
+    -------
+    ValueError
+        If a matrix has a row or column with no non-zero cell (nothing is modified then)
+    """
+    iterations = np.zeros(stack.shape[0], dtype=int)
+    active = np.arange(stack.shape[0]) if indices is None else np.asarray(indices, dtype=int)
+    _check_support(stack[active], [f"matrix {k}" for k in active])
+
+    for _ in range(max_iterations):
+        # Fancy indexing copies, so stack[active] still holds the previous iterate.
+        block = stack[active]
+
+        block /= block.sum(axis=2, keepdims=True)
+        block /= block.sum(axis=1, keepdims=True)
+
+        iterations[active] += 1
+        changed = np.abs(block - stack[active]).max(axis=(1, 2)) >= tolerance
+        stack[active] = block
+
+        active = active[changed]
+        if active.size == 0:
+            break
+
+    return iterations
+
+
+class IncrementalSinkhorn:
+    """
+    Sinkhorn-Knopp normalizer that keeps its row and column scaling vectors between updates.
+
+    Every matrix is held as a kernel K with scaling vectors r and c, the normalized matrix
+    being diag(r) K diag(c). A cell update rewrites one kernel entry so that the displayed
+    cell takes the new value, then resumes the iteration from the previous r and c instead
+    of from scratch; after a small change only a few iterations are needed. This gives the
+    same fixed point as tools.update_matrix, which renormalizes the whole updated matrix.
+
+    Convergence is measured on the row sums (columns sum to 1 after each column step),
+    which costs one matrix-vector product per iteration.
+
+    Attributes:
+    -----------
+    matrices : dict of str -> numpy.ndarray
+        The normalized matrices, written in place on every update
+    stats : dict
+        "updates", total "iterations", "last_iterations" and "unconverged" update counts
+    """
+
+    def __init__(self, matrices, max_iterations=100, tolerance=1e-6):
+        self.matrices = matrices
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.stats = {"updates": 0, "iterations": 0, "last_iterations": 0, "unconverged": 0}
+        self._kernels = {}
+        self._rows = {}
+        self._cols = {}
+        self._written = {}
+
+    def reset(self, name=None):
+        """Forget the scaling state of one matrix (or all), e.g. after it was changed elsewhere."""
+        for state in (self._kernels, self._rows, self._cols, self._written):
+            if name is None:
+                state.clear()
+            else:
+                state.pop(name, None)
+
+    def _state(self, name):
+        matrix = self.matrices[name]
+        kernel = self._kernels.get(name)
+        # Reuse the vectors only if nobody else touched the matrix since our last write.
+        if kernel is None or kernel.shape != matrix.shape or not np.array_equal(self._written[name], matrix):
+            kernel = np.array(matrix, dtype=float)
+            self._kernels[name] = kernel
+            self._rows[name] = np.ones(kernel.shape[0])
+            self._cols[name] = np.ones(kernel.shape[1])
+            self._written[name] = np.array(matrix)
+        return kernel, self._rows[name], self._cols[name]
+
+    def update(self, name, row, col, prob_value):
+        """
+        Set one cell and renormalize its matrix from the previous scaling vectors.
+
+        Returns:
+        --------
+        int
+            Iterations used (also recorded in stats)
+
+        Raises:
+        -------
+        ValueError
+            If the value is not a probability, or the update leaves a row or column with no
+            non-zero cell, so it cannot be scaled to sum to 1
+        KeyError
+            If the matrix name is unknown
+        """
+        if not 0 <= prob_value <= 1:
+            raise ValueError("Probability value must be between 0 and 1")
+        if name not in self.matrices:
+            raise KeyError(f"Unknown probability matrix: {name!r}")
+
+        kernel, r, c = self._state(name)
+        scale = r[row] * c[col]
+        if prob_value > 0 and scale == 0:
+            raise ValueError(f"Cell ({row}, {col}) of {name!r} was eliminated and cannot be set to {prob_value}")
+        previous = kernel[row, col]
+        kernel[row, col] = prob_value / scale if prob_value > 0 else 0.0
+
+        # A rejected update leaves the kernel (and so the matrix) as it was.
+        if not kernel[row].any():
+            kernel[row, col] = previous
+            raise ValueError(f"Row {row} of {name!r} has no possible cell left after the update")
+        if not kernel[:, col].any():
+            kernel[row, col] = previous
+            raise ValueError(f"Column {col} of {name!r} has no possible cell left after the update")
+
+        iterations, converged = 0, False
+        kernel_c = kernel @ c
+        while iterations < self.max_iterations:
+            iterations += 1
+            np.divide(1.0, kernel_c, out=r)
+            np.divide(1.0, kernel.T @ r, out=c)
+            kernel_c = kernel @ c
+            if np.abs(r * kernel_c - 1.0).max() < self.tolerance:
+                converged = True
+                break
+
+        out = self.matrices[name]
+        np.multiply(r[:, None] * kernel, c[None, :], out=out)
+        self._written[name] = out.copy()
+        self.stats["updates"] += 1
+        self.stats["iterations"] += iterations
+        self.stats["last_iterations"] = iterations
+        self.stats["unconverged"] += not converged
+        return iterations
+
+
+def updates_from_tool_calls(tool_calls):
+    """
+    Convert prob_agent_2 tool calls into (matrix_name, row, col, prob) updates.
+
+    Parameters:
+    -----------
+    tool_calls : list of dict
+        Parsed prob_agent_2 responses with Topic_Pair, Row_Index, Col_Index and Probability keys
+
+    Returns:
+    --------
+    list of tuple
+        Updates accepted by batch_update_matrix
+    """
+    return [(call["Topic_Pair"], int(call["Row_Index"]), int(call["Col_Index"]), float(call["Probability"]))
+            for call in tool_calls]
+
+
+def batch_update_matrix(updated_matrices, updates, max_iterations=100, tolerance=1e-6, propagate=False):
+    """
+    Apply a whole list of cell updates and normalize every affected matrix together
+    so each row and column sums to 1 (doubly stochastic).
+
+    This is the batched counterpart of tools.update_matrix: all cells are written
+    first and each affected matrix is normalized once, instead of once per update.
+    When the same cell is updated several times the last value wins.
+
+    Parameters:
+    -----------
+    updated_matrices : dict of str -> numpy.ndarray
+        Probability matrices keyed by topic pair; entries become views of a shared stack
+    updates : list of tuple
+        (matrix_name, row, col, prob_value) tuples
+    max_iterations : int
+        Maximum number of Sinkhorn iterations
+    tolerance : float
+        Convergence threshold on the largest absolute cell change
+    propagate : bool
+        Afterwards spread the updates to the other matrices with
+        belief_propagation.propagate_beliefs (all matrices must be square)
+
+    Returns:
+    --------
+    dict of str -> numpy.ndarray
+        The same dictionary, updated in place
+
+    Raises:
+    -------
+    ValueError
+        If a value is not a probability or the updates leave a row or column with no
+        non-zero cell; the matrices are left unchanged
+    """
+    if not updates:
+        return updated_matrices
+
+    stack, index = stack_probability_tables(updated_matrices)
+
+    names, rows, cols, values = zip(*updates)
+    values = np.asarray(values, dtype=float)
+    if np.any((values < 0) | (values > 1)):
+        raise ValueError("Probability value must be between 0 and 1")
+
+    unknown = sorted(set(names) - set(index))
+    if unknown:
+        raise KeyError(f"Unknown probability matrices: {unknown}")
+
+    slots = np.fromiter((index[name] for name in names), dtype=int, count=len(names))
+    affected = np.unique(slots)
+    # Write into a copy first so updates that would empty a row or column change nothing.
+    block = stack[affected]
+    block[np.searchsorted(affected, slots), np.asarray(rows, dtype=int), np.asarray(cols, dtype=int)] = values
+    slot_names = {slot: name for name, slot in index.items()}
+    _check_support(block, [slot_names[slot] for slot in affected])
+    stack[affected] = block
+
+    sinkhorn_normalize(stack, indices=affected, max_iterations=max_iterations, tolerance=tolerance)
+
+    if propagate:
+        from src.llm_engine.belief_propagation import propagate_beliefs
+
+        propagate_beliefs(updated_matrices, tolerance=tolerance, max_iterations=max_iterations)
+
+    return updated_matrices
+
+
+def normalize_with_fixed_cells(matrix, fixed_mask, max_iterations=100, tolerance=1e-6, dtype=None, out=None):
+    """
+    Scale the free cells of a matrix so every row and column sums to 1 while the
+    cells selected by fixed_mask keep their values.
+
+    Rows and columns are rescaled with masked NumPy reductions; a row or column whose
+    fixed cells already sum to 1 gets all of its free cells set to 0.
+
+    Parameters:
+    -----------
+    matrix : numpy.ndarray
+        (n, m) probability matrix, with the fixed cells already holding their values
+    fixed_mask : numpy.ndarray of bool
+        (n, m) mask, True where the cell must not change
+    max_iterations : int
+        Maximum number of row/column scaling rounds
+    tolerance : float
+        Convergence threshold on the largest absolute cell change
+    dtype : numpy.dtype, optional
+        Working precision, e.g. numpy.float32; defaults to float64
+    out : numpy.ndarray, optional
+        Array to write the result into; pass matrix itself to normalize in place
+
+    Returns:
+    --------
+    numpy.ndarray
+        The normalized matrix (out when given)
+
+    Raises:
+    -------
+    ValueError
+        If the fixed cells of a row or column already sum to more than 1
+    """
+    fixed_mask = np.asarray(fixed_mask, dtype=bool)
+    free_mask = ~fixed_mask
+
+    if out is None:
+        out = np.array(matrix, dtype=dtype or np.float64)
+    elif out is not matrix:
+        np.copyto(out, matrix, casting="same_kind")
+
+    fixed_values = np.where(fixed_mask, out, 0)
+    row_targets = 1 - fixed_values.sum(axis=1)
+    col_targets = 1 - fixed_values.sum(axis=0)
+    if np.any(row_targets < 0) or np.any(col_targets < 0):
+        raise ValueError("Sum of fixed cells in a row or column exceeds 1; normalization is impossible.")
+
+    prev = np.empty_like(out)
+    free_values = np.empty_like(out)
+    for _ in range(max_iterations):
+        np.copyto(prev, out)
+
+        np.multiply(out, free_mask, out=free_values)
+        row_sums = free_values.sum(axis=1)
+        row_scale = np.divide(row_targets, row_sums, out=np.ones_like(row_sums), where=row_sums > 0)
+        np.multiply(out, row_scale[:, None], out=out, where=free_mask)
+
+        np.multiply(out, free_mask, out=free_values)
+        col_sums = free_values.sum(axis=0)
+        col_scale = np.divide(col_targets, col_sums, out=np.ones_like(col_sums), where=col_sums > 0)
+        np.multiply(out, col_scale[None, :], out=out, where=free_mask)
+
+        if np.max(np.abs(out - prev)) < tolerance:
+            break
+
+    return out
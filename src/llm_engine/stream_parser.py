@@ -0,0 +1,224 @@
+"""
+Incremental parsers for streamed model responses.
+
+Agent.stream_action and ChatAgent.stream_chat yield the response text in arbitrary
+pieces. The parsers here are fed those pieces and hand back each unit as soon as it is
+complete, so the next stage can start on it while the model is still writing:
+
+- StepStream: numbered deduction steps (same split as prompt_builder.split_steps).
+- JSONObjectStream: the object elements of a JSON array (or a single top-level object),
+  e.g. tool calls or plan entries.
+
+Usage:
+    for call in iter_json_objects(agent.stream_action(query)):
+        ...
+"""
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.llm_engine.json_repair import JSONRepairError, repair_json
+from src.llm_engine.prompt_builder import _STEP_START
+from src.llm_engine.sinkhorn import updates_from_tool_calls
+from src.llm_engine.tools import update_matrix
+
+
+class StepStream:
+    """
+    Splits streamed deduction text into numbered steps.
+
+    A step is complete when the line starting the next one arrives (or at close()). Text
+    before the first numbered line is returned as its own piece, like split_steps does.
+    """
+
+    def __init__(self) -> None:
+        self._partial = ""
+        self._step: List[str] = []
+
+    def _take(self, line: str) -> List[str]:
+        done = []
+        if _STEP_START.match(line) and self._step:
+            done.append(self._flush())
+        self._step.append(line)
+        return [step for step in done if step]
+
+    def _flush(self) -> str:
+        text = "\n".join(self._step).strip()
+        self._step = []
+        return text
+
+    def feed(self, delta: str) -> List[str]:
+        """Add text; returns the steps completed by it."""
+        *lines, self._partial = (self._partial + delta).split("\n")
+        done = []
+        for line in lines:
+            done.extend(self._take(line))
+        return done
+
+    def close(self) -> List[str]:
+        """End of the response; returns the last step."""
+        done = self._take(self._partial) if self._partial else []
+        self._partial = ""
+        last = self._flush()
+        return done + ([last] if last else [])
+
+
+class JSONObjectStream:
+    """
+    Emits JSON objects from streamed text as soon as their closing brace arrives.
+
+    If the response is an array, each object element is emitted on its own; if it is a
+    single object, that object is emitted when it closes. Prose and ``` fences outside the
+    brackets are skipped. Each object is parsed with json.loads and, failing that, with
+    json_repair.repair_json (single quotes, trailing commas, ...); objects that still cannot
+    be parsed are kept in errors instead of interrupting the stream.
+
+    Attributes:
+        errors: (object text, message) pairs for elements that could not be parsed.
+    """
+
+    def __init__(self) -> None:
+        self.errors: List[Tuple[str, str]] = []
+        self._stack: List[str] = []
+        self._quote: Optional[str] = None
+        self._escape = False
+        self._buffer: List[str] = []
+        self._emit_depth: Optional[int] = None
+
+    def _parse(self, text: str) -> Optional[Any]:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+        try:
+            return repair_json(text)
+        except JSONRepairError as e:
+            self.errors.append((text, str(e)))
+            return None
+
+    def feed(self, delta: str) -> List[Any]:
+        """Add text; returns the objects completed by it."""
+        done = []
+        for ch in delta:
+            depth = len(self._stack)
+            if self._buffer:
+                self._buffer.append(ch)
+            if self._quote is not None:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+                continue
+            if depth == 0 and ch not in "{[":
+                continue
+            if ch in "\"'":
+                self._quote = ch
+            elif ch in "{[":
+                if depth == 0:
+                    self._emit_depth = 1 if ch == "[" else 0
+                if ch == "{" and depth == self._emit_depth:
+                    self._buffer = [ch]
+                self._stack.append(ch)
+            elif ch in "}]" and self._stack:
+                self._stack.pop()
+                if ch == "}" and len(self._stack) == self._emit_depth and self._buffer:
+                    parsed = self._parse("".join(self._buffer))
+                    self._buffer = []
+                    if parsed is not None:
+                        done.append(parsed)
+        return done
+
+    def close(self) -> List[Any]:
+        """End of the response; an object cut off mid-way is recorded in errors."""
+        if self._buffer:
+            text = "".join(self._buffer)
+            self.errors.append((text, "response ended inside the object"))
+        self._buffer, self._stack, self._quote, self._escape = [], [], None, False
+        return []
+
+
+def iter_steps(deltas: Iterable[str]) -> Iterator[str]:
+    """Deduction steps of a streamed response, each yielded as soon as it is complete."""
+    parser = StepStream()
+    for delta in deltas:
+        yield from parser.feed(delta)
+    yield from parser.close()
+
+
+def iter_json_objects(deltas: Iterable[str], parser: Optional[JSONObjectStream] = None) -> Iterator[Any]:
+    """JSON objects of a streamed response, each yielded as soon as it closes."""
+    parser = parser if parser is not None else JSONObjectStream()
+    for delta in deltas:
+        yield from parser.feed(delta)
+    yield from parser.close()
+
+
+def _matrix_update(call: Dict[str, Any]) -> Optional[Tuple[str, int, int, float]]:
+    """
+    (matrix_name, row, col, prob) of an update_matrix call, or None for a call to another tool.
+
+    Accepts prob_agent_2 output ({"tool_name", "Topic_Pair", "Row_Index", "Col_Index",
+    "Probability"}, see sinkhorn.updates_from_tool_calls), task-graph style calls
+    ({"function": ..., "inputs": {...}}) and bare update_matrix arguments.
+    """
+    name = call.get("tool_name", call.get("function", call.get("function_name")))
+    if name is not None and name != "update_matrix":
+        return None
+    if "Topic_Pair" in call:
+        return updates_from_tool_calls([call])[0]
+    arguments = call.get("inputs", call.get("parameters", call))
+    if not isinstance(arguments, dict):
+        raise TypeError(f"expected a dict of arguments, got {arguments!r}")
+    return (arguments["matrix_name"], int(arguments["row"]), int(arguments["col"]), float(arguments["prob_value"]))
+
+
+def stream_matrix_updates(deltas: Iterable[str], updated_matrices, normalizer=None) -> Dict[str, Any]:
+    """
+    Apply update_matrix calls from a streamed response (e.g. prob_agent_2's) as each one completes.
+
+    Parameters:
+    -----------
+    deltas : iterable of str
+        Response pieces, e.g. Agent.stream_action(query)
+    updated_matrices : dict of str -> numpy.ndarray
+        Matrices the updates are applied to
+    normalizer : sinkhorn.IncrementalSinkhorn, optional
+        Passed on to update_matrix to warm-start each normalization
+
+    Returns:
+    --------
+    dict
+        "applied" (the calls applied, in order) and "errors" ((call or text, message) pairs
+        for calls that could not be parsed or applied)
+    """
+    parser = JSONObjectStream()
+    applied, errors = [], []
+    for call in iter_json_objects(deltas, parser):
+        try:
+            update = _matrix_update(call) if isinstance(call, dict) else None
+            if update is None:
+                continue
+            update_matrix(updated_matrices, *update, normalizer=normalizer)
+        except (KeyError, ValueError, IndexError, TypeError) as e:
+            errors.append((call, f"{type(e).__name__}: {e}"))
+            continue
+        applied.append(call)
+    return {"applied": applied, "errors": parser.errors + errors}
+
+
+def stream_plan(deltas: Iterable[str], solver, strict: bool = False):
+    """
+    Compile and assert a streamed function-call plan entry by entry (see plan_compiler.PlanStream).
+
+    Returns:
+        PlanStream: holds the per-entry results; unparseable entries are added to its errors
+    """
+    from src.z3_tools.plan_compiler import PlanStream
+
+    plan = PlanStream(solver, strict=strict)
+    parser = JSONObjectStream()
+    for call in iter_json_objects(deltas, parser):
+        plan.add(call)
+    plan.errors.extend((-1, f"unparseable entry {text[:80]!r}: {message}") for text, message in parser.errors)
+    return plan
@@ -0,0 +1,224 @@
+import contextvars
+import inspect
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from src.tracing import span
+
+logger = logging.getLogger("task_graph")
+
+
+class ToolRegistry:
+    """
+    Named tools the scheduler may call, with the parameter names each one accepts.
+
+    Attributes:
+        tools: Mapping from tool name to callable.
+    """
+
+    def __init__(self) -> None:
+        self.tools: Dict[str, Callable] = {}
+
+    def register(self, fn: Optional[Callable] = None, name: Optional[str] = None):
+        """Register a function, either directly or as a decorator (@registry.register)."""
+        def add(func):
+            self.tools[name or func.__name__] = func
+            return func
+
+        return add(fn) if fn is not None else add
+
+    @classmethod
+    def from_modules(cls, *modules) -> "ToolRegistry":
+        """Registry holding every function defined in the given modules (not the ones they import)."""
+        registry = cls()
+        for module in modules:
+            for name, fn in inspect.getmembers(module, inspect.isfunction):
+                if fn.__module__ == module.__name__ and not name.startswith("_"):
+                    registry.register(fn, name)
+        return registry
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tools
+
+    def __getitem__(self, name: str) -> Callable:
+        return self.tools[name]
+
+    def parameters(self, name: str) -> List[str]:
+        return list(inspect.signature(inspect.unwrap(self.tools[name])).parameters)
+
+    def describe(self) -> List[str]:
+        """Tool descriptions ("name(signature):", docstring) in the form used in prompts."""
+        return [f"{name}{inspect.signature(inspect.unwrap(fn))}:\n{fn.__doc__}\n\n" for name, fn in self.tools.items()]
+
+
+def _reference(value: Any, ids) -> Optional[tuple]:
+    """(step id, key) when value is "$<id>" or "$<id>.<key>" for a step of the plan, else None."""
+    if not isinstance(value, str) or not value.startswith("$"):
+        return None
+    step_id, _, key = value[1:].partition(".")
+    return (step_id, key) if step_id in ids else None
+
+
+def normalize_steps(steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Bring LLM-produced steps into executor form.
+
+    Each step is {"step": id, "function": name, "inputs": {param: value}, "after": [ids]}.
+    An input value "$<id>" is the result of step <id> and "$<id>.<key>" one item of it;
+    the step then depends on <id>. Other values (including "$45"-style literals that name
+    no step) are passed as they are. "after" adds ordering-only dependencies. Missing ids
+    default to the position of the step (1-based, as the planner prompt numbers them).
+
+    Returns:
+        list: Steps with string ids, "inputs", "refs" (param -> (id, key)) and "depends_on"
+    """
+    ids = {str(step.get("step", position)) for position, step in enumerate(steps, start=1)}
+    normalized = []
+    for position, step in enumerate(steps, start=1):
+        inputs = dict(step.get("inputs") or {})
+        refs = {name: ref for name, ref in ((n, _reference(v, ids)) for n, v in inputs.items()) if ref is not None}
+        depends = [str(d) for d in step.get("after") or []] + [step_id for step_id, _ in refs.values()]
+        normalized.append({
+            "step": str(step.get("step", position)),
+            "function": step["function"],
+            "inputs": inputs,
+            "refs": refs,
+            "depends_on": list(dict.fromkeys(depends)),
+        })
+    return normalized
+
+
+def _check_graph(steps: List[Dict[str, Any]], registry: ToolRegistry) -> None:
+    ids = [step["step"] for step in steps]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate step ids in plan: {ids}")
+    known = set(ids)
+    for step in steps:
+        if step["function"] not in registry:
+            raise ValueError(f"Step {step['step']}: unknown tool {step['function']!r}")
+        missing = [d for d in step["depends_on"] if d not in known]
+        if missing:
+            raise ValueError(f"Step {step['step']}: depends on unknown steps {missing}")
+
+    # Kahn's algorithm, only to report cycles before anything runs.
+    indegree = {step["step"]: len(step["depends_on"]) for step in steps}
+    children: Dict[str, List[str]] = {i: [] for i in ids}
+    for step in steps:
+        for dep in step["depends_on"]:
+            children[dep].append(step["step"])
+    ready = [i for i, d in indegree.items() if d == 0]
+    seen = 0
+    while ready:
+        node = ready.pop()
+        seen += 1
+        for child in children[node]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+    if seen != len(ids):
+        raise ValueError(f"Plan has a dependency cycle among steps {[i for i, d in indegree.items() if d > 0]}")
+
+
+def _call(fn: Callable, kwargs: Dict[str, Any]) -> Any:
+    with span("tool." + getattr(fn, "__name__", "call")):
+        return fn(**kwargs)
+
+
+def run_graph(steps: List[Dict[str, Any]], registry: ToolRegistry, context: Optional[Dict[str, Any]] = None,
+              max_workers: int = 4, executor: str = "thread") -> Dict[str, Dict[str, Any]]:
+    """
+    Execute a plan as a dependency graph, running every step whose inputs are ready at once.
+
+    With the thread executor step results are handed to later steps by reference; the
+    process executor pickles them, so it suits CPU-bound tools with small results.
+
+    Args:
+        steps (list): Plan steps (see normalize_steps)
+        registry (ToolRegistry): Tools the steps may call
+        context (dict): Values passed to any tool parameter of the same name that the step does not set
+        max_workers (int): Pool size
+        executor (str): "thread" or "process"
+
+    Returns:
+        dict: Step id -> {"status": "done" | "failed" | "skipped", "result", "error", "seconds"}
+    """
+    steps = normalize_steps(steps)
+    _check_graph(steps, registry)
+    context = context or {}
+    by_id = {step["step"]: step for step in steps}
+    waiting = {step["step"]: set(step["depends_on"]) for step in steps}
+    dependents: Dict[str, List[str]] = {step["step"]: [] for step in steps}
+    for step in steps:
+        for dep in step["depends_on"]:
+            dependents[dep].append(step["step"])
+
+    results: Dict[str, Any] = {}
+    report: Dict[str, Dict[str, Any]] = {}
+    running: Dict[Future, str] = {}
+    started: Dict[str, float] = {}
+
+    def skip(step_id: str, reason: str) -> None:
+        report[step_id] = {"status": "skipped", "result": None, "error": reason, "seconds": 0.0}
+        waiting.pop(step_id, None)
+        for child in dependents[step_id]:
+            if child not in report:
+                skip(child, f"dependency {step_id} did not complete")
+
+    def fail(step_id: str, error: Exception, seconds: float) -> None:
+        logger.info("Step %s failed: %s", step_id, error)
+        report[step_id] = {"status": "failed", "result": None, "error": f"{type(error).__name__}: {error}",
+                           "seconds": seconds}
+        for child in dependents[step_id]:
+            skip(child, f"dependency {step_id} failed")
+
+    if executor == "thread":
+        pool_cls = ThreadPoolExecutor
+    else:
+        from concurrent.futures import ProcessPoolExecutor as pool_cls
+    with pool_cls(max_workers=max_workers) as pool:
+        def submit_ready() -> None:
+            for step_id in [i for i, deps in waiting.items() if not deps]:
+                if step_id not in waiting:
+                    # Skipped by a step that failed earlier in this pass.
+                    continue
+                del waiting[step_id]
+                step = by_id[step_id]
+                params = registry.parameters(step["function"])
+                kwargs = {name: context[name] for name in params if name in context}
+                kwargs.update(step["inputs"])
+                try:
+                    for name, (ref_id, key) in step["refs"].items():
+                        kwargs[name] = results[ref_id][key] if key else results[ref_id]
+                except (KeyError, IndexError, TypeError) as e:
+                    # A "$k.field" reference the result of step k does not have fails only this step.
+                    fail(step_id, e, 0.0)
+                    continue
+                started[step_id] = time.perf_counter()
+                logger.info("Starting step %s (%s)", step_id, step["function"])
+                if executor == "thread":
+                    # Run in a copy of the caller's context so tool spans nest under the current trace.
+                    future = pool.submit(contextvars.copy_context().run, _call, registry[step["function"]], kwargs)
+                else:
+                    future = pool.submit(_call, registry[step["function"]], kwargs)
+                running[future] = step_id
+
+        submit_ready()
+        while running:
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                step_id = running.pop(future)
+                seconds = time.perf_counter() - started[step_id]
+                try:
+                    results[step_id] = future.result()
+                except Exception as e:
+                    fail(step_id, e, seconds)
+                    continue
+                report[step_id] = {"status": "done", "result": results[step_id], "error": None, "seconds": seconds}
+                for child in dependents[step_id]:
+                    if child in waiting:
+                        waiting[child].discard(step_id)
+            submit_ready()
+
+    return {step["step"]: report[step["step"]] for step in steps}
@@ -1,9 +1,11 @@
 import numpy as np
-import pandas as pd
-from itertools import combinations
 
+from src.tracing import traced
 
-def update_matrix(updated_matrices, matrix_name, row, col, prob_value):
+
+@traced("update_matrix", attrs=lambda updated_matrices, matrix_name, row, col, prob_value, normalizer=None: {
+    "matrix_name": matrix_name, "row": row, "col": col, "prob_value": prob_value, "warm_start": normalizer is not None})
+def update_matrix(updated_matrices, matrix_name, row, col, prob_value, normalizer=None):
     """
     Update a specific cell in one of the probability matrices and then normalize 
     the matrix so each row and column sums to 1 (doubly stochastic).
@@ -20,6 +22,9 @@ def update_matrix(updated_matrices, matrix_name, row, col, prob_value):
         Column index of the cell to update
     prob_value : float
         New probability value to set (must be between 0 and 1)
+    normalizer : sinkhorn.IncrementalSinkhorn, optional
+        Normalizer holding the scaling vectors of these matrices; when given, the
+        normalization is warm-started from them instead of restarted
         
     Returns:
     --------
@@ -29,9 +34,16 @@ def update_matrix(updated_matrices, matrix_name, row, col, prob_value):
     # Validate probability value is between 0 and 1
     if not 0 <= prob_value <= 1:
         raise ValueError("Probability value must be between 0 and 1")
+
+    if normalizer is not None:
+        normalizer.update(matrix_name, row, col, prob_value)
+        return updated_matrices
     
-    # Create a copy of the matrices to avoid modifying the original
-    
+    # Reject updates that would leave a row or column with nothing to normalize, before writing anything
+    row_left = np.delete(updated_matrices[matrix_name][row], col).any() or prob_value > 0
+    col_left = np.delete(updated_matrices[matrix_name][:, col], row).any() or prob_value > 0
+    if not (row_left and col_left):
+        raise ValueError(f"A row or column of {matrix_name!r} has no possible cell left after the update")
     
     # Update the specified cell
     updated_matrices[matrix_name][row, col] = prob_value
@@ -48,6 +60,8 @@ def update_matrix(updated_matrices, matrix_name, row, col, prob_value):
         
         # Normalize rows
         row_sums = matrix.sum(axis=1, keepdims=True)
+        if not row_sums.all() or not matrix.sum(axis=0).all():
+            raise ValueError(f"A row or column of {matrix_name!r} has no possible cell left")
         matrix = matrix / row_sums
         
         # Normalize columns
@@ -0,0 +1,262 @@
+"""
+Parse-once storage for the GridPuzzle dataset.
+
+compile_puzzle_store() parses data/GridPuzzle_processed.csv a single time (category
+splitting, numeric normalization, clue extraction, answer grids) and writes a binary
+file made of a fixed-size header, an offset index and one JSON record per puzzle.
+PuzzleStore memory-maps that file and decodes only the record that is asked for, so
+a worker can fetch puzzle k in O(1) without pandas and without reading the whole file.
+
+Usage:
+    python -m src.puzzle_store data/GridPuzzle_processed.csv data/GridPuzzle.gpz
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+MAGIC = b"GPZSTORE"
+# Version 2: numeric values parsed from the labels instead of digit-stripped.
+VERSION = 2
+# magic, version, record count, metadata length
+_HEADER = struct.Struct("<8sIIQ")
+# record offset (relative to the data section), record length, puzzle id
+_INDEX_ENTRY = struct.Struct("<QIq")
+
+MODEL_COLUMNS = ["Mistral-7b", "Llama-13b", "gemini-pro", "gpt-4-turbo", "Claude-3"]
+
+
+def _split_categories(categories_str: str) -> Dict[str, List[str]]:
+    categories = {}
+    for line in categories_str.split("\n"):
+        title, items = line.split(" : ", 1)
+        categories[title.strip()] = [item.strip() for item in items.strip().rstrip(".").split(", ")]
+    return categories
+
+
+_MONTHS = {name: number for number, name in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+     "november", "december"], start=1)}
+_CUMULATIVE_DAYS = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+_SCALES = {"thousand": 1_000, "million": 1_000_000, "billion": 1_000_000_000}
+_CLOCK = re.compile(r"^(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.?|p\.m\.?|noon|midnight)$")
+_DATE = re.compile(r"^([a-z]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?$")
+_ORDINAL = re.compile(r"^(\d+)(?:st|nd|rd|th)$")
+_MONTH_YEAR = re.compile(r"^(\d{1,2})/(\d{4})$")
+_NUMBER = re.compile(r"^(?:[a-z]+\s+)?\$?(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?\s*(%|[-/]?[a-z][a-z. ]*)?$")
+
+
+def _numeric_value(label: str) -> Optional[float]:
+    """
+    Number a label stands for, or None if it is not numeric.
+
+    Handles plain numbers with thousands separators, decimals, "$", "%" and a trailing
+    unit ("1.5 minutes" -> 1.5, "$100 million" -> 100000000, "210,000 B.C.E." -> -210000),
+    a leading word ("Chapter 2" -> 2), ordinals ("3rd" -> 3), clock times as minutes after midnight ("12 noon" -> 720,
+    "1:00pm" -> 780) and month-day dates as the day of the year ("April 13th" -> 103) and
+    month/year as year * 12 + month.
+    Labels with anything else around the digits, such as product codes ("AV-435"), are not numeric.
+    """
+    text = " ".join(label.strip().lower().split())
+
+    clock = _CLOCK.match(text)
+    if clock:
+        hour, minute, suffix = int(clock.group(1)), int(clock.group(2) or 0), clock.group(3)
+        if hour > 12 or minute > 59 or (suffix in ("noon", "midnight") and (hour, minute) != (12, 0)):
+            return None
+        hour %= 12
+        if suffix.startswith("p") or suffix == "noon":
+            hour += 12
+        return hour * 60 + minute
+
+    date = _DATE.match(text)
+    month = None
+    if date and len(date.group(1)) >= 3:
+        month = next((number for name, number in _MONTHS.items() if name.startswith(date.group(1))), None)
+    if month is not None:
+        day = int(date.group(2))
+        return _CUMULATIVE_DAYS[month - 1] + day if 1 <= day <= 31 else None
+
+    month_year = _MONTH_YEAR.match(text)
+    if month_year:
+        month = int(month_year.group(1))
+        return int(month_year.group(2)) * 12 + month if 1 <= month <= 12 else None
+
+    ordinal = _ORDINAL.match(text)
+    if ordinal:
+        return int(ordinal.group(1))
+
+    number = _NUMBER.match(text)
+    if not number:
+        return None
+    value = float(number.group(1).replace(",", "") + (number.group(2) or ""))
+    unit = (number.group(3) or "").strip(" -/")
+    for word in unit.split():
+        value *= _SCALES.get(word, 1)
+    if unit.replace(".", "").replace(" ", "") in ("bce", "bc"):
+        value = -value
+    return value
+
+
+def _numeric_values(items: List[str]) -> Optional[List[Union[int, float]]]:
+    """Numeric value of every item (ints where whole), or None unless all items of the category are numeric."""
+    values = [_numeric_value(item) for item in items]
+    if any(value is None for value in values):
+        return None
+    return [int(value) if float(value).is_integer() else value for value in values]
+
+
+def _answer_grid(answer: str) -> List[List[str]]:
+    return [[cell.strip() for cell in line.split("|")] for line in answer.strip().split("\n") if line.strip()]
+
+
+def label_key(label: str) -> str:
+    """Normalized form used to match answer cells to item labels ("Streeter Inc." vs "Streeter Inc")."""
+    return label.strip().rstrip(".").strip().lower()
+
+
+def _answer_indices(grid: List[List[str]], categories: Dict[str, List[str]]) -> List[List[int]]:
+    """Item index of every answer cell within its category (-1 when the label is not found)."""
+    lookups = [{label_key(item): i for i, item in enumerate(items)} for items in categories.values()]
+    return [[lookups[c].get(label_key(cell), -1) if c < len(lookups) else -1 for c, cell in enumerate(row)]
+            for row in grid]
+
+
+def parse_puzzle_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parse one CSV row into the record stored for a puzzle.
+
+    Args:
+        row (dict): A row of GridPuzzle_processed.csv
+
+    Returns:
+        dict: key, id, question, actual_question, clues, categories (item labels),
+              values (ints for numeric categories, else None), answer, answer_grid,
+              answer_indices and the raw outputs of every model column
+    """
+    from src.utils import process_question
+
+    actual_question, _, clues = process_question(row["question"])
+    categories = _split_categories(row["categories"])
+    grid = _answer_grid(row["answer"])
+    return {
+        "key": row["key"],
+        "id": int(row["id"]),
+        "question": row["question"],
+        "actual_question": actual_question,
+        "clues": clues,
+        "categories": categories,
+        "values": {title: _numeric_values(items) for title, items in categories.items()},
+        "answer": row["answer"],
+        "answer_grid": grid,
+        "answer_indices": _answer_indices(grid, categories),
+        "outputs": {model: row[model] for model in MODEL_COLUMNS if isinstance(row.get(model), str)},
+    }
+
+
+def compile_puzzle_store(csv_path: str, store_path: str) -> int:
+    """
+    Compile the dataset CSV into a binary puzzle store.
+
+    Args:
+        csv_path (str): Path to GridPuzzle_processed.csv
+        store_path (str): Output file
+
+    Returns:
+        int: Number of puzzles written
+    """
+    import pandas as pd
+
+    df = pd.read_csv(csv_path)
+    blobs = [json.dumps(parse_puzzle_row(row), ensure_ascii=False).encode("utf-8")
+             for row in df.to_dict(orient="records")]
+    ids = [int(i) for i in df["id"]]
+    metadata = json.dumps({"source": os.path.basename(csv_path), "models": MODEL_COLUMNS}).encode("utf-8")
+
+    tmp_path = store_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(blobs), len(metadata)))
+        f.write(metadata)
+        offset = 0
+        for blob, id_ in zip(blobs, ids):
+            f.write(_INDEX_ENTRY.pack(offset, len(blob), id_))
+            offset += len(blob)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, store_path)
+
+    return len(blobs)
+
+
+class PuzzleStore:
+    """
+    Read-only, memory-mapped view of a compiled puzzle store.
+
+    Attributes:
+        path: Location of the store file.
+        metadata: Header metadata (source file, model column names).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, meta_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a puzzle store")
+        if version != VERSION:
+            raise ValueError(f"{path} has store version {version}, expected {VERSION}")
+
+        self._count = count
+        self._index_start = _HEADER.size + meta_len
+        self._data_start = self._index_start + count * _INDEX_ENTRY.size
+        self.metadata = json.loads(self._mm[_HEADER.size:self._index_start])
+        self._positions: Optional[Dict[int, int]] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, k: int) -> Dict[str, Any]:
+        if k < 0:
+            k += self._count
+        if not 0 <= k < self._count:
+            raise IndexError(k)
+        offset, length, _ = _INDEX_ENTRY.unpack_from(self._mm, self._index_start + k * _INDEX_ENTRY.size)
+        start = self._data_start + offset
+        return json.loads(self._mm[start:start + length])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for k in range(self._count):
+            yield self[k]
+
+    def ids(self) -> List[int]:
+        """Puzzle ids in store order, read from the index only."""
+        return [_INDEX_ENTRY.unpack_from(self._mm, self._index_start + k * _INDEX_ENTRY.size)[2]
+                for k in range(self._count)]
+
+    def by_id(self, puzzle_id: int) -> Dict[str, Any]:
+        """Fetch a puzzle by its dataset id."""
+        if self._positions is None:
+            self._positions = {id_: k for k, id_ in enumerate(self.ids())}
+        return self[self._positions[int(puzzle_id)]]
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "PuzzleStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "data/GridPuzzle_processed.csv"
+    store_path = sys.argv[2] if len(sys.argv) > 2 else "data/GridPuzzle.gpz"
+    count = compile_puzzle_store(csv_path, store_path)
+    print(f"Wrote {count} puzzles to {store_path}")
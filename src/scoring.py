@@ -0,0 +1,187 @@
+"""
+Answer-grid scoring for the GridPuzzle dataset.
+
+Reference answers and model outputs are both turned into integer assignment arrays:
+row i of the array belongs to item i of the first category and column c holds the
+index of the item of category c that goes with it (-1 when unknown). All predictions
+of a run are stacked into one padded (puzzles, rows, categories) array and compared
+against the references in a single numpy pass.
+
+Usage:
+    python -m src.scoring data/GridPuzzle.gpz
+"""
+import re
+import sys
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.puzzle_store import MODEL_COLUMNS, label_key
+
+MISSING = -1
+# Padding for cells that do not exist in a puzzle (fewer items or categories than the widest puzzle).
+PAD = -2
+
+_FINAL_ANSWER = re.compile(r"final answer", re.IGNORECASE)
+
+
+class _GridMatcher:
+    """Label lookups for one puzzle's categories, built once and reused for every prediction."""
+
+    def __init__(self, categories: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> None:
+        self.n_categories = len(categories)
+        self.n_items = len(categories[0][1]) if categories else 0
+        self.lookups = [{label_key(item): i for i, item in enumerate(items)} for _, items in categories]
+        self.patterns = []
+        for lookup in self.lookups:
+            labels = sorted(lookup, key=len, reverse=True)
+            alternation = "|".join(re.escape(label) for label in labels)
+            self.patterns.append(re.compile(rf"(?<!\w)(?:{alternation})(?!\w)"))
+
+    def match_line(self, line: str) -> Optional[List[int]]:
+        """Item index per category for one table row, or None when the row has no first-category item."""
+        cells = [label_key(cell.strip("* ")) for cell in line.strip().strip("|").split("|")]
+        row = [self.lookups[c].get(cells[c], MISSING) if c < len(cells) else MISSING
+               for c in range(self.n_categories)]
+        lowered = None
+        for c in range(self.n_categories):
+            if row[c] != MISSING:
+                continue
+            # Fall back to searching the whole row, e.g. "| 1962 | Felipe (Bournemouth) |".
+            lowered = lowered if lowered is not None else line.lower()
+            found = {self.lookups[c][m] for m in self.patterns[c].findall(lowered)}
+            if len(found) == 1:
+                row[c] = found.pop()
+        return row if row[0] != MISSING else None
+
+
+@lru_cache(maxsize=4096)
+def _matcher(categories: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> _GridMatcher:
+    return _GridMatcher(categories)
+
+
+def _freeze(categories: Dict[str, List[str]]) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    return tuple((title, tuple(items)) for title, items in categories.items())
+
+
+def parse_grid(text: Optional[str], categories: Dict[str, List[str]]) -> np.ndarray:
+    """
+    Parse the final answer table of a response into an assignment array.
+
+    Only "|"-separated lines after the last "Final Answer" marker are read (the whole text
+    when there is no marker); a later row for the same first-category item wins.
+
+    Args:
+        text (str): Model output
+        categories (dict): Category name to item labels, first category anchors the rows
+
+    Returns:
+        np.ndarray: int16 array (items, categories); -1 where nothing was matched
+    """
+    matcher = _matcher(_freeze(categories))
+    grid = np.full((matcher.n_items, matcher.n_categories), MISSING, dtype=np.int16)
+    if not isinstance(text, str) or not text:
+        return grid
+
+    markers = list(_FINAL_ANSWER.finditer(text))
+    if markers:
+        text = text[markers[-1].end():]
+    for line in text.split("\n"):
+        if "|" not in line:
+            continue
+        row = matcher.match_line(line)
+        if row is not None:
+            grid[row[0]] = row
+    return grid
+
+
+def reference_grid(puzzle: Dict[str, Any]) -> np.ndarray:
+    """Assignment array of a puzzle's reference answer, from its precomputed answer_indices."""
+    categories = puzzle["categories"]
+    grid = np.full((len(next(iter(categories.values()))), len(categories)), MISSING, dtype=np.int16)
+    for row in puzzle["answer_indices"]:
+        if row[0] != MISSING:
+            grid[row[0], :len(row)] = row[:len(categories)]
+    return grid
+
+
+def _stack(grids: List[np.ndarray]) -> np.ndarray:
+    rows = max((g.shape[0] for g in grids), default=0)
+    cols = max((g.shape[1] for g in grids), default=0)
+    stack = np.full((len(grids), rows, cols), PAD, dtype=np.int16)
+    for k, g in enumerate(grids):
+        stack[k, :g.shape[0], :g.shape[1]] = g
+    return stack
+
+
+def score_arrays(predicted: np.ndarray, reference: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Vectorized scoring of stacked assignment arrays.
+
+    Cells are the non-anchor columns of every reference row that has a known answer; a
+    cell is correct when the prediction names the same item.
+
+    Args:
+        predicted (np.ndarray): (N, rows, categories) predictions
+        reference (np.ndarray): (N, rows, categories) references, same shape
+
+    Returns:
+        dict: per-puzzle "correct" and "cells" counts, "cell_accuracy" and "solved" arrays
+    """
+    scored = reference[:, :, 1:] >= 0
+    correct = ((predicted[:, :, 1:] == reference[:, :, 1:]) & scored).sum(axis=(1, 2))
+    cells = scored.sum(axis=(1, 2))
+    accuracy = correct / np.maximum(cells, 1)
+    return {"correct": correct, "cells": cells, "cell_accuracy": accuracy, "solved": (cells > 0) & (correct == cells)}
+
+
+def score_prediction(puzzle: Dict[str, Any], text: Optional[str]) -> Dict[str, Any]:
+    """Exact-match and cell-level accuracy of a single response."""
+    scores = score_arrays(parse_grid(text, puzzle["categories"])[None], reference_grid(puzzle)[None])
+    return {"solved": bool(scores["solved"][0]), "cell_accuracy": float(scores["cell_accuracy"][0])}
+
+
+def score_outputs(puzzles: Iterable[Dict[str, Any]], columns: Optional[List[str]] = None,
+                  extra_outputs: Optional[Dict[str, Dict[int, str]]] = None):
+    """
+    Score every model column (and any extra runs) over a set of puzzles in one pass.
+
+    Args:
+        puzzles: Parsed puzzle records (PuzzleStore or parse_puzzle_row output)
+        columns (list): Model columns to score, defaults to all columns of the dataset
+        extra_outputs (dict): Additional runs as {run name: {puzzle id: response text}}
+
+    Returns:
+        pd.DataFrame: One row per (puzzle, model) with solved, cell_accuracy, correct and cells
+    """
+    import pandas as pd
+
+    columns = MODEL_COLUMNS if columns is None else columns
+    extra_outputs = extra_outputs or {}
+    ids, models, predicted, reference = [], [], [], []
+    for puzzle in puzzles:
+        ref = reference_grid(puzzle)
+        sources = [(model, puzzle["outputs"].get(model)) for model in columns]
+        sources += [(name, run.get(puzzle["id"])) for name, run in extra_outputs.items() if puzzle["id"] in run]
+        for model, text in sources:
+            ids.append(puzzle["id"])
+            models.append(model)
+            predicted.append(parse_grid(text, puzzle["categories"]))
+            reference.append(ref)
+
+    scores = score_arrays(_stack(predicted), _stack(reference))
+    return pd.DataFrame({"puzzle_id": ids, "model": models, **scores})
+
+
+def summarize_scores(scores):
+    """Exact-match rate and mean cell accuracy per model."""
+    return scores.groupby("model", sort=False).agg(puzzles=("puzzle_id", "count"), solved_rate=("solved", "mean"),
+                                                     cell_accuracy=("cell_accuracy", "mean"))
+
+
+if __name__ == "__main__":
+    from src.benchmark import load_puzzles
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "data/GridPuzzle_processed.csv"
+    print(summarize_scores(score_outputs(load_puzzles(path))).to_string())
@@ -0,0 +1,307 @@
+"""
+Structured tracing of agent calls and solver stages.
+
+Tracing is off by default; every instrumented call then costs one global lookup. After
+enable(), each traced call becomes a span with its name, start, duration, thread, parent
+span and attributes (agent_name, model, prompt/response sizes, token usage, retries, ...).
+Attributes set with trace_context() (e.g. the puzzle id) are attached to every span opened
+inside it. Finished spans are kept in memory, optionally appended to a JSONL file as they
+close, and can be exported to the Chrome trace-event format (chrome://tracing, Perfetto).
+
+Usage:
+    from src import tracing
+    tracer = tracing.enable("run.trace.jsonl")
+    with tracing.trace_context(puzzle_id=puzzle["id"]):
+        ...
+    tracer.export_chrome("run.trace.json")
+
+    python -m src.tracing run.trace.jsonl --chrome run.trace.json
+"""
+import argparse
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+_tracer: Optional["Tracer"] = None
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_context: contextvars.ContextVar = contextvars.ContextVar("trace_context", default={})
+
+
+class Tracer:
+    """
+    Collects finished spans.
+
+    Attributes:
+        spans: Finished span records, in the order they closed.
+        jsonl_path: File every span is appended to when it closes (None to keep them in memory only).
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None) -> None:
+        self.spans: List[Dict[str, Any]] = []
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._epoch_ns = time.perf_counter_ns()
+        self.started_at = time.time()
+        self._file = None
+        if jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+            self._file = open(jsonl_path, "a")
+
+    def _record(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(record)
+            if self._file is not None:
+                self._file.write(json.dumps(record, default=str) + "\n")
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def export_jsonl(self, path: str) -> None:
+        write_jsonl(self.spans, path)
+
+    def export_chrome(self, path: str) -> None:
+        write_chrome(self.spans, path)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return summarize(self.spans)
+
+
+class Span:
+    """An open span; use set() to attach attributes known only after the call, add() for counters."""
+
+    __slots__ = ("tracer", "name", "attrs", "span_id", "parent_id", "_start_ns", "_token")
+
+    def __init__(self, tracer: Tracer, name: str, attrs: Dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.attrs = {**_context.get(), **attrs}
+        self.span_id = next(tracer._ids)
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def add(self, key: str, amount: int = 1) -> None:
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        end_ns = time.perf_counter_ns()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Closed from another context, e.g. a streaming generator finalized elsewhere.
+            pass
+        thread = threading.current_thread()
+        self.tracer._record({
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_us": (self._start_ns - self.tracer._epoch_ns) / 1000,
+            "duration_us": (end_ns - self._start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "thread": thread.name,
+            "status": "ok" if exc_type is None else "error",
+            "error": None if exc_type is None else f"{exc_type.__name__}: {exc}",
+            "attrs": self.attrs,
+        })
+        return False
+
+
+class _NullSpan:
+    """Stand-in returned while tracing is disabled."""
+
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def add(self, key: str, amount: int = 1) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enable(jsonl_path: Optional[str] = None) -> Tracer:
+    """Start tracing into a new Tracer (replacing any active one) and return it."""
+    global _tracer
+    previous, _tracer = _tracer, Tracer(jsonl_path)
+    if previous is not None:
+        previous.close()
+    return _tracer
+
+
+def disable() -> Optional[Tracer]:
+    """Stop tracing; returns the tracer that was active so its spans can still be exported."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+    return tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def span(name: str, **attrs: Any):
+    """Context manager timing a block as a span (a no-op object while tracing is disabled)."""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, attrs)
+
+
+def current_span():
+    """The innermost open span of this thread/task, or a no-op span."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _current_span.get() or _NULL_SPAN
+
+
+@contextmanager
+def trace_context(**attrs: Any):
+    """Attach attributes (e.g. puzzle_id, pipeline) to every span opened inside the block."""
+    token = _context.set({**_context.get(), **attrs})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def traced(name: Optional[str] = None, attrs: Optional[Callable[..., Dict[str, Any]]] = None):
+    """
+    Decorator recording every call as a span.
+
+    The wrapper keeps the function's name, docstring and signature (functools.wraps), so
+    tool registries and prompts built from it are unchanged.
+
+    Args:
+        name (str): Span name, defaults to the function's qualified name
+        attrs (callable): Optional function of the call arguments returning span attributes
+    """
+    def decorate(fn):
+        span_name = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                tracer = _tracer
+                if tracer is None:
+                    return await fn(*args, **kwargs)
+                with Span(tracer, span_name, attrs(*args, **kwargs) if attrs else {}):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with Span(tracer, span_name, attrs(*args, **kwargs) if attrs else {}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def read_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_jsonl(spans: Iterable[Dict[str, Any]], path: str) -> None:
+    with open(path, "w") as f:
+        for record in spans:
+            f.write(json.dumps(record, default=str) + "\n")
+
+
+def to_chrome(spans: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Chrome trace-event document with one complete ("X") event per span."""
+    events = []
+    threads = {}
+    for record in spans:
+        threads[record["pid"], record["tid"]] = record.get("thread")
+        args = dict(record.get("attrs") or {})
+        if record.get("error"):
+            args["error"] = record["error"]
+        events.append({
+            "name": record["name"],
+            "cat": record["name"].split(".")[0],
+            "ph": "X",
+            "ts": record["start_us"],
+            "dur": record["duration_us"],
+            "pid": record["pid"],
+            "tid": record["tid"],
+            "args": args,
+        })
+    for (pid, tid), thread_name in threads.items():
+        if thread_name:
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_chrome(spans: Iterable[Dict[str, Any]], path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(to_chrome(spans), f, default=str)
+
+
+def summarize(spans: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Per span name: count, errors, total/mean/max seconds and summed token usage, slowest total first."""
+    stats: Dict[str, Dict[str, float]] = {}
+    for record in spans:
+        s = stats.setdefault(record["name"], {"count": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0,
+                                              "prompt_tokens": 0, "output_tokens": 0})
+        seconds = record["duration_us"] / 1e6
+        s["count"] += 1
+        s["errors"] += record.get("status") == "error"
+        s["total_s"] += seconds
+        s["max_s"] = max(s["max_s"], seconds)
+        attrs = record.get("attrs") or {}
+        s["prompt_tokens"] += attrs.get("prompt_tokens") or 0
+        s["output_tokens"] += attrs.get("output_tokens") or 0
+    for s in stats.values():
+        s["mean_s"] = s["total_s"] / s["count"]
+    return dict(sorted(stats.items(), key=lambda item: -item[1]["total_s"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a JSONL trace and optionally convert it for chrome://tracing")
+    parser.add_argument("trace", help="JSONL trace written by tracing.enable(path)")
+    parser.add_argument("--chrome", default=None, help="write a Chrome trace-event JSON file here")
+    args = parser.parse_args()
+
+    spans = read_jsonl(args.trace)
+    if args.chrome:
+        write_chrome(spans, args.chrome)
+    print(f"{'span':32s} {'count':>7s} {'errors':>6s} {'total s':>9s} {'mean s':>8s} {'max s':>8s} {'tokens':>9s}")
+    for span_name, s in summarize(spans).items():
+        print(f"{span_name:32s} {s['count']:7d} {s['errors']:6d} {s['total_s']:9.3f} {s['mean_s']:8.4f} "
+              f"{s['max_s']:8.4f} {s['prompt_tokens'] + s['output_tokens']:9d}")
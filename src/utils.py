@@ -1,18 +1,20 @@
 import inspect
+import re
 import numpy as np
-import pandas as pd
 import sys
 import os
 from itertools import combinations
 
 sys.path.append(os.path.dirname(os.getcwd()))
 from src.llm_engine import tools
+from src.tracing import span
 
 def run_agent_workflow(agent_name, user_query, system_prompt, agent_job, json, Agent):
     
-    instance_ = Agent(agent_name=agent_name, system_prompt=system_prompt+agent_job, json=json)
+    with span("run_agent_workflow", agent_name=agent_name):
+        instance_ = Agent(agent_name=agent_name, system_prompt=system_prompt+agent_job, json=json)
 
-    agent_response = instance_.perform_action(user_query)
+        agent_response = instance_.perform_action(user_query)
 
     return agent_response
 
@@ -33,6 +35,52 @@ def get_tabular_format_from_question(question):
     return "\n".join(res)
 
 
+def process_ls(ls):
+    if re.search(r"\d+",ls[0]) is None:
+        return ls
+
+    else:
+        res = []
+        for val in ls:
+            val = re.sub(r"[^\d+]", '', val)
+            res.append(val)
+        return res
+
+
+def process_question(question):
+    lines = question.split("\n")
+    categories = {}
+    clues = []
+    actual_question = ""
+    ckpt = -1
+    flag = -1
+    for index, line in enumerate(lines):
+
+
+        if ckpt == 1 and re.search(r"^\d+\.", line) is None:
+            break
+
+        if " : " in line:
+            if flag == -1:
+                flag = index
+            title, ls = line.split(" : ")[0], line.split(" : ")[1].split(", ")
+            ls = process_ls(ls)
+            categories[title] = ls
+        
+        if "Clues" in line:
+            ckpt = 1
+            continue
+        
+        if ckpt == 1 and re.search(r"\d+\.", line) is not None:
+            clues.append(line)
+        
+
+
+    actual_question += "\n".join(lines[:flag])            
+
+    return actual_question, categories, clues
+
+
 def process_categories(categories_str):
     cat_topics = []
     categories = []
@@ -0,0 +1,595 @@
+from typing import Dict, Iterator, List, Optional, Union
+
+
+def _popcount(domain: int) -> int:
+    return bin(domain).count("1")
+
+
+def _min_value(domain: int) -> int:
+    return (domain & -domain).bit_length() - 1
+
+
+def _max_value(domain: int) -> int:
+    return domain.bit_length() - 1
+
+
+def _values(domain: int) -> Iterator[int]:
+    while domain:
+        low = domain & -domain
+        yield low.bit_length() - 1
+        domain ^= low
+
+
+def _shift(domain: int, offset: int) -> int:
+    return domain << offset if offset >= 0 else domain >> -offset
+
+
+class _Constraint:
+    """
+    Base class for propagators. Every constraint works on the shared list of
+    bitmask domains, where bit v set in domains[i] means variable i may take value v.
+    """
+    vars: tuple = ()
+
+    def propagate(self, domains: List[int]) -> bool:
+        """Narrow the domains in place; return False when a domain is wiped out."""
+        return True
+
+    def status(self, domains: List[int]) -> Optional[bool]:
+        """Return True if entailed, False if violated and None if still undecided."""
+        return None
+
+    def negate(self) -> "_Constraint":
+        return _Not(self)
+
+
+class _Eq(_Constraint):
+    def __init__(self, x: int, y: int) -> None:
+        self.x, self.y = x, y
+        self.vars = (x, y)
+
+    def propagate(self, domains):
+        common = domains[self.x] & domains[self.y]
+        domains[self.x] = domains[self.y] = common
+        return common != 0
+
+    def status(self, domains):
+        dx, dy = domains[self.x], domains[self.y]
+        if dx & dy == 0:
+            return False
+        if dx == dy and _popcount(dx) == 1:
+            return True
+        return None
+
+    def negate(self):
+        return _Ne(self.x, self.y)
+
+
+class _Ne(_Constraint):
+    def __init__(self, x: int, y: int) -> None:
+        self.x, self.y = x, y
+        self.vars = (x, y)
+
+    def propagate(self, domains):
+        dx, dy = domains[self.x], domains[self.y]
+        if _popcount(dx) == 1:
+            dy &= ~dx
+            domains[self.y] = dy
+        if _popcount(dy) == 1:
+            dx &= ~dy
+            domains[self.x] = dx
+        return dx != 0 and dy != 0
+
+    def status(self, domains):
+        dx, dy = domains[self.x], domains[self.y]
+        if dx & dy == 0:
+            return True
+        if dx == dy and _popcount(dx) == 1:
+            return False
+        return None
+
+    def negate(self):
+        return _Eq(self.x, self.y)
+
+
+class _Lt(_Constraint):
+    """x < y"""
+    def __init__(self, x: int, y: int) -> None:
+        self.x, self.y = x, y
+        self.vars = (x, y)
+
+    def propagate(self, domains):
+        dx, dy = domains[self.x], domains[self.y]
+        if dx == 0 or dy == 0:
+            return False
+        dx &= (1 << _max_value(dy)) - 1
+        if dx == 0:
+            domains[self.x] = 0
+            return False
+        dy &= ~((1 << (_min_value(dx) + 1)) - 1)
+        domains[self.x], domains[self.y] = dx, dy
+        return dy != 0
+
+    def status(self, domains):
+        dx, dy = domains[self.x], domains[self.y]
+        if _max_value(dx) < _min_value(dy):
+            return True
+        if _min_value(dx) >= _max_value(dy):
+            return False
+        return None
+
+    def negate(self):
+        return _Le(self.y, self.x)
+
+
+class _Le(_Constraint):
+    """x <= y"""
+    def __init__(self, x: int, y: int) -> None:
+        self.x, self.y = x, y
+        self.vars = (x, y)
+
+    def propagate(self, domains):
+        dx, dy = domains[self.x], domains[self.y]
+        if dx == 0 or dy == 0:
+            return False
+        dx &= (1 << (_max_value(dy) + 1)) - 1
+        if dx == 0:
+            domains[self.x] = 0
+            return False
+        dy &= ~((1 << _min_value(dx)) - 1)
+        domains[self.x], domains[self.y] = dx, dy
+        return dy != 0
+
+    def status(self, domains):
+        dx, dy = domains[self.x], domains[self.y]
+        if _max_value(dx) <= _min_value(dy):
+            return True
+        if _min_value(dx) > _max_value(dy):
+            return False
+        return None
+
+    def negate(self):
+        return _Lt(self.y, self.x)
+
+
+class _Offset(_Constraint):
+    """x == y + offset"""
+    def __init__(self, x: int, y: int, offset: int) -> None:
+        self.x, self.y, self.offset = x, y, offset
+        self.vars = (x, y)
+
+    def propagate(self, domains):
+        dx = domains[self.x] & _shift(domains[self.y], self.offset)
+        dy = domains[self.y] & _shift(dx, -self.offset)
+        domains[self.x], domains[self.y] = dx, dy
+        return dx != 0 and dy != 0
+
+    def status(self, domains):
+        dx, dy = domains[self.x], domains[self.y]
+        shifted = _shift(dy, self.offset)
+        if dx & shifted == 0:
+            return False
+        if dx == shifted and _popcount(dx) == 1:
+            return True
+        return None
+
+    def negate(self):
+        return _NotOffset(self.x, self.y, self.offset)
+
+
+class _NotOffset(_Constraint):
+    """x != y + offset"""
+    def __init__(self, x: int, y: int, offset: int) -> None:
+        self.x, self.y, self.offset = x, y, offset
+        self.vars = (x, y)
+
+    def propagate(self, domains):
+        dx, dy = domains[self.x], domains[self.y]
+        if _popcount(dy) == 1:
+            dx &= ~_shift(dy, self.offset)
+            domains[self.x] = dx
+        if _popcount(dx) == 1:
+            dy &= ~_shift(dx, -self.offset)
+            domains[self.y] = dy
+        return dx != 0 and dy != 0
+
+    def status(self, domains):
+        result = _Offset(self.x, self.y, self.offset).status(domains)
+        return None if result is None else not result
+
+    def negate(self):
+        return _Offset(self.x, self.y, self.offset)
+
+
+class _Distinct(_Constraint):
+    def __init__(self, variables: List[int]) -> None:
+        self.vars = tuple(variables)
+
+    def propagate(self, domains):
+        changed = True
+        while changed:
+            changed = False
+            union = 0
+            for v in self.vars:
+                d = domains[v]
+                if d == 0:
+                    return False
+                union |= d
+                if _popcount(d) == 1:
+                    for w in self.vars:
+                        if w != v and domains[w] & d:
+                            domains[w] &= ~d
+                            if domains[w] == 0:
+                                return False
+                            changed = True
+            if _popcount(union) < len(self.vars):
+                return False
+            if _popcount(union) == len(self.vars):
+                # Every value must be used: a value left in a single domain is forced.
+                for value in _values(union):
+                    bit = 1 << value
+                    holders = [v for v in self.vars if domains[v] & bit]
+                    if not holders:
+                        return False
+                    if len(holders) == 1 and domains[holders[0]] != bit:
+                        domains[holders[0]] = bit
+                        changed = True
+        return True
+
+    def status(self, domains):
+        seen = 0
+        for v in self.vars:
+            d = domains[v]
+            if _popcount(d) != 1:
+                return None
+            if seen & d:
+                return False
+            seen |= d
+        return True
+
+
+class _And(_Constraint):
+    def __init__(self, children: List[_Constraint]) -> None:
+        self.children = children
+        self.vars = tuple(sorted({v for c in children for v in c.vars}))
+
+    def propagate(self, domains):
+        return all(c.propagate(domains) for c in self.children)
+
+    def status(self, domains):
+        statuses = [c.status(domains) for c in self.children]
+        if False in statuses:
+            return False
+        if all(statuses):
+            return True
+        return None
+
+    def negate(self):
+        return _Or([c.negate() for c in self.children])
+
+
+class _Or(_Constraint):
+    def __init__(self, children: List[_Constraint]) -> None:
+        self.children = children
+        self.vars = tuple(sorted({v for c in children for v in c.vars}))
+
+    def propagate(self, domains):
+        open_children = []
+        for c in self.children:
+            s = c.status(domains)
+            if s is True:
+                return True
+            if s is None:
+                open_children.append(c)
+        if not open_children:
+            return False
+        if len(open_children) == 1:
+            return open_children[0].propagate(domains)
+        return True
+
+    def status(self, domains):
+        statuses = [c.status(domains) for c in self.children]
+        if True in statuses:
+            return True
+        if all(s is False for s in statuses):
+            return False
+        return None
+
+    def negate(self):
+        return _And([c.negate() for c in self.children])
+
+
+class _Not(_Constraint):
+    def __init__(self, child: _Constraint) -> None:
+        self.child = child
+        self.vars = child.vars
+
+    def propagate(self, domains):
+        return self.child.status(domains) is not True
+
+    def status(self, domains):
+        s = self.child.status(domains)
+        return None if s is None else not s
+
+    def negate(self):
+        return self.child
+
+
+class BitsetSolver:
+    """
+    Finite-domain propagation engine for logic-grid puzzles with the same clue API as ConstraintSolver.
+
+    Every (category, item) variable keeps its domain as a bitmask of allowed values, and
+    clues are propagated to a fixed point before a small backtracking search (dom/wdeg branching,
+    independent groups of variables searched separately). It is meant as a fast path for the all-different assignment problems in GridPuzzle;
+    ConstraintSolver stays the general fallback.
+
+    Attributes:
+        categories: Mapping from category names to list of item identifiers.
+        vars: Mapping from category name to item name to variable index.
+        domains: Bitmask domain per variable index (bit v set means value v is allowed).
+    """
+    def __init__(self, categories: Dict[str, List[str]]) -> None:
+        """
+        Initialize the engine with categories but do not auto-create variables.
+
+        Inputs:
+            categories: dict mapping category name to list of item names
+        """
+        self.categories = categories
+        self.vars: Dict[str, Dict[str, int]] = {}
+        self.domains: List[int] = []
+        self.constraints: List[_Constraint] = []
+        self._decision_vars: List[int] = []
+        self._constants: Dict[int, int] = {}
+        self._weights: List[int] = []
+        self._solution: Optional[Dict[str, Dict[str, int]]] = None
+        self._solved = False
+
+    def _new_var(self, domain: int) -> int:
+        self.domains.append(domain)
+        self._solved = False
+        return len(self.domains) - 1
+
+    def _term(self, category: Optional[str], item: Union[str, int]) -> int:
+        """Resolve an item name to its variable index and a literal int to a fixed constant variable."""
+        if isinstance(item, str):
+            return self.vars[category][item]
+        if item < 0:
+            raise ValueError("BitsetSolver only supports non-negative values")
+        if item not in self._constants:
+            self._constants[item] = self._new_var(1 << item)
+        return self._constants[item]
+
+    def create_category_vars(self, category: str, dtype: str = 'int') -> None:
+        """
+        Declare variables for all items in a category. Int variables start with the domain
+        1..len(items), the convention used with ConstraintSolver; use set_category_domain to change it.
+
+        Inputs:
+            category: Category identifier matching a key in self.categories
+            dtype: 'int' for Int, 'bool' for Bool (domain {0, 1})
+        """
+        if self.vars.get(category) is None:
+            self.vars[category] = {}
+
+        items = self.categories.get(category, [])
+        domain = 0b11 if dtype == 'bool' else ((1 << (len(items) + 1)) - 1) & ~1
+
+        for item in items:
+            v = self._new_var(domain)
+            self._decision_vars.append(v)
+            self.vars[category][item] = v
+
+        return
+
+    def set_category_domain(self, category: str, lower: int = None, upper: int = None) -> None:
+        """
+        Set the domain of all variables in a category to [lower, upper]. A bound left as
+        None keeps the current one.
+
+        Inputs:
+            category: Category identifier
+            lower: Minimum allowed value (inclusive)
+            upper: Maximum allowed value (inclusive)
+        """
+        if lower is not None and lower < 0:
+            raise ValueError("BitsetSolver only supports non-negative values")
+        for item in self.categories.get(category, []):
+            v = self.vars[category][item]
+            low = _min_value(self.domains[v]) if lower is None else lower
+            high = _max_value(self.domains[v]) if upper is None else upper
+            self.domains[v] = ((1 << (high + 1)) - 1) & ~((1 << low) - 1) if high >= low else 0
+        self._solved = False
+
+        return
+
+    def add_distinct(self, category: str) -> None:
+        """
+        Add an all-different constraint for all variables within the specified category.
+
+        Args:
+            category (str): The category name. Must be a valid key in self.categories.
+        Returns:
+            None: This function does not return a value.
+        """
+        vars_ = [self.vars[category][item] for item in self.categories[category]]
+        self.add_constraint_to_solver(_Distinct(vars_))
+
+        return
+
+    def add_constraint_to_solver(self, constraint: Union[_Constraint, List[_Constraint]]) -> None:
+        """
+        Adds a constraint (or a list of constraints) to the engine.
+
+        Args:
+            constraint: A constraint returned by one of the add_* clue builders
+        """
+        if isinstance(constraint, _Constraint):
+            self.constraints.append(constraint)
+        elif isinstance(constraint, list):
+            self.constraints.extend(constraint)
+        self._solved = False
+
+        return
+
+    def add_eq(self, category_a: str, a: str, category_b: str, b: Union[str, int]) -> _Constraint:
+        """Creates a constraint that variable a equals b (an item of category_b or a literal int)."""
+        return _Eq(self._term(category_a, a), self._term(category_b, b))
+
+    def add_ne(self, category_a: str, item_a: str, category_b: str, item_b: Union[str, int]) -> _Constraint:
+        """Creates a constraint that variable a is not equal to b."""
+        return _Ne(self._term(category_a, item_a), self._term(category_b, item_b))
+
+    def add_lt(self, category_a: str, a: str, category_b: str, b: Union[str, int]) -> _Constraint:
+        """Creates a constraint that variable a is less than b."""
+        return _Lt(self._term(category_a, a), self._term(category_b, b))
+
+    def add_le(self, category_a: str, a: str, category_b: str, b: Union[str, int]) -> _Constraint:
+        """Creates a constraint that variable a is less than or equal to b."""
+        return _Le(self._term(category_a, a), self._term(category_b, b))
+
+    def add_gt(self, category_a: str, a: str, category_b: str, b: Union[str, int]) -> _Constraint:
+        """Creates a constraint that variable a is greater than b."""
+        return _Lt(self._term(category_b, b), self._term(category_a, a))
+
+    def add_ge(self, category_a: str, a: str, category_b: str, b: Union[str, int]) -> _Constraint:
+        """Creates a constraint that variable a is greater than or equal to b."""
+        return _Le(self._term(category_b, b), self._term(category_a, a))
+
+    def add_offset(self, category_a: str, a: str, category_b: str, b: str, offset: Union[str, int]) -> _Constraint:
+        """Creates a constraint that variable a equals variable b plus offset (a - b == offset)."""
+        return _Offset(self._term(category_a, a), self._term(category_b, b), int(offset))
+
+    def add_and(self, constraint_A: _Constraint, constraint_B: _Constraint) -> _Constraint:
+        """Returns (constraint_A AND constraint_B)."""
+        return _And([constraint_A, constraint_B])
+
+    def add_or(self, constraint_A: _Constraint, constraint_B: _Constraint) -> _Constraint:
+        """Returns (constraint_A OR constraint_B)."""
+        return _Or([constraint_A, constraint_B])
+
+    def add_xor(self, constraint_A: _Constraint, constraint_B: _Constraint) -> _Constraint:
+        """Returns (constraint_A XOR constraint_B)."""
+        return _Or([_And([constraint_A, constraint_B.negate()]), _And([constraint_A.negate(), constraint_B])])
+
+    def add_nand(self, constraint_A: _Constraint, constraint_B: _Constraint) -> _Constraint:
+        """Returns NOT(constraint_A AND constraint_B)."""
+        return _And([constraint_A, constraint_B]).negate()
+
+    def add_nor(self, constraint_A: _Constraint, constraint_B: _Constraint) -> _Constraint:
+        """Returns NOT(constraint_A OR constraint_B)."""
+        return _Or([constraint_A, constraint_B]).negate()
+
+    def add_implies(self, category_a: str, item_a: str, category_b: str, item_b: str) -> _Constraint:
+        """Constrain implication a -> b over bool variable keys."""
+        return _Or([_Eq(self._term(category_a, item_a), self._term(None, 0)),
+                    _Eq(self._term(category_b, item_b), self._term(None, 1))])
+
+    def _propagate(self, domains: List[int], watchers: List[List[int]], queue: List[int]) -> bool:
+        queued = set(queue)
+        while queue:
+            index = queue.pop()
+            queued.discard(index)
+            constraint = self.constraints[index]
+            before = [domains[v] for v in constraint.vars]
+            if not constraint.propagate(domains):
+                self._weights[index] += 1
+                return False
+            for v, old in zip(constraint.vars, before):
+                if domains[v] != old:
+                    if domains[v] == 0:
+                        self._weights[index] += 1
+                        return False
+                    for w in watchers[v]:
+                        if w not in queued:
+                            queued.add(w)
+                            queue.append(w)
+        return True
+
+    def _search(self, domains: List[int], watchers: List[List[int]], queue: List[int],
+                decision_vars: List[int]) -> Iterator[List[int]]:
+        if not self._propagate(domains, watchers, queue):
+            return
+        # dom/wdeg: branch on the variable with the smallest domain relative to how often
+        # its constraints have failed, so the search focuses on the conflicting part of the grid.
+        branch_var, branch_key = None, None
+        for v in decision_vars:
+            size = _popcount(domains[v])
+            if size > 1:
+                key = size / sum(self._weights[c] for c in watchers[v]) if watchers[v] else size
+                if branch_key is None or key < branch_key:
+                    branch_var, branch_key = v, key
+        if branch_var is None:
+            if all(self.constraints[c].status(domains) is not False for v in decision_vars for c in watchers[v]):
+                yield domains
+            return
+        for value in _values(domains[branch_var]):
+            child = domains.copy()
+            child[branch_var] = 1 << value
+            yield from self._search(child, watchers, list(watchers[branch_var]), decision_vars)
+
+    def _components(self) -> List[List[int]]:
+        """Group decision variables that share a constraint; each group can be searched independently."""
+        parent = {v: v for v in self._decision_vars}
+
+        def find(v):
+            while parent[v] != v:
+                parent[v] = parent[parent[v]]
+                v = parent[v]
+            return v
+
+        for constraint in self.constraints:
+            linked = [v for v in constraint.vars if v in parent]
+            for v in linked[1:]:
+                parent[find(v)] = find(linked[0])
+        groups: Dict[int, List[int]] = {}
+        for v in self._decision_vars:
+            groups.setdefault(find(v), []).append(v)
+        return list(groups.values())
+
+    def solutions(self) -> Iterator[Dict[str, Dict[str, int]]]:
+        """Lazily enumerate all solutions as {category: {item: value}} mappings."""
+        self._weights = [1] * len(self.constraints)
+        watchers: List[List[int]] = [[] for _ in self.domains]
+        for index, constraint in enumerate(self.constraints):
+            for v in constraint.vars:
+                watchers[v].append(index)
+        components = self._components()
+
+        def component_solutions(decision_vars):
+            queue = sorted({c for v in decision_vars for c in watchers[v]})
+            return self._search(self.domains.copy(), watchers, queue, decision_vars)
+
+        # Solve the hardest-to-satisfy components first so an unsatisfiable one fails fast.
+        components.sort(key=lambda vs: -sum(len(watchers[v]) for v in vs))
+        if any(next(component_solutions(vs), None) is None for vs in components):
+            return
+
+        def combine(index, domains):
+            if index == len(components):
+                yield domains
+                return
+            for partial in component_solutions(components[index]):
+                merged = domains.copy()
+                for v in components[index]:
+                    merged[v] = partial[v]
+                yield from combine(index + 1, merged)
+
+        for domains in combine(0, self.domains.copy()):
+            yield self._decode(domains)
+
+    def _decode(self, domains: List[int]) -> Dict[str, Dict[str, int]]:
+        return {category: {item: _min_value(domains[v]) for item, v in items.items()}
+                for category, items in self.vars.items()}
+
+    def check(self) -> bool:
+        """Check if current constraints are satisfiable."""
+        if not self._solved:
+            self._solution = next(self.solutions(), None)
+            self._solved = True
+        return self._solution is not None
+
+    def model(self) -> Optional[Dict[str, Dict[str, int]]]:
+        """Get the first solution as {category: {item: value}}, or None if unsatisfiable."""
+        return self._solution if self.check() else None
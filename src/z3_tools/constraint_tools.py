@@ -1,25 +1,193 @@
-from z3 import Solver, Int, Bool, Or, And, Not, Xor, Implies, Distinct, If, sat, BoolRef
-from typing import Dict, List, Union
+from z3 import (Solver, SolverFor, Int, Bool, BoolVal, Or, And, Not, Xor, Implies, Distinct, If, Sum, PbEq, AtMost, sat,
+                BoolRef, CheckSatResult)
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple, Union
+
+from src.tracing import span
+
+ENCODINGS = ("int", "onehot")
+
+
+class _OneHotVar:
+    """
+    An integer-valued item in the one-hot encoding: one Bool per allowed value, exactly one true.
+
+    Comparisons with other one-hot variables or int literals compile to clauses over the
+    value bits, so the add_* builders keep working unchanged; arithmetic falls back to the
+    equivalent Sum(If(bit, value, 0)) term.
+    """
+
+    __hash__ = object.__hash__
+
+    def __init__(self, name: str, lower: int, upper: int) -> None:
+        self.name = name
+        self.bits = {v: Bool(f"{name}={v}") for v in range(lower, upper + 1)}
+        self._bounds: Dict[tuple, BoolRef] = {}
+
+    def value(self):
+        """Integer term equal to the selected value."""
+        return Sum([If(bit, v, 0) for v, bit in self.bits.items()])
+
+    def exactly_one(self) -> BoolRef:
+        return PbEq([(bit, 1) for bit in self.bits.values()], 1)
+
+    def _is(self, v: int) -> BoolRef:
+        return self.bits.get(v, BoolVal(False))
+
+    def _at_least(self, v: int) -> BoolRef:
+        """value >= v; cached because ordering clues reuse the same bounds many times."""
+        key = (">=", v)
+        if key not in self._bounds:
+            bits = [bit for w, bit in self.bits.items() if w >= v]
+            self._bounds[key] = Or(bits) if bits else BoolVal(False)
+        return self._bounds[key]
+
+    def _at_most(self, v: int) -> BoolRef:
+        key = ("<=", v)
+        if key not in self._bounds:
+            bits = [bit for w, bit in self.bits.items() if w <= v]
+            self._bounds[key] = Or(bits) if bits else BoolVal(False)
+        return self._bounds[key]
+
+    def _each_value(self, implied) -> BoolRef:
+        """And over the values v of self of (self == v -> implied(v))."""
+        return And([Implies(bit, implied(v)) for v, bit in self.bits.items()])
+
+    def offset_eq(self, other: "_OneHotVar", offset: int) -> BoolRef:
+        """self - other == offset as clauses."""
+        return self._each_value(lambda v: other._is(v - offset))
+
+    def __eq__(self, other):
+        if isinstance(other, _OneHotVar):
+            return self._each_value(other._is)
+        if isinstance(other, int):
+            return self._is(other)
+        return self.value() == other
+
+    def __ne__(self, other):
+        return Not(self.__eq__(other))
+
+    def __lt__(self, other):
+        if isinstance(other, _OneHotVar):
+            return self._each_value(lambda v: other._at_least(v + 1))
+        if isinstance(other, int):
+            return self._at_most(other - 1)
+        return self.value() < other
+
+    def __le__(self, other):
+        if isinstance(other, _OneHotVar):
+            return self._each_value(other._at_least)
+        if isinstance(other, int):
+            return self._at_most(other)
+        return self.value() <= other
+
+    def __gt__(self, other):
+        if isinstance(other, _OneHotVar):
+            return self._each_value(lambda v: other._at_most(v - 1))
+        if isinstance(other, int):
+            return self._at_least(other + 1)
+        return self.value() > other
+
+    def __ge__(self, other):
+        if isinstance(other, _OneHotVar):
+            return self._each_value(other._at_most)
+        if isinstance(other, int):
+            return self._at_least(other)
+        return self.value() >= other
+
+    def __add__(self, other):
+        return self.value() + other
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self.value() - (other.value() if isinstance(other, _OneHotVar) else other)
+
+    def __rsub__(self, other):
+        return other - self.value()
+
+    def __mul__(self, other):
+        return self.value() * other
+
+    def __floordiv__(self, other):
+        return self.value() / other
+
+    def __mod__(self, other):
+        return self.value() % other
+
+
+def differing_pairs(assignments: List[Dict[str, Dict[str, int]]]) -> List[Tuple[str, str, str, str]]:
+    """
+    Grid cells that are not settled across solutions.
+
+    Args:
+        assignments: Solutions as {category: {item: value}}, e.g. from enumerate_models()
+
+    Returns:
+        list: (category_a, item_a, category_b, item_b) for every pair of items from two categories
+              that share a row in some solutions but not in others
+    """
+    if len(assignments) < 2:
+        return []
+    pairs = []
+    first = assignments[0]
+    for cat_a, cat_b in combinations(list(first), 2):
+        for item_a in first[cat_a]:
+            for item_b in first[cat_b]:
+                linked = {m[cat_a][item_a] == m[cat_b][item_b] for m in assignments}
+                if len(linked) > 1:
+                    pairs.append((cat_a, item_a, cat_b, item_b))
+    return pairs
+
+
+def offset_eq(left, right, offset: int) -> BoolRef:
+    """left - right == offset, as clauses when both sides are one-hot variables."""
+    if isinstance(left, _OneHotVar) and isinstance(right, _OneHotVar):
+        return left.offset_eq(right, offset)
+    return left - right == offset
+
 
 class ConstraintSolver:
     """
     Wrapper around Z3 Solver providing category-based and individual constraint operations.
 
+    Clues added with add_clue are guarded by named assumption literals, so a single clue
+    can be replaced or dropped without rebuilding the solver, and the last check result and
+    model are cached until the constraint set changes.
+
+    With encoding="onehot" integer items are Boolean value matrices (one row of bits per
+    item, exactly-one per row as PbEq, at-most-one per value for add_distinct) and the
+    comparison builders emit clauses instead of arithmetic; the API is the same. Domains
+    must be set before clues are built in this mode.
+
     Attributes:
         solver: Z3 Solver instance.
         categories: Mapping from category names to list of item identifiers.
         vars: Mapping from variable keys ("category|item") to Z3 Int/Bool variables.
+        clues: Mapping from clue names to their active assumption literals.
+        encoding: "int" (arithmetic) or "onehot" (Boolean / pseudo-Boolean).
     """
-    def __init__(self, categories: Dict[str, List[str]]) -> None:
+    def __init__(self, categories: Dict[str, List[str]], encoding: str = "int") -> None:
         """
         Initialize the wrapper with categories but do not auto-create variables.
 
         Inputs:
             categories: dict mapping category name to list of item names
+            encoding: "int" or "onehot"
         """
-        self.solver = Solver()
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding!r}, expected one of {ENCODINGS}")
+        self.solver = SolverFor("QF_FD") if encoding == "onehot" else Solver()
         self.categories = categories
+        self.encoding = encoding
         self.vars: Dict[str, Union[Int, Bool]] = {}
+        # One-hot categories whose exactly-one constraints are not asserted yet (their domain may still change).
+        self._pending_onehot: Dict[str, bool] = {}
+        self.clues: Dict[str, BoolRef] = {}
+        self._clue_counter = 0
+        self._scopes: List[tuple] = []
+        self._last_result: Optional[CheckSatResult] = None
+        self._last_model = None
 
     def create_category_vars(self, category: str, dtype: str = 'int') -> None:
         """
@@ -38,9 +206,13 @@ class ConstraintSolver:
         for item in items:
             if dtype == 'bool':
                 v = Bool(item)
+            elif self.encoding == "onehot":
+                v = _OneHotVar(f"{category}|{item}", 1, len(items))
             else:
                 v = Int(item)
             self.vars[category][item] = v
+        if dtype != 'bool' and self.encoding == "onehot":
+            self._pending_onehot[category] = True
 
         return
 
@@ -53,15 +225,40 @@ class ConstraintSolver:
             lower: Minimum allowed value (inclusive)
             upper: Maximum allowed value (inclusive)
         """
+        self.add_constraint_to_solver(self.domain_constraints(category, lower, upper))
+
+        return
+
+    def domain_constraints(self, category: str, lower: int = None, upper: int = None) -> List[BoolRef]:
+        """
+        Bound constraints for every integer variable in a category (see set_category_domain).
+
+        In the one-hot encoding the value bits are rebuilt for the new range while the category
+        is still unused; afterwards the domain can only shrink.
+        """
+        if self.encoding == "onehot" and category in self._pending_onehot:
+            for item, v in self.vars[category].items():
+                if isinstance(v, _OneHotVar):
+                    low = min(v.bits) if lower is None else lower
+                    high = max(v.bits) if upper is None else upper
+                    self.vars[category][item] = _OneHotVar(v.name, low, high)
+            return []
+
+        constraints = []
         for item in self.categories.get(category, []):
             v = self.vars[category][item]
-            if v is not None:
+            if isinstance(v, _OneHotVar):
+                if (lower is not None and lower < min(v.bits)) or (upper is not None and upper > max(v.bits)):
+                    raise ValueError(f"Cannot widen the one-hot domain of {category!r} after it was used")
+                constraints += [Not(bit) for value, bit in v.bits.items()
+                                if (lower is not None and value < lower) or (upper is not None and value > upper)]
+            elif v is not None:
                 if lower is not None:
-                    self.add_constraint_to_solver(v >= lower)
+                    constraints.append(v >= lower)
                 if upper is not None:
-                    self.add_constraint_to_solver(v <= upper)
+                    constraints.append(v <= upper)
 
-        return
+        return constraints
 
     def add_distinct(self, category: str) -> None:
         """
@@ -77,15 +274,33 @@ class ConstraintSolver:
         Returns:
             None: This function does not return a value.
         """
+        self.add_constraint_to_solver(self.distinct_constraints(category))
+
+        return
+
+    def distinct_constraints(self, category: str) -> List[BoolRef]:
+        """
+        All-different constraint(s) for a category: Distinct over the Int variables, or
+        at-most-one item per value (exactly-one when items and values match up) when one-hot.
+        """
         vars_ = []
         category_list = self.categories[category]
         for item in category_list:
             var = self.vars[category][item]
             vars_.append(var)
-        
-        self.add_constraint_to_solver(Distinct(vars_))
 
-        return
+        if not vars_ or not isinstance(vars_[0], _OneHotVar):
+            return [Distinct(vars_)]
+
+        values = sorted({value for var in vars_ for value in var.bits})
+        constraints = []
+        for value in values:
+            bits = [var.bits[value] for var in vars_ if value in var.bits]
+            if len(values) == len(vars_) and len(bits) == len(vars_):
+                constraints.append(PbEq([(bit, 1) for bit in bits], 1))
+            else:
+                constraints.append(AtMost(*bits, 1))
+        return constraints
     
     def add_constraint_to_solver(self, constraint: Union[BoolRef, list[BoolRef]]) -> None:
         """
@@ -100,11 +315,130 @@ class ConstraintSolver:
         if isinstance(constraint, BoolRef):
             self.solver.add(constraint)
         elif isinstance(constraint, list):
-            for constrain in constraint:
-                self.solver.add(constrain)
+            self.solver.add(*constraint)
+        self._invalidate()
+        
+        return
+
+    def add_clue(self, name: str, constraint: Union[BoolRef, list[BoolRef]]) -> None:
+        """
+        Adds a constraint as a named clue that can later be replaced or removed.
+        
+        The constraint is guarded by a fresh assumption literal (clue -> constraint) and the
+        literal is passed to every check, so swapping a clue keeps the rest of the solver state.
+        
+        Args:
+            name (str): Identifier of the clue, e.g. "clue_3"
+            constraint Union[BoolRef, list]: The Z3 constraint(s) encoding the clue
         
+        Returns:
+            None
+        """
+        if name in self.clues:
+            self.remove_clue(name)
+        if isinstance(constraint, list):
+            constraint = And(constraint)
+        self._clue_counter += 1
+        literal = Bool(f"__clue__{name}__{self._clue_counter}")
+        self.solver.add(Implies(literal, constraint))
+        self.clues[name] = literal
+        self._invalidate()
+
+        return
+
+    def remove_clue(self, name: str) -> None:
+        """
+        Deactivates a named clue by no longer assuming its literal.
+        
+        Args:
+            name (str): Identifier of the clue to remove
+        
+        Returns:
+            None
+        """
+        literal = self.clues.pop(name)
+        # Literals are never reused, so fixing this one to False only disables the old clue.
+        self.solver.add(Not(literal))
+        self._invalidate()
+
+        return
+
+    def replace_clue(self, name: str, constraint: Union[BoolRef, list[BoolRef]]) -> None:
+        """
+        Replaces the constraint behind a named clue, e.g. after the LLM revised it.
+        
+        Args:
+            name (str): Identifier of the clue
+            constraint Union[BoolRef, list]: The new Z3 constraint(s) for the clue
+        
+        Returns:
+            None
+        """
+        self.add_clue(name, constraint)
+
         return
 
+    def push(self) -> None:
+        """Open a checkpoint; constraints and clue changes after it are undone by pop()."""
+        self._assert_onehot()
+        self.solver.push()
+        self._scopes.append((dict(self.clues), set(self._onehot_categories())))
+
+        return
+
+    def pop(self) -> None:
+        """Return to the state of the most recent push()."""
+        self.solver.pop()
+        self.clues, asserted = self._scopes.pop()
+        # One-hot categories created inside the scope lost their exactly-one constraints with it.
+        for category in self._onehot_categories():
+            if category not in asserted:
+                self._pending_onehot[category] = True
+        self._invalidate()
+
+        return
+
+    def unsat_clues(self) -> List[str]:
+        """Names of the clues in the unsat core of the last failed check, i.e. the conflicting clues."""
+        if self.check():
+            return []
+        core = {str(literal) for literal in self.solver.unsat_core()}
+        return [name for name, literal in self.clues.items() if str(literal) in core]
+
+    def _onehot_categories(self) -> List[str]:
+        return [category for category, items in self.vars.items()
+                if any(isinstance(v, _OneHotVar) for v in items.values())]
+
+    def _assert_onehot(self) -> None:
+        """Assert exactly-one per item for one-hot categories whose domain is now final."""
+        for category in list(self._pending_onehot):
+            del self._pending_onehot[category]
+            self.solver.add([v.exactly_one() for v in self.vars[category].values() if isinstance(v, _OneHotVar)])
+            self._invalidate()
+
+    def blocking_clause(self, model, categories: Optional[List[str]] = None) -> BoolRef:
+        """
+        Clause excluding the given model's assignment of the (decision) variables in the given
+        categories (all integer categories by default), over the value bits when one-hot.
+        """
+        literals = []
+        for category in categories or list(self.vars):
+            for var in self.vars[category].values():
+                if isinstance(var, _OneHotVar):
+                    literals += [Not(bit) for bit in var.bits.values() if model.eval(bit, model_completion=True)]
+                elif not isinstance(var, BoolRef):
+                    literals.append(var != model.eval(var, model_completion=True))
+        return Or(literals)
+
+    def value_expr(self, category: str, item: str):
+        """Integer term for an item's value in either encoding (for model evaluation)."""
+        var = self.vars[category][item]
+        return var.value() if isinstance(var, _OneHotVar) else var
+
+    def _invalidate(self) -> None:
+        self._last_result = None
+        self._last_model = None
+
     def increment_val(self, category: str, item: str, value: str) -> int:
         """
         Increment a variable's value by the specified amount.
@@ -292,6 +626,24 @@ class ConstraintSolver:
         right = self.vars[category_b][b] if isinstance(b, str) else b
         return left >= right
 
+    def add_offset(self, category_a: str, a: str, category_b: str, b: str, offset: Union[str, int]) -> BoolRef:
+        """
+        Creates a constraint that variable a equals variable b plus offset, e.g. "a is two places after b".
+        
+        Args:
+            category_a (str): The first category to match in self.vars lookup table
+            a (str): The specific item from the matched category
+            category_b (str): The second category to match in self.vars lookup table
+            b (str): The specific item from the matched category
+            offset (Union[str, int]): The difference a - b (will be converted to int)
+        
+        Returns:
+            BoolRef: A Z3 boolean reference representing the constraint (a - b == offset)
+        """
+        left = self.vars[category_a][a]
+        right = self.vars[category_b][b]
+        return offset_eq(left, right, int(offset))
+
     def add_and(self, constraint_A: BoolRef, constraint_B: BoolRef) -> BoolRef:
         """
         This function takes in two constraints from Z3 solver library and performs And 
@@ -367,10 +719,105 @@ class ConstraintSolver:
         """Constrain implication a -> b over variable keys."""
         return Implies(self.vars[category_a][item_a], self.vars[category_b][item_b])
 
+    def _decision_categories(self, categories: Optional[List[str]] = None) -> List[str]:
+        return [c for c in (categories or list(self.vars))
+                if any(not isinstance(v, BoolRef) for v in self.vars[c].values())]
+
+    def assignment(self, model=None, categories: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        """Values of the integer items as {category: {item: value}} for a model (the current one by default)."""
+        model = model if model is not None else self.model()
+        if model is None:
+            return {}
+        return {c: {item: model.eval(self.value_expr(c, item), model_completion=True).as_long() for item in self.vars[c]}
+                for c in self._decision_categories(categories)}
+
+    def _links_blocking_clause(self, assignment: Dict[str, Dict[str, int]]) -> BoolRef:
+        """Exclude every solution that puts the same items in the same rows (values may be permuted)."""
+        anchor, *others = list(assignment)
+        by_value = {value: item for item, value in assignment[anchor].items()}
+        literals = []
+        for category in others:
+            for item, value in assignment[category].items():
+                if value in by_value:
+                    literals.append(self.vars[category][item] != self.vars[anchor][by_value[value]])
+                else:
+                    literals.append(self._not_value(category, item, value))
+        return Or(literals)
+
+    def _not_value(self, category: str, item: str, value: int) -> BoolRef:
+        """Literal saying the item does not take the given value."""
+        var = self.vars[category][item]
+        return Not(var._is(value)) if isinstance(var, _OneHotVar) else var != value
+
+    def enumerate_models(self, limit: int = 2, distinct: str = "links",
+                         categories: Optional[List[str]] = None) -> List[Dict[str, Dict[str, int]]]:
+        """
+        Enumerate up to `limit` solutions under the current constraints and clues.
+
+        Each solution found is blocked on the decision variables only (the item variables of
+        the given categories) and the search stops as soon as `limit` solutions are known, so
+        limit=2 is a uniqueness check. The solver state is restored afterwards.
+
+        Args:
+            limit (int): Maximum number of solutions to return
+            distinct (str): "links" counts solutions that differ in which items share a row
+                            (what the answer grid shows); "values" counts different value assignments
+            categories (list): Categories whose items are decision variables (all integer categories by default)
+
+        Returns:
+            list: Solutions as {category: {item: value}}
+        """
+        if distinct not in ("links", "values"):
+            raise ValueError(f"distinct must be 'links' or 'values', got {distinct!r}")
+        categories = self._decision_categories(categories)
+        solutions = []
+        self.push()
+        try:
+            while len(solutions) < limit and self.check():
+                model = self.model()
+                solutions.append(self.assignment(model, categories))
+                if len(solutions) == limit:
+                    break
+                if distinct == "links" and len(categories) > 1:
+                    block = self._links_blocking_clause(solutions[-1])
+                else:
+                    block = self.blocking_clause(model, categories)
+                self.add_constraint_to_solver(block)
+        finally:
+            self.pop()
+        return solutions
+
+    def count_models(self, limit: int = 10, distinct: str = "links") -> int:
+        """Number of solutions, counted up to `limit`."""
+        return len(self.enumerate_models(limit, distinct))
+
+    def is_unique(self, distinct: str = "links") -> Optional[bool]:
+        """True if exactly one solution exists, False if several, None if the constraints are unsatisfiable."""
+        count = self.count_models(2, distinct)
+        return None if count == 0 else count == 1
+
+    def ambiguous_pairs(self, limit: int = 2) -> List[Tuple[str, str, str, str]]:
+        """
+        Item pairs whose row membership differs between solutions (empty when the solution is unique).
+
+        With a larger limit more alternative solutions are compared, revealing more of the
+        under-constrained cells at the cost of extra solver calls.
+        """
+        return differing_pairs(self.enumerate_models(limit, "links"))
+
     def check(self) -> bool:
-        """Check if current constraints are satisfiable."""
-        return self.solver.check() == sat
+        """Check if current constraints are satisfiable, reusing the last result while nothing changed."""
+        self._assert_onehot()
+        if self._last_result is None:
+            with span("solver.check", encoding=self.encoding, clues=len(self.clues)) as current:
+                self._last_result = self.solver.check(*self.clues.values())
+                current.set(result=str(self._last_result))
+        return self._last_result == sat
 
     def model(self):
         """Get the model after satisfiability check."""
-        return self.solver.model() if self.solver.check() == sat else None
+        if not self.check():
+            return None
+        if self._last_model is None:
+            self._last_model = self.solver.model()
+        return self._last_model
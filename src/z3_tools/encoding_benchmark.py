@@ -0,0 +1,104 @@
+"""
+Compare the arithmetic and one-hot encodings of ConstraintSolver on random grid puzzles.
+
+Every puzzle hides a random assignment and gets random clues that hold in it (equalities,
+exclusions, orderings, offsets and either/or pairs), written as function-call plans. Each
+encoding loads the same plan, finds a model, then checks again with that model blocked,
+which is the uniqueness proof that dominates solving time.
+
+Usage:
+    python -m src.z3_tools.encoding_benchmark --items 5 6 8 --categories 4 --puzzles 20
+"""
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from src.z3_tools.constraint_tools import ENCODINGS, ConstraintSolver
+from src.z3_tools.plan_compiler import load_plan
+from src.z3_tools.plan_executor import setup_categories
+
+
+def random_puzzle(n_items: int, n_categories: int, n_clues: int,
+                  rng: random.Random) -> Tuple[Dict[str, List[str]], List[Dict[str, Any]]]:
+    """Random categories plus a plan of n_clues clues consistent with a hidden assignment."""
+    categories = {f"c{c}": [f"c{c}_{i}" for i in range(n_items)] for c in range(n_categories)}
+    value = {}
+    for category, items in categories.items():
+        for item, v in zip(items, rng.sample(range(1, n_items + 1), n_items)):
+            value[category, item] = v
+
+    negated = {"add_eq": "add_ne", "add_ne": "add_eq", "add_lt": "add_ge", "add_gt": "add_le", "add_le": "add_gt"}
+
+    def atom(truth: bool = True) -> Dict[str, str]:
+        (ca, a), (cb, b) = rng.sample(list(value), 2)
+        diff = value[ca, a] - value[cb, b]
+        kind = rng.choice(["eq_ne", "order", "offset"])
+        if kind == "offset" and diff != 0:
+            offset = diff if truth else diff + rng.choice([-1, 1])
+            return {"function_name": "add_offset", "parameters": f"{ca}|{a}|{cb}|{b}|{offset}"}
+        if kind == "order" and diff != 0:
+            name = "add_lt" if diff < 0 else "add_gt"
+        elif kind == "order":
+            name = "add_le"
+        else:
+            name = "add_eq" if diff == 0 else "add_ne"
+        return {"function_name": name if truth else negated[name], "parameters": f"{ca}|{a}|{cb}|{b}"}
+
+    plan: List[Dict[str, Any]] = []
+    for _ in range(n_clues):
+        if rng.random() < 0.2:
+            # Either/or clue: one true and one false atom, in random order.
+            first, second = rng.sample([True, False], 2)
+            plan.append(atom(first))
+            plan.append(atom(second))
+            plan.append({"function_name": "add_or", "parameters": f"${len(plan) - 2}|${len(plan) - 1}"})
+        else:
+            plan.append(atom())
+    return categories, plan
+
+
+def time_encoding(categories: Dict[str, List[str]], plan: List[Dict[str, Any]], encoding: str) -> Dict[str, Any]:
+    """Load, solve and prove-or-refute uniqueness of one puzzle; returns timings and the solution count (1 or 2+)."""
+    start = time.perf_counter()
+    solver = ConstraintSolver(categories, encoding=encoding)
+    setup_categories(solver, categories)
+    load_plan(solver, plan)
+    loaded = time.perf_counter()
+    assert solver.check(), "random puzzles are satisfiable by construction"
+    model = solver.model()
+    solved = time.perf_counter()
+    solver.add_constraint_to_solver(solver.blocking_clause(model))
+    unique = not solver.check()
+    done = time.perf_counter()
+    return {"load_s": loaded - start, "solve_s": solved - loaded, "unique_s": done - solved, "unique": unique}
+
+
+def compare(items: List[int], n_categories: int, n_puzzles: int, clue_factor: float = 1.5, seed: int = 0):
+    rng = random.Random(seed)
+    for n in items:
+        totals = {encoding: {"load_s": 0.0, "solve_s": 0.0, "unique_s": 0.0} for encoding in ENCODINGS}
+        unique = 0
+        for _ in range(n_puzzles):
+            categories, plan = random_puzzle(n, n_categories, int(clue_factor * n * n_categories), rng)
+            results = {encoding: time_encoding(categories, plan, encoding) for encoding in ENCODINGS}
+            if len({r["unique"] for r in results.values()}) != 1:
+                raise AssertionError("encodings disagree on uniqueness")
+            unique += results[ENCODINGS[0]]["unique"]
+            for encoding, r in results.items():
+                for key in totals[encoding]:
+                    totals[encoding][key] += r[key]
+        print(f"{n} items x {n_categories} categories, {n_puzzles} puzzles ({unique} unique)")
+        for encoding, t in totals.items():
+            print(f"  {encoding:7s} load {t['load_s']:.3f}s  solve {t['solve_s']:.3f}s  uniqueness {t['unique_s']:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[4, 5, 6, 8])
+    parser.add_argument("--categories", type=int, default=4)
+    parser.add_argument("--puzzles", type=int, default=20)
+    parser.add_argument("--clue-factor", type=float, default=1.5, help="clues per item and category")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    compare(args.items, args.categories, args.puzzles, args.clue_factor, args.seed)
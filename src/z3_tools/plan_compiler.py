@@ -0,0 +1,278 @@
+"""
+One-pass compiler from an LLM function-call plan to Z3 constraints.
+
+execute_plan() dispatches every call through getattr on the solver. For large plans the
+compiler below is the faster path: parameters are split once, every category/item name is
+resolved against ConstraintSolver.vars up front, all errors are collected with the index of
+the plan entry that caused them, and the resulting expressions are added to the Z3 solver
+with a single add() of the whole vector. PlanStream applies the entries one by one instead,
+as a streamed response delivers them.
+"""
+import operator
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from z3 import And, BoolRef, Implies, Not, Or, Xor
+
+from src.puzzle_store import label_key
+from src.z3_tools.constraint_tools import ConstraintSolver, offset_eq
+from src.z3_tools.plan_executor import _split_parameters
+
+_COMPARISONS = {
+    "add_eq": operator.eq,
+    "add_ne": operator.ne,
+    "add_lt": operator.lt,
+    "add_le": operator.le,
+    "add_gt": operator.gt,
+    "add_ge": operator.ge,
+}
+
+_CONNECTIVES = {
+    "add_and": And,
+    "add_or": Or,
+    "add_xor": Xor,
+    "add_nand": lambda a, b: Not(And(a, b)),
+    "add_nor": lambda a, b: Not(Or(a, b)),
+}
+
+_IGNORED = {"check", "model"}
+
+
+class PlanCompileError(ValueError):
+    """
+    Raised when a plan refers to unknown functions, categories, items or steps.
+
+    Attributes:
+        errors: List of (plan index, message) pairs, one per bad entry.
+    """
+
+    def __init__(self, errors: List[Tuple[int, str]]) -> None:
+        self.errors = errors
+        super().__init__("; ".join(f"step {index}: {message}" for index, message in errors))
+
+
+class _Names:
+    """Category and item lookups built once per solver, tolerant of case and trailing dots."""
+
+    def __init__(self, solver: ConstraintSolver) -> None:
+        self.vars = solver.vars
+        self.categories = {label_key(c): c for c in solver.categories}
+        self.items = {category: {label_key(item): var for item, var in items.items()}
+                      for category, items in solver.vars.items()}
+
+    def category(self, name: str) -> str:
+        if name in self.vars:
+            return name
+        found = self.categories.get(label_key(name))
+        if found is None or found not in self.vars:
+            raise KeyError(f"unknown category {name!r}")
+        return found
+
+    def var(self, category: str, item: str):
+        category = self.category(category)
+        var = self.vars[category].get(item)
+        if var is None:
+            var = self.items[category].get(label_key(item))
+        if var is None:
+            raise KeyError(f"unknown item {item!r} in category {category!r}")
+        return var
+
+    def operand(self, category: str, item: Any):
+        """Variable for an item name, or an int literal when the name is not an item of the category."""
+        if not isinstance(item, str):
+            return int(item)
+        try:
+            return self.var(category, item)
+        except KeyError:
+            try:
+                return int(item)
+            except ValueError:
+                raise KeyError(f"unknown item {item!r} in category {category!r}") from None
+
+
+def _arity(params: List[Any], expected: int) -> None:
+    if len(params) != expected:
+        raise ValueError(f"takes {expected} parameters, got {len(params)}")
+
+
+class _Compiler:
+    """Compiles plan entries one at a time, in order; shared by compile_plan and PlanStream."""
+
+    def __init__(self, solver: ConstraintSolver) -> None:
+        self.solver = solver
+        self.names = _Names(solver)
+        self.results: List[Optional[Union[BoolRef, List[BoolRef]]]] = []
+        self.consumed = set()
+        self.errors: List[Tuple[int, str]] = []
+        self.labels = {item for items in solver.categories.values() for item in items}
+
+    def compile(self, call: Dict[str, Any]) -> Tuple[Optional[Union[BoolRef, List[BoolRef]]], List[int]]:
+        """
+        Compile the next entry and append its result.
+
+        Returns:
+            tuple: (expression, list of setup constraints or None; indices of the entries it consumed)
+        """
+        solver, names = self.solver, self.names
+        index, results = len(self.results), self.results
+        name = call.get("function_name")
+        params = _split_parameters(call.get("parameters"))
+        result, refs_used = None, []
+        try:
+            if name in _COMPARISONS:
+                _arity(params, 4)
+                result = _COMPARISONS[name](names.var(params[0], params[1]), names.operand(params[2], params[3]))
+            elif name in _CONNECTIVES:
+                _arity(params, 2)
+                refs = []
+                for param in params:
+                    if not (isinstance(param, str) and param.startswith("$") and param[1:].isdigit()
+                            and param not in self.labels):
+                        raise ValueError(f"expects '$k' references, got {param!r}")
+                    k = int(param[1:])
+                    if k >= index or results[k] is None or isinstance(results[k], list):
+                        raise ValueError(f"{param} does not refer to an earlier constraint")
+                    refs_used.append(k)
+                    refs.append(results[k])
+                result = _CONNECTIVES[name](*refs)
+            elif name == "add_offset":
+                _arity(params, 5)
+                result = offset_eq(names.var(params[0], params[1]), names.var(params[2], params[3]), int(params[4]))
+            elif name == "add_implies":
+                _arity(params, 4)
+                result = Implies(names.var(params[0], params[1]), names.var(params[2], params[3]))
+            elif name == "create_category_vars":
+                category = params[0] if params else None
+                if category not in solver.categories:
+                    raise KeyError(f"unknown category {category!r}")
+                solver.create_category_vars(*params)
+                self.names = _Names(solver)
+            elif name == "set_category_domain":
+                category = names.category(params[0])
+                lower = int(params[1]) if len(params) > 1 and params[1] != "" else None
+                upper = int(params[2]) if len(params) > 2 and params[2] != "" else None
+                result = solver.domain_constraints(category, lower, upper)
+                self.names = _Names(solver)
+            elif name == "add_distinct":
+                category = names.category(params[0])
+                result = solver.distinct_constraints(category)
+            elif name not in _IGNORED:
+                raise ValueError(f"unknown function {name!r}")
+        except (KeyError, ValueError, IndexError, TypeError) as e:
+            message = e.args[0] if isinstance(e, KeyError) and e.args else str(e)
+            self.errors.append((index, f"{name}: {message}"))
+            result, refs_used = None, []
+        self.consumed.update(refs_used)
+        results.append(result)
+        return result, refs_used
+
+    def constraints(self) -> List[BoolRef]:
+        """Expressions of all entries no later entry consumed, setup constraints flattened in."""
+        constraints: List[BoolRef] = []
+        for index, result in enumerate(self.results):
+            if result is None or index in self.consumed:
+                continue
+            if isinstance(result, list):
+                constraints.extend(result)
+            else:
+                constraints.append(result)
+        return constraints
+
+
+def compile_plan(solver: ConstraintSolver, plan: List[Dict[str, Any]],
+                 strict: bool = True) -> Dict[str, Any]:
+    """
+    Compile a plan into Z3 expressions without adding anything to the solver.
+
+    Setup calls (create_category_vars, set_category_domain, add_distinct) are applied to the
+    solver's variables immediately so later entries can refer to them; their constraints
+    are compiled like any other. "$k" parameters refer to the expression of entry k, and
+    expressions that no later entry consumes are the ones to assert.
+
+    Args:
+        solver (ConstraintSolver): Solver whose vars the names are resolved against
+        plan (list): Function-call dicts ({"function_name": ..., "parameters": "a|b|c" or list})
+        strict (bool): Raise PlanCompileError on any bad entry; otherwise skip bad entries
+
+    Returns:
+        dict: "constraints" (expressions to assert), "results" (expression or None per entry)
+              and "errors" ((plan index, message) pairs for skipped entries)
+
+    Raises:
+        PlanCompileError: in strict mode, listing every bad entry
+    """
+    compiler = _Compiler(solver)
+    for call in plan:
+        compiler.compile(call)
+
+    if compiler.errors and strict:
+        raise PlanCompileError(compiler.errors)
+
+    return {"constraints": compiler.constraints(), "results": compiler.results, "errors": compiler.errors}
+
+
+class PlanStream:
+    """
+    Compiles and asserts a plan one entry at a time, as the calls arrive from a streamed response.
+
+    Setup constraints are added to the solver directly. Every other expression is added as
+    the clue "step_<k>" (see ConstraintSolver.add_clue), so it takes part in checks right
+    away; when a later connective consumes "$k", clue step_<k> is removed again and only the
+    combined expression stays. After the last entry the active clues are exactly the
+    constraints load_plan() would assert for the whole plan.
+
+    Attributes:
+        errors: (plan index, message) pairs of the entries that could not be compiled.
+    """
+
+    def __init__(self, solver: ConstraintSolver, strict: bool = False, prefix: str = "step_") -> None:
+        self.solver = solver
+        self.strict = strict
+        self.prefix = prefix
+        self._compiler = _Compiler(solver)
+
+    @property
+    def errors(self) -> List[Tuple[int, str]]:
+        return self._compiler.errors
+
+    @property
+    def results(self) -> List[Optional[Union[BoolRef, List[BoolRef]]]]:
+        return self._compiler.results
+
+    def add(self, call: Dict[str, Any]) -> Optional[Union[BoolRef, List[BoolRef]]]:
+        """
+        Compile one plan entry and apply it to the solver.
+
+        Returns:
+            The entry's expression (a list for setup calls), None if it produced none
+
+        Raises:
+            PlanCompileError: in strict mode, if the entry is bad
+        """
+        index = len(self._compiler.results)
+        result, consumed = self._compiler.compile(call)
+        if self.strict and self._compiler.errors and self._compiler.errors[-1][0] == index:
+            raise PlanCompileError([self._compiler.errors[-1]])
+        for k in consumed:
+            if f"{self.prefix}{k}" in self.solver.clues:
+                self.solver.remove_clue(f"{self.prefix}{k}")
+        if isinstance(result, list):
+            self.solver.add_constraint_to_solver(result)
+        elif result is not None:
+            self.solver.add_clue(f"{self.prefix}{index}", result)
+        return result
+
+    def extend(self, calls: List[Dict[str, Any]]) -> None:
+        for call in calls:
+            self.add(call)
+
+
+def load_plan(solver: ConstraintSolver, plan: List[Dict[str, Any]], strict: bool = True) -> Dict[str, Any]:
+    """
+    Compile a plan and assert all of its constraints with one solver.add of the whole vector.
+
+    Returns:
+        dict: compile_plan() output
+    """
+    compiled = compile_plan(solver, plan, strict=strict)
+    solver.add_constraint_to_solver(compiled["constraints"])
+    return compiled
@@ -0,0 +1,158 @@
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from src.z3_tools.constraint_tools import ConstraintSolver
+
+
+def setup_categories(solver, categories: Dict[str, List[str]]) -> None:
+    """
+    Declare the standard grid-puzzle variables: one Int per item with domain 1..n and an
+    all-different constraint per category.
+
+    Inputs:
+        solver: ConstraintSolver (or BitsetSolver) instance
+        categories: dict mapping category name to list of item names
+    """
+    for category, items in categories.items():
+        solver.create_category_vars(category)
+        solver.set_category_domain(category, lower=1, upper=len(items))
+        solver.add_distinct(category)
+
+    return
+
+
+def _split_parameters(parameters: Union[str, List[Any], None]) -> List[Any]:
+    if parameters is None:
+        return []
+    if isinstance(parameters, str):
+        return parameters.split("|") if parameters else []
+    return list(parameters)
+
+
+def execute_plan(solver, plan: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Run an LLM function-call plan against a solver one call at a time.
+
+    Every entry looks like {"function_name": "add_eq", "parameters": "wines|Ece Suss|types|merlot"};
+    parameters may also be a list. A parameter "$k" stands for the result of plan entry k, which is
+    how add_or/add_and combine earlier constraints (item labels such as "$45" are never read as references). Constraints that no later entry consumes are the
+    puzzle's clues and are added to the solver (as named clues "step_k" when the solver supports them).
+
+    Inputs:
+        solver: ConstraintSolver (or BitsetSolver) with category variables already declared
+        plan: List of function-call dicts
+
+    Returns:
+        list: The result of every plan entry
+    """
+    results: List[Any] = []
+    consumed = set()
+    labels = {item for items in solver.categories.values() for item in items}
+    for call in plan:
+        params = []
+        for param in _split_parameters(call.get("parameters")):
+            if isinstance(param, str) and param.startswith("$") and param[1:].isdigit() and param not in labels:
+                consumed.add(int(param[1:]))
+                param = results[int(param[1:])]
+            params.append(param)
+        method = getattr(solver, call["function_name"])
+        results.append(method(*params))
+
+    for index, result in enumerate(results):
+        if index in consumed or result is None or plan[index]["function_name"] in ("check", "model"):
+            continue
+        if hasattr(solver, "add_clue"):
+            solver.add_clue(f"step_{index}", result)
+        else:
+            solver.add_constraint_to_solver(result)
+
+    return results
+
+
+def solution_grid(solver) -> List[List[str]]:
+    """
+    Decode the solver's model into answer-table rows: row r lists, per category, the item placed at value r + 1.
+
+    Returns an empty list when the constraints are unsatisfiable.
+    """
+    model = solver.model()
+    if model is None:
+        return []
+
+    values: Dict[str, Dict[str, int]] = {}
+    for category, items in solver.vars.items():
+        if isinstance(model, dict):
+            values[category] = model[category]
+        else:
+            values[category] = {item: model.eval(solver.value_expr(category, item), model_completion=True).as_long()
+                                for item in items}
+
+    size = max(len(items) for items in solver.categories.values())
+    grid = []
+    for row in range(1, size + 1):
+        grid.append([next((item for item, value in values[category].items() if value == row), "")
+                     for category in solver.categories if category in values])
+    return grid
+
+
+def run_plan(solver, plan: List[Dict[str, Any]]) -> None:
+    """Assert a plan on a solver: compiled in one pass for ConstraintSolver, call by call otherwise."""
+    if isinstance(solver, ConstraintSolver):
+        from src.z3_tools.plan_compiler import load_plan
+        load_plan(solver, plan)
+    else:
+        execute_plan(solver, plan)
+
+
+def ambiguity_feedback(pairs: List[Tuple[str, str, str, str]]) -> str:
+    """
+    Describe under-constrained cells (from ConstraintSolver.ambiguous_pairs) for a refinement prompt,
+    so the model only has to revisit the clues that touch them.
+    """
+    if not pairs:
+        return "The constraints determine a unique solution."
+    lines = [f"- whether {item_a} ({cat_a}) goes with {item_b} ({cat_b})" for cat_a, item_a, cat_b, item_b in pairs]
+    return "The constraints allow more than one solution. They do not decide:\n" + "\n".join(lines)
+
+
+def solve_plan(categories: Dict[str, List[str]], plan: List[Dict[str, Any]], solver_cls=ConstraintSolver) -> List[List[str]]:
+    """Build a solver for the puzzle, run the plan and return the decoded answer grid."""
+    solver = solver_cls(categories)
+    setup_categories(solver, categories)
+    run_plan(solver, plan)
+    return solution_grid(solver)
+
+
+def grid_verifier(categories: Dict[str, List[str]], plan: List[Dict[str, Any]]) -> Callable[[Any], bool]:
+    """
+    Build a check of candidate answer grids against a plan's constraints.
+
+    The solver is set up once. A grid (scoring.parse_grid array: item index per category,
+    rows anchored on the first category) passes when it fills every cell, satisfies all
+    constraints and the constraints allow no other solution, i.e. it is the solution. When
+    the plan leaves the puzzle ambiguous (or is unsatisfiable) no grid passes.
+
+    Returns:
+        callable: grid -> bool
+    """
+    solver = ConstraintSolver(categories)
+    setup_categories(solver, categories)
+    run_plan(solver, plan)
+    decisive = solver.is_unique() is True
+    titles = list(categories)
+
+    def verify(grid) -> bool:
+        if not decisive or len(grid) != len(categories[titles[0]]) or any(index < 0 for row in grid for index in row):
+            return False
+        links = []
+        for row in grid:
+            anchor = solver.vars[titles[0]][categories[titles[0]][row[0]]]
+            links += [anchor == solver.vars[title][categories[title][row[c]]]
+                      for c, title in enumerate(titles) if c > 0]
+        solver.push()
+        try:
+            solver.add_constraint_to_solver(links)
+            return solver.check()
+        finally:
+            solver.pop()
+
+    return verify
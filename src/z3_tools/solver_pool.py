@@ -0,0 +1,254 @@
+"""
+Process-pool solving service for batches of puzzles.
+
+Every task is a puzzle's category map plus its function-call plan (see plan_executor),
+both plain picklable data. Each worker process owns one pipe, so a worker that blows
+through its wall-clock limit can be terminated and replaced without disturbing the
+others, and results are yielded as soon as any worker finishes.
+
+Usage:
+    with SolverPool(processes=8, timeout=20) as pool:
+        for result in pool.solve(tasks):
+            print(result["task_id"], result["status"], result["grid"])
+"""
+import multiprocessing as mp
+import os
+import time
+from multiprocessing.connection import wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+SOLVERS = ("z3", "z3-onehot", "bitset")
+
+
+def _make_solver(solver_name: str, categories: Dict[str, List[str]], timeout: Optional[float]):
+    if solver_name == "bitset":
+        from src.z3_tools.bitset_solver import BitsetSolver
+        return BitsetSolver(categories)
+
+    from src.z3_tools.constraint_tools import ConstraintSolver
+    solver = ConstraintSolver(categories, encoding="onehot" if solver_name == "z3-onehot" else "int")
+    if timeout:
+        # Soft limit inside Z3; the pool's hard limit still applies if Z3 ignores it.
+        solver.solver.set("timeout", int(timeout * 1000))
+    return solver
+
+
+def solve_task(categories: Dict[str, List[str]], plan: List[Dict[str, Any]], solver_name: str = "z3",
+               timeout: Optional[float] = None, check_unique: bool = False) -> Dict[str, Any]:
+    """
+    Build and solve one puzzle in the current process.
+
+    Returns:
+        dict: status ("sat", "unsat", "unknown" or "error"), grid (answer rows, empty unless sat),
+              error message and solve time in seconds; with check_unique on a Z3 solver also
+              "unique" and the "ambiguous_pairs" that differ between two solutions
+    """
+    from src.z3_tools.plan_executor import run_plan, setup_categories, solution_grid
+
+    start = time.perf_counter()
+    try:
+        solver = _make_solver(solver_name, categories, timeout)
+        setup_categories(solver, categories)
+        run_plan(solver, plan)
+        extra = {}
+        if solver.check():
+            status, grid = "sat", solution_grid(solver)
+            if check_unique and hasattr(solver, "ambiguous_pairs"):
+                pairs = solver.ambiguous_pairs()
+                extra = {"unique": not pairs, "ambiguous_pairs": pairs}
+        else:
+            last = getattr(solver, "_last_result", None)
+            status, grid = ("unknown" if last is not None and str(last) == "unknown" else "unsat"), []
+        error = None
+    except Exception as e:
+        status, grid, error, extra = "error", [], f"{type(e).__name__}: {e}", {}
+
+    return {"status": status, "grid": grid, "error": error, "solve_s": time.perf_counter() - start, **extra}
+
+
+def _worker_main(conn, solver_name: str, timeout: Optional[float], check_unique: bool) -> None:
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        task_id, categories, plan = task
+        result = solve_task(categories, plan, solver_name, timeout, check_unique)
+        result["task_id"] = task_id
+        result["worker_pid"] = os.getpid()
+        conn.send(result)
+    conn.close()
+
+
+def _normalize_task(task: Any, index: int) -> Tuple[Any, Dict[str, List[str]], List[Dict[str, Any]]]:
+    if isinstance(task, dict):
+        return task.get("task_id", task.get("id", index)), task["categories"], task["plan"]
+    if len(task) == 2:
+        return index, task[0], task[1]
+    return tuple(task)
+
+
+class _Worker:
+    def __init__(self, ctx, solver_name: str, timeout: Optional[float], check_unique: bool) -> None:
+        self.conn, child_conn = ctx.Pipe(duplex=True)
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, solver_name, timeout, check_unique),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task_id = None
+        self.started = 0.0
+
+    def submit(self, task: Tuple[Any, Dict[str, List[str]], List[Dict[str, Any]]]) -> None:
+        self.task_id = task[0]
+        self.started = time.monotonic()
+        self.conn.send(task)
+
+    def kill(self) -> None:
+        self.process.terminate()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class SolverPool:
+    """
+    Pool of solver worker processes with a hard per-puzzle wall-clock limit.
+
+    Attributes:
+        processes: Number of worker processes (defaults to the CPU count).
+        timeout: Seconds a single puzzle may take before its worker is killed and replaced.
+        solver: "z3" (ConstraintSolver), "z3-onehot" (ConstraintSolver, one-hot encoding) or "bitset" (BitsetSolver).
+        check_unique: Also report whether each solution is unique and which cells are ambiguous.
+        restarts: Number of workers replaced after a timeout or crash.
+    """
+
+    def __init__(self, processes: Optional[int] = None, timeout: Optional[float] = 30.0, solver: str = "z3",
+                 start_method: Optional[str] = None, check_unique: bool = False) -> None:
+        if solver not in SOLVERS:
+            raise ValueError(f"Unknown solver {solver!r}, expected one of {SOLVERS}")
+        self.processes = processes or os.cpu_count() or 1
+        self.timeout = timeout
+        self.solver = solver
+        self.check_unique = check_unique
+        self.restarts = 0
+        self._ctx = mp.get_context(start_method)
+        self._workers: List[_Worker] = []
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.solver, self.timeout, self.check_unique)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        self.restarts += 1
+        fresh = self._spawn()
+        self._workers[self._workers.index(worker)] = fresh
+        return fresh
+
+    def solve(self, tasks: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Solve puzzles in parallel and yield results in completion order.
+
+        Args:
+            tasks: Iterable of {"task_id", "categories", "plan"} dicts, (categories, plan) pairs
+                   or (task_id, categories, plan) triples; consumed lazily.
+
+        Yields:
+            dict: solve_task() result plus task_id, worker_pid and wall_s (time since dispatch);
+                  status is "timeout" when the worker was killed
+        """
+        if not self._workers:
+            self._workers = [self._spawn() for _ in range(self.processes)]
+
+        pending = (_normalize_task(task, i) for i, task in enumerate(tasks))
+        idle = list(self._workers)
+        busy: Dict[Any, _Worker] = {}
+        exhausted = False
+
+        try:
+            while True:
+                while idle and not exhausted:
+                    task = next(pending, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    worker = idle.pop()
+                    worker.submit(task)
+                    busy[worker.conn] = worker
+                if not busy:
+                    return
+
+                wait_for = None
+                if self.timeout is not None:
+                    deadline = min(w.started + self.timeout for w in busy.values())
+                    wait_for = max(0.0, deadline - time.monotonic())
+                ready = wait(list(busy), timeout=wait_for)
+
+                for conn in ready:
+                    worker = busy.pop(conn)
+                    elapsed = time.monotonic() - worker.started
+                    try:
+                        result = conn.recv()
+                        idle.append(worker)
+                    except (EOFError, OSError):
+                        result = {"task_id": worker.task_id, "status": "error", "grid": [], "solve_s": None,
+                                  "error": f"worker exited with code {worker.process.exitcode}",
+                                  "worker_pid": worker.process.pid}
+                        idle.append(self._replace(worker))
+                    result["wall_s"] = elapsed
+                    yield result
+
+                if self.timeout is not None:
+                    now = time.monotonic()
+                    for conn, worker in list(busy.items()):
+                        if now - worker.started < self.timeout:
+                            continue
+                        del busy[conn]
+                        result = {"task_id": worker.task_id, "status": "timeout", "grid": [], "solve_s": None,
+                                  "error": f"exceeded {self.timeout}s", "worker_pid": worker.process.pid,
+                                  "wall_s": now - worker.started}
+                        idle.append(self._replace(worker))
+                        yield result
+        finally:
+            # Abandoned mid-batch: in-flight answers would otherwise surface in the next solve() call.
+            for worker in list(busy.values()):
+                self._replace(worker)
+
+    def close(self) -> None:
+        """Stop all workers."""
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+
+    def terminate(self) -> None:
+        """Kill all workers immediately."""
+        for worker in self._workers:
+            worker.kill()
+        self._workers = []
+
+    def __enter__(self) -> "SolverPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def solve_many(tasks: Iterable[Any], processes: Optional[int] = None, timeout: Optional[float] = 30.0,
+               solver: str = "z3", check_unique: bool = False) -> List[Dict[str, Any]]:
+    """Solve a batch with a temporary pool and return the results in completion order."""
+    with SolverPool(processes=processes, timeout=timeout, solver=solver, check_unique=check_unique) as pool:
+        return list(pool.solve(tasks))
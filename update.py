@@ -1,15 +1,22 @@
 import numpy as np
 
-def update_probabilities(matrix, updates, max_iterations=100, tolerance=1e-6):
+from src.llm_engine.prompt_builder import build_prob_agent_1_job, build_prob_agent_2_system_prompt, category_labels
+from src.llm_engine.sinkhorn import normalize_with_fixed_cells
+from src.llm_engine.tools import update_matrix
+
+
+def update_probabilities(matrix, updates, max_iterations=100, tolerance=1e-6, dtype=None, out=None):
     """
     Updates a probability matrix with user-specified values and normalizes the rest
     so that each row and column sums to 1, keeping fixed cells unchanged.
     
     Args:
-        matrix (np.ndarray): Initial 4x4 matrix with probabilities.
+        matrix (np.ndarray): Initial matrix with probabilities. It is not modified unless passed as out.
         updates (list): List of tuples (row_idx, col_idx, new_value) for fixed cells.
         max_iterations (int): Maximum number of iterations for convergence.
         tolerance (float): Convergence threshold for matrix changes.
+        dtype (np.dtype): Optional working precision, e.g. np.float32.
+        out (np.ndarray): Optional output array; pass matrix to update it in place.
     
     Returns:
         np.ndarray: Updated matrix with row and column sums equal to 1.
@@ -17,106 +24,27 @@ def update_probabilities(matrix, updates, max_iterations=100, tolerance=1e-6):
     Raises:
         ValueError: If fixed cell sums make normalization impossible.
     """
-    n = matrix.shape[0]  # Assuming square matrix (n x n)
-    
-    # Step 1: Apply User Updates and Mark Fixed Cells
-    fixed_cells = set()
-    for row_idx, col_idx, new_value in updates:
-        matrix[row_idx, col_idx] = new_value
-        fixed_cells.add((row_idx, col_idx))
-    
-    # Compute sums of fixed cells for each row and column
-    fixed_row_sums = np.zeros(n)
-    fixed_col_sums = np.zeros(n)
-    for i in range(n):
-        for j in range(n):
-            if (i, j) in fixed_cells:
-                fixed_row_sums[i] += matrix[i, j]
-                fixed_col_sums[j] += matrix[i, j]
-    
-    # Check if the problem is solvable
-    if any(fixed_row_sums > 1) or any(fixed_col_sums > 1):
-        raise ValueError("Sum of fixed cells in a row or column exceeds 1; normalization is impossible.")
-    
-    # Working copy of the matrix
-    matrix_copy = matrix.copy()
-    
-    # Precompute non-fixed indices for efficiency
-    non_fixed_cols_in_row = {i: [j for j in range(n) if (i, j) not in fixed_cells] for i in range(n)}
-    non_fixed_rows_in_col = {j: [i for i in range(n) if (i, j) not in fixed_cells] for j in range(n)}
-    
-    # Iterative scaling
-    for _ in range(max_iterations):
-        prev_matrix = matrix_copy.copy()
-        
-        # Adjust Rows
-        for i in range(n):
-            if fixed_row_sums[i] == 1:
-                # If fixed cells sum to 1, non-fixed cells must be 0
-                for j in non_fixed_cols_in_row[i]:
-                    matrix_copy[i, j] = 0
-            else:
-                # Scale non-fixed cells to make row sum 1
-                remaining_sum = sum(matrix_copy[i, j] for j in non_fixed_cols_in_row[i])
-                if remaining_sum > 0:
-                    scale_factor = (1 - fixed_row_sums[i]) / remaining_sum
-                    for j in non_fixed_cols_in_row[i]:
-                        matrix_copy[i, j] *= scale_factor
-        
-        # Adjust Columns
-        for j in range(n):
-            if fixed_col_sums[j] == 1:
-                # If fixed cells sum to 1, non-fixed cells must be 0
-                for i in non_fixed_rows_in_col[j]:
-                    matrix_copy[i, j] = 0
-            else:
-                # Scale non-fixed cells to make column sum 1
-                remaining_sum = sum(matrix_copy[i, j] for i in non_fixed_rows_in_col[j])
-                if remaining_sum > 0:
-                    scale_factor = (1 - fixed_col_sums[j]) / remaining_sum
-                    for i in non_fixed_rows_in_col[j]:
-                        matrix_copy[i, j] *= scale_factor
-        
-        # Check convergence
-        if np.max(np.abs(matrix_copy - prev_matrix)) < tolerance:
-            break
-    
+    if out is None:
+        out = np.array(matrix, dtype=dtype or np.float64)
+    elif out is not matrix:
+        np.copyto(out, matrix, casting="same_kind")
+
+    # Apply user updates and mark fixed cells
+    fixed_mask = np.zeros(out.shape, dtype=bool)
+    if updates:
+        rows, cols, values = (np.asarray(v) for v in zip(*updates))
+        out[rows, cols] = values
+        fixed_mask[rows, cols] = True
+
+    normalize_with_fixed_cells(out, fixed_mask, max_iterations=max_iterations, tolerance=tolerance, out=out)
+
     # Verify row and column sums
-    row_sums = matrix_copy.sum(axis=1)
-    col_sums = matrix_copy.sum(axis=0)
+    row_sums = out.sum(axis=1)
+    col_sums = out.sum(axis=0)
     if not (np.allclose(row_sums, 1.0, atol=tolerance) and np.allclose(col_sums, 1.0, atol=tolerance)):
         print("Warning: Matrix did not converge perfectly. Row sums:", row_sums, "Column sums:", col_sums)
     
-    return matrix_copy
-
-# Example Usage
-matrix = np.full((4, 4), 0.25)  # Initialize 4x4 matrix with 0.25 probabilities
-print("Initial Matrix:")
-print(matrix)
-
-# Test Case 1: Updates (0,2) = 0.5, (0,3) = 0.5
-updates = [(0, 2, 0.5), (0, 3, 0.5)]
-updated_matrix = update_probabilities(matrix, updates)
-print("\nUpdated Matrix (Test Case 1):")
-print(updated_matrix)
-print("Row Sums:", updated_matrix.sum(axis=1))
-print("Column Sums:", updated_matrix.sum(axis=0))
-
-# Test Case 2: Updates (0,2) = 0.5, (0,3) = 0.5, (2,3) = 0.5
-updates = [(0, 2, 0.5), (0, 3, 0.5), (2, 3, 0.5)]
-updated_matrix = update_probabilities(matrix, updates)
-print("\nUpdated Matrix (Test Case 2):")
-print(updated_matrix)
-print("Row Sums:", updated_matrix.sum(axis=1))
-print("Column Sums:", updated_matrix.sum(axis=0))
-
-# Test Case 3: Updates (0,2) = 0.5, (0,3) = 0.5, (2,3) = 0.5
-updates = [(0, 2, 0.5), (0, 3, 0.5), (2, 3, 0.5), (2, 1, 0.5)]
-updated_matrix = update_probabilities(matrix, updates)
-print("\nUpdated Matrix (Test Case 3):")
-print(updated_matrix)
-print("Row Sums:", updated_matrix.sum(axis=1))
-print("Column Sums:", updated_matrix.sum(axis=0))
+    return out
 
 
 llm_agent_system_prompt = """You are a logic grid puzzle solving assistant that produces clear deductive steps. When solving puzzles:
@@ -156,7 +84,7 @@ prob_agent_1_system_prompt = """Analyze each logical deduction step and convert
 
 """
 
-prob_agent_1_job = f"""You are given a set of logical deductions to solve a problem and a bunch of probability matries that you can use to modify
+prob_agent_1_job = """You are given a set of logical deductions to solve a problem and a bunch of probability matries that you can use to modify
                         and give weightage to the cateogires based on the logical deduction.
                         Here are the items you have access to:
                         'Logical Step-By-Step Deductions': {llm_agent_response},
@@ -165,10 +93,10 @@ prob_agent_1_job = f"""You are given a set of logical deductions to solve a prob
                         """
 
 
-prob_agent_2_system_prompt = f"""You are an expert in probability theory and are given a sequence a probability updates
+prob_agent_2_system_prompt = """You are an expert in probability theory and are given a sequence a probability updates
                         You are also given a tool to update these matrices and you need to call it sequentially
                         The tools you have access to are:
-                        {"".join(tool_descriptions)}
+                        {tool_descriptions}
                         \n
                          """
 
@@ -177,3 +105,60 @@ prob_agent_2_job = """Analyze the updates and return the series of function call
             Remember to return a valid JSON of only the function calls of the tool required to make the changes.
 """
 
+
+def build_prob_agent_1_query(llm_agent_response, matrices, categories, cat_topics, max_tokens=None):
+    """
+    prob_agent_1 job for the current matrices, in place of formatting prob_agent_1_job with their raw repr.
+
+    The matrices are written compactly and deductions they already reflect are left out
+    (see prompt_builder.build_prob_agent_1_job).
+
+    Args:
+        llm_agent_response (str): Step-by-step deductions of the llm agent.
+        matrices (dict): Matrices from utils.initialize_probability_tables, possibly already updated.
+        categories (list): Comma-separated items per category, as passed to initialize_probability_tables.
+        cat_topics (list): Category names, as passed to initialize_probability_tables.
+        max_tokens (int): Optional budget for the whole prompt.
+
+    Returns:
+        tuple: (prompt text, token report per section)
+    """
+    labels = category_labels(categories, cat_topics)
+    return build_prob_agent_1_job(llm_agent_response, matrices, labels, max_tokens=max_tokens)
+
+
+def build_prob_agent_2_prompt(tools=None, max_tokens=None):
+    """
+    prob_agent_2_system_prompt with compact tool descriptions filled in.
+
+    Args:
+        tools (dict): Tool name -> function; defaults to update_matrix.
+        max_tokens (int): Optional budget for the whole prompt.
+
+    Returns:
+        tuple: (prompt text, token report per section)
+    """
+    tools = tools if tools is not None else {"update_matrix": update_matrix}
+    return build_prob_agent_2_system_prompt(prob_agent_2_system_prompt, tools, max_tokens=max_tokens)
+
+
+if __name__ == "__main__":
+    # Example Usage
+    matrix = np.full((4, 4), 0.25)  # Initialize 4x4 matrix with 0.25 probabilities
+    print("Initial Matrix:")
+    print(matrix)
+
+    test_cases = [
+        # Test Case 1: Updates (0,2) = 0.5, (0,3) = 0.5
+        [(0, 2, 0.5), (0, 3, 0.5)],
+        # Test Case 2: Updates (0,2) = 0.5, (0,3) = 0.5, (2,3) = 0.5
+        [(0, 2, 0.5), (0, 3, 0.5), (2, 3, 0.5)],
+        # Test Case 3: Updates (0,2) = 0.5, (0,3) = 0.5, (2,3) = 0.5, (2,1) = 0.5
+        [(0, 2, 0.5), (0, 3, 0.5), (2, 3, 0.5), (2, 1, 0.5)],
+    ]
+    for case, updates in enumerate(test_cases, start=1):
+        updated_matrix = update_probabilities(matrix, updates)
+        print(f"\nUpdated Matrix (Test Case {case}):")
+        print(updated_matrix)
+        print("Row Sums:", updated_matrix.sum(axis=1))
+        print("Column Sums:", updated_matrix.sum(axis=0))